@@ -0,0 +1,2 @@
+"""Performance benchmarks. Run each one from the repository root with
+`python -m benchmarks.<name> --help`."""
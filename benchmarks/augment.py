@@ -0,0 +1,111 @@
+"""Cost of batched augmentation: pipeline throughput and member train step time, with vs. without.
+
+    python -m benchmarks.augment --synthetic 200
+    python -m benchmarks.augment --data-dir /tmp/cats_and_dogs_filtered --members jordan evan
+
+Pipelines are timed on their own first (images/sec of the batches alone).
+Then each member is fit on each of them and the median train step is
+compared. Under `fit` the step includes the wait for the next batch, so any
+augmentation work that doesn't overlap with compute shows up there.
+`ImageDataGenerator` with the same kinds of per-image augmentation is the
+reference for what the old route would cost.
+"""
+
+import argparse
+import importlib.util
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.common import (DEFAULT_DATA_DIR, make_synthetic_tree, print_table, summarize,
+                               time_batches)
+
+
+def _step_times(model, dataset, steps, warmup):
+    from tensorflow import keras
+
+    class StepTimer(keras.callbacks.Callback):
+        def __init__(self):
+            super().__init__()
+            self.samples = []
+
+        def on_train_batch_begin(self, batch, logs=None):
+            self._start = time.perf_counter()
+
+        def on_train_batch_end(self, batch, logs=None):
+            self.samples.append(time.perf_counter() - self._start)
+
+    timer = StepTimer()
+    model.fit(dataset, steps_per_epoch=warmup + steps, epochs=1, callbacks=[timer], verbose=0)
+    return timer.samples[warmup:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='generate N random JPEGs per class instead of using --data-dir')
+    parser.add_argument('--members', nargs='+', default=['jordan', 'evan'])
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--steps', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        data_dir = make_synthetic_tree(
+            os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic'), args.synthetic)
+    train_dir = os.path.join(data_dir, 'train')
+
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    from augment import AUGMENTATION, augment_dataset
+    from image_cache import load_or_build
+    from members import build_member
+
+    cache = load_or_build(train_dir)
+    sources = {
+        'none': lambda: cache.dataset(args.batch_size, seed=args.seed),
+        'batched': lambda: augment_dataset(cache.dataset(args.batch_size, seed=args.seed),
+                                           seed=args.seed),
+        'batched + mixup/cutmix': lambda: augment_dataset(
+            cache.dataset(args.batch_size, seed=args.seed),
+            dict(AUGMENTATION, mixup=0.2, cutmix=1.0), seed=args.seed),
+        'ImageDataGenerator': lambda: ImageDataGenerator(
+            rescale=1./255, rotation_range=15, zoom_range=0.15, width_shift_range=0.1,
+            height_shift_range=0.1, horizontal_flip=True, brightness_range=(0.9, 1.1),
+            fill_mode='reflect').flow_from_directory(
+                train_dir, target_size=(150, 150), batch_size=args.batch_size,
+                class_mode='binary', seed=args.seed),
+    }
+
+    if importlib.util.find_spec('scipy') is None:
+        # ImageDataGenerator's affine transforms run through scipy.ndimage
+        print('scipy is not installed, skipping the ImageDataGenerator reference\n')
+        del sources['ImageDataGenerator']
+
+    rows = []
+    for name, build in sources.items():
+        source = build()
+        stats = summarize(time_batches(iter(source), args.batches, args.warmup))
+        rows.append({'pipeline': name, 'images/sec': args.batch_size / stats['mean']})
+    print_table(rows, ['pipeline', 'images/sec'])
+
+    rows = []
+    for member in args.members:
+        baseline = None
+        for name, build in sources.items():
+            model = build_member(member)
+            step = statistics.median(_step_times(model, build(), args.steps, args.warmup))
+            baseline = baseline or step
+            rows.append({'model': member, 'pipeline': name, 'step ms (p50)': step * 1e3,
+                         'overhead %': 100. * (step / baseline - 1)})
+    print()
+    print_table(rows, ['model', 'pipeline', 'step ms (p50)', 'overhead %'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Helpers shared by the benchmark scripts."""
+
+import os
+import statistics
+import time
+
+DEFAULT_DATA_DIR = '/tmp/cats_and_dogs_filtered'
+
+
+def summarize(samples):
+    """Mean / std / median / min / max of a list of timings, in seconds."""
+    samples = list(samples)
+    return {
+        'n': len(samples),
+        'mean': statistics.fmean(samples),
+        'std': statistics.pstdev(samples) if len(samples) > 1 else 0.0,
+        'median': statistics.median(samples),
+        'min': min(samples),
+        'max': max(samples),
+    }
+
+
+def time_batches(iterator, num_batches, warmup=5):
+    """Pull `warmup + num_batches` batches and return the per-batch wait times."""
+    for _ in range(warmup):
+        next(iterator)
+    samples = []
+    for _ in range(num_batches):
+        start = time.perf_counter()
+        next(iterator)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def make_synthetic_tree(root, images_per_class, size=(375, 500), seed=0,
+                        splits=('train', 'validation')):
+    """Write random JPEGs laid out like cats_and_dogs_filtered under `root`.
+
+    Lets every benchmark run without the Kaggle download. Existing trees with
+    the right number of files are reused.
+    """
+    import numpy as np
+    import tensorflow as tf
+
+    rng = np.random.default_rng(seed)
+    for split in splits:
+        for class_name in ('cats', 'dogs'):
+            class_dir = os.path.join(root, split, class_name)
+            os.makedirs(class_dir, exist_ok=True)
+            if len(os.listdir(class_dir)) == images_per_class:
+                continue
+            for i in range(images_per_class):
+                pixels = rng.integers(0, 256, size=tuple(size) + (3,), dtype=np.uint8)
+                data = tf.io.encode_jpeg(pixels, quality=90).numpy()
+                with open(os.path.join(class_dir, '%s.%d.jpg' % (class_name[:-1], i)), 'wb') as f:
+                    f.write(data)
+    return root
+
+
+def print_table(rows, columns):
+    """Print a list of dicts as an aligned text table."""
+    widths = [max([len(c)] + [len(_fmt(r.get(c))) for r in rows]) for c in columns]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    print('  '.join('-' * w for w in widths))
+    for r in rows:
+        print('  '.join(_fmt(r.get(c)).ljust(w) for c, w in zip(columns, widths)))
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return '%.4g' % value
+    return '' if value is None else str(value)
@@ -0,0 +1,91 @@
+"""Cost of the cross-validation runner: shared decoded data and projected 5-fold x 8-member time.
+
+    python -m benchmarks.crossval --synthetic 60 --epochs 1
+    python -m benchmarks.crossval --data-dir /tmp/cats_and_dogs_filtered --folds 2 --workers 4
+
+First the data side: decoding the JPEGs again (what every job would pay
+with its own input pipeline) is compared with pooling the decoded caches
+once and memory-mapping the pool in each job. Then a small `cross_validate`
+run is timed. Its per-member seconds per training image and epoch are
+projected onto the full run: 5 folds x all members x `--full-epochs`
+epochs on the whole pool, over the same number of workers.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import DEFAULT_DATA_DIR, make_synthetic_tree, print_table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='generate N random JPEGs per class instead of using --data-dir')
+    parser.add_argument('--members', nargs='+', default=None)
+    parser.add_argument('--folds', type=int, default=2)
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--full-folds', type=int, default=5)
+    parser.add_argument('--full-epochs', type=int, default=15)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        data_dir = make_synthetic_tree(
+            os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic'), args.synthetic)
+    train_dir, validation_dir = (os.path.join(data_dir, 'train'),
+                                 os.path.join(data_dir, 'validation'))
+
+    from crossval import cross_validate
+    from image_cache import load_or_build, open_cache, pool_caches
+    from members import MEMBER_NAMES
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        caches = [load_or_build(d, os.path.join(tmp, os.path.basename(d)))
+                  for d in (train_dir, validation_dir)]
+        decode = time.perf_counter() - start
+        start = time.perf_counter()
+        pooled = pool_caches(caches, os.path.join(tmp, 'pooled'))
+        pool = time.perf_counter() - start
+        start = time.perf_counter()
+        open_cache(pooled.cache_dir).images[::97].sum()
+        open_ = time.perf_counter() - start
+        num_images = len(pooled)
+    print_table([
+        {'step': 'decode every JPEG (per job, unshared)', 'seconds': decode},
+        {'step': 'pool the decoded caches (once)', 'seconds': pool},
+        {'step': 'open the pooled memmap (per job)', 'seconds': open_},
+    ], ['step', 'seconds'])
+    print('%d images; %d folds x %d members would decode them %d times without sharing\n' % (
+        num_images, args.full_folds, len(args.members or MEMBER_NAMES),
+        args.full_folds * len(args.members or MEMBER_NAMES)))
+
+    start = time.perf_counter()
+    results = cross_validate(train_dir, validation_dir, names=args.members, folds=args.folds,
+                             epochs=args.epochs, workers=args.workers, verbose=0)
+    wall = time.perf_counter() - start
+    workers = args.workers or min(len(results), os.cpu_count() or 1)
+
+    rows, projected = [], 0.
+    train_images = num_images * (args.folds - 1) / args.folds
+    full_train_images = num_images * (args.full_folds - 1) / args.full_folds
+    for name in args.members or MEMBER_NAMES:
+        runs = [r for r in results if r['member'] == name]
+        per_image_epoch = sum(r['wall_time'] for r in runs) / (len(runs) * args.epochs *
+                                                               train_images)
+        job = per_image_epoch * full_train_images * args.full_epochs
+        projected += job * args.full_folds
+        rows.append({'member': name, 'ms / image-epoch': per_image_epoch * 1e3,
+                     'projected job s': job})
+    print_table(rows, ['member', 'ms / image-epoch', 'projected job s'])
+    print('\n%d jobs in %.0fs on %d workers' % (len(results), wall, workers))
+    print('projected %d folds x %d members x %d epochs: %.1f h on %d workers' % (
+        args.full_folds, len(rows), args.full_epochs, projected / workers / 3600, workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Cold vs. warm dataset preparation against a local HTTP stand-in.
+
+    python -m benchmarks.dataset_cache
+    python -m benchmarks.dataset_cache --archive cats_and_dogs_filtered.zip
+
+Serves a zip (the real one if `--archive` is given, otherwise a generated one
+with the same layout) from a local Range-capable HTTP server and times:
+
+* cold: download + checksum + extract into empty directories
+* resume: download restarted from a half-written `.part` file
+* warm: cached archive and intact tree, both steps skipped
+"""
+
+import argparse
+import http.server
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+from benchmarks.common import print_table
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """Serves one file and honours `Range: bytes=N-`."""
+
+    path_to_serve = None
+
+    def do_GET(self):
+        size = os.path.getsize(self.path_to_serve)
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and range_header.startswith('bytes='):
+            start = int(range_header[len('bytes='):].split('-')[0])
+            if start >= size:
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, size - 1, size))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(size - start))
+        self.end_headers()
+        with open(self.path_to_serve, 'rb') as f:
+            f.seek(start)
+            shutil.copyfileobj(f, self.wfile)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_archive(path, images_per_class, image_bytes=20000, seed=0):
+    """A zip laid out like cats_and_dogs_filtered, filled with random bytes."""
+    rng = random.Random(seed)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+        for split in ('train', 'validation'):
+            for class_name in ('cats', 'dogs'):
+                for i in range(images_per_class):
+                    zf.writestr('cats_and_dogs_filtered/%s/%s/%s.%d.jpg' % (
+                        split, class_name, class_name[:-1], i), rng.randbytes(image_bytes))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archive', default=None,
+                        help='serve this zip (default: generate one)')
+    parser.add_argument('--images-per-class', type=int, default=750)
+    args = parser.parse_args(argv)
+
+    from dataset import prepare_dataset
+
+    work = tempfile.mkdtemp(prefix='dataset_bench_')
+    try:
+        archive = args.archive or make_archive(
+            os.path.join(work, 'cats_and_dogs_filtered.zip'), args.images_per_class)
+        RangeHandler.path_to_serve = archive
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:%d/cats_and_dogs_filtered.zip' % server.server_address[1]
+
+        cache_dir = os.path.join(work, 'cache')
+        extract_to = os.path.join(work, 'data')
+        rows = []
+
+        def run(name):
+            start = time.perf_counter()
+            prepare_dataset(url, cache_dir, extract_to, verbose=False)
+            rows.append({'run': name, 'seconds': time.perf_counter() - start})
+
+        run('cold')
+
+        # Simulate an interrupted download: half the archive left as .part
+        cached = os.path.join(cache_dir, 'cats_and_dogs_filtered.zip')
+        with open(archive, 'rb') as src, open(cached + '.part', 'wb') as dst:
+            dst.write(src.read(os.path.getsize(archive) // 2))
+        os.remove(cached)
+        os.remove(cached + '.sha256.json')
+        run('resume (half downloaded)')
+
+        for i in range(3):
+            run('warm #%d' % (i + 1))
+        server.shutdown()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    cold = rows[0]['seconds']
+    for row in rows:
+        row['saved vs cold'] = cold - row['seconds']
+    print_table(rows, ['run', 'seconds', 'saved vs cold'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Ensemble training time: end-to-end `ensemble_model.fit` vs. frozen members + cached features.
+
+    python -m benchmarks.ensemble_head --data-dir /tmp/cats_and_dogs_filtered
+    python -m benchmarks.ensemble_head --synthetic 200 --epochs 2
+
+Member weights don't affect the timing, so freshly built members are used.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import DEFAULT_DATA_DIR, make_synthetic_tree, print_table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='generate N random JPEGs per class instead of using --data-dir')
+    parser.add_argument('--epochs', type=int, default=15)
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        data_dir = make_synthetic_tree(
+            os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic'), args.synthetic)
+
+    from ensemble import build_ensemble, compile_ensemble, train_ensemble_head
+    from image_cache import load_or_build
+    from members import build_members
+
+    train_cache = load_or_build(os.path.join(data_dir, 'train'))
+    validation_cache = load_or_build(os.path.join(data_dir, 'validation'))
+    train_steps = -(-len(train_cache) // 20)
+    validation_steps = -(-len(validation_cache) // 20)
+
+    ensemble_model = compile_ensemble(build_ensemble(
+        build_members().values(), freeze_members=False))
+    start = time.perf_counter()
+    ensemble_model.fit(train_cache.dataset(20), steps_per_epoch=train_steps, epochs=args.epochs,
+                       validation_data=validation_cache.dataset(20, shuffle=False),
+                       validation_steps=validation_steps, verbose=0)
+    end_to_end = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, _, timings = train_ensemble_head(
+        build_members().values(),
+        train_cache.dataset(20, shuffle=False, repeat=False),
+        validation_cache.dataset(20, shuffle=False, repeat=False),
+        epochs=args.epochs, verbose=0)
+    cached = time.perf_counter() - start
+
+    print_table([
+        {'mode': 'end-to-end fit (unfrozen)', 'features s': None, 'head fit s': None,
+         'total s': end_to_end},
+        {'mode': 'frozen + cached features', 'features s': timings['features'],
+         'head fit s': timings['head_fit'], 'total s': cached},
+    ], ['mode', 'features s', 'head fit s', 'total s'])
+    print('speedup: %.1fx' % (end_to_end / cached))
+
+
+if __name__ == '__main__':
+    main()
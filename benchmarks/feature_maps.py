@@ -0,0 +1,86 @@
+"""Feature-map rendering: the notebook's per-filter loop vs. feature_maps.py.
+
+    python -m benchmarks.feature_maps
+    python -m benchmarks.feature_maps --member jordan --images 8
+
+Both paths start from the same feature maps of `--member` (default evan, whose
+last conv layers have 160 and 200 channels) for `--images` random images and
+produce the same horizontal strips; only the normalise-and-tile step is timed.
+The loop is the notebook's code, with its divide-by-zero on dead channels
+silenced so it can be timed at all. `dead` counts (image, channel) pairs with
+zero variance, and `max diff` compares the two outputs on the rest.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import print_table, summarize
+
+
+def loop_grids(feature_map):
+    """The notebook's version, for one `(1, size, size, n_features)` map."""
+    n_features = feature_map.shape[-1]
+    size = feature_map.shape[1]
+    display_grid = np.zeros((size, size * n_features))
+    for i in range(n_features):
+        x = feature_map[0, :, :, i].copy()
+        x -= x.mean()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x /= x.std()
+            x *= 64
+            x += 128
+            x = np.clip(x, 0, 255).astype('uint8')
+        display_grid[:, i * size: (i + 1) * size] = x
+    return display_grid
+
+
+def _time(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)['median']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--member', default='evan')
+    parser.add_argument('--images', type=int, default=16)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    from feature_maps import feature_extractor, normalize, tile
+    from members import INPUT_SHAPE, build_member
+
+    model = build_member(args.member, compile=False)
+    extractor, names = feature_extractor(model)
+    images = np.random.default_rng(0).random((args.images,) + INPUT_SHAPE, np.float32)
+    maps = [np.asarray(m) for m in extractor.predict_on_batch(images)]
+
+    rows = []
+    for name, layer_maps in zip(names, maps):
+        def loop():
+            return [loop_grids(layer_maps[i:i + 1]) for i in range(len(layer_maps))]
+
+        def vectorised():
+            return tile(normalize(layer_maps))
+
+        # Dead channels come out of the loop as garbage; elsewhere the two agree to rounding
+        alive = layer_maps.std(axis=(1, 2), keepdims=True) > 0
+        live = tile(np.broadcast_to(alive, layer_maps.shape).astype(np.uint8)) > 0
+        diff = np.abs(np.stack(loop()) - vectorised())[live]
+        dead = int((~alive).sum())
+        max_diff = diff.max() if diff.size else 0.
+        loop_s, vec_s = _time(loop, args.repeats), _time(vectorised, args.repeats)
+        rows.append({'layer': name, 'channels': layer_maps.shape[-1], 'dead': dead,
+                     'max diff': float(max_diff), 'loop ms': loop_s * 1e3,
+                     'vectorised ms': vec_s * 1e3, 'speedup': loop_s / vec_s})
+    print_table(rows, ['layer', 'channels', 'dead', 'max diff', 'loop ms', 'vectorised ms',
+                       'speedup'])
+
+
+if __name__ == '__main__':
+    main()
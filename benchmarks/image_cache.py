@@ -0,0 +1,73 @@
+"""Cold vs. warm epoch time for the decoded-image cache.
+
+    python -m benchmarks.image_cache --data-dir /tmp/cats_and_dogs_filtered
+    python -m benchmarks.image_cache --synthetic 500
+
+"cold" is the first run on an empty cache (decode + write + one epoch),
+"warm" reopens the existing cache (stat the tree + mmap + one epoch), and
+"no cache" is one epoch of the decoding tf.data pipeline for reference.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import DEFAULT_DATA_DIR, make_synthetic_tree, print_table
+
+
+def _epoch(dataset, steps):
+    start = time.perf_counter()
+    for _ in dataset.take(steps):
+        pass
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='generate N random JPEGs per class instead of using --data-dir')
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--epochs', type=int, default=3,
+                        help='warm epochs to average over')
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        data_dir = make_synthetic_tree(
+            os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic'), args.synthetic)
+    train_dir = os.path.join(data_dir, 'train')
+
+    from data_pipeline import list_image_files, make_dataset
+    from image_cache import load_or_build
+
+    steps = -(-len(list_image_files(train_dir)[0]) // args.batch_size)
+    cache_dir = os.path.join(tempfile.mkdtemp(prefix='image_cache_bench_'), 'train')
+    rows = []
+    try:
+        start = time.perf_counter()
+        cache = load_or_build(train_dir, cache_dir)
+        build = time.perf_counter() - start
+        epoch = _epoch(cache.dataset(args.batch_size, repeat=False), steps)
+        rows.append({'run': 'cold', 'open/build s': build, 'epoch s': epoch,
+                     'total s': build + epoch})
+
+        for i in range(args.epochs):
+            start = time.perf_counter()
+            cache = load_or_build(train_dir, cache_dir)
+            reopen = time.perf_counter() - start
+            epoch = _epoch(cache.dataset(args.batch_size, repeat=False), steps)
+            rows.append({'run': 'warm #%d' % (i + 1), 'open/build s': reopen,
+                         'epoch s': epoch, 'total s': reopen + epoch})
+    finally:
+        shutil.rmtree(os.path.dirname(cache_dir), ignore_errors=True)
+
+    epoch = _epoch(make_dataset(train_dir, args.batch_size, repeat=False), steps)
+    rows.append({'run': 'no cache', 'open/build s': 0.0, 'epoch s': epoch, 'total s': epoch})
+    print_table(rows, ['run', 'open/build s', 'epoch s', 'total s'])
+
+
+if __name__ == '__main__':
+    main()
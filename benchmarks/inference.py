@@ -0,0 +1,98 @@
+"""Latency and throughput of the inference engine at batch sizes 1, 8, 32 and 128.
+
+    python -m benchmarks.inference --model ensemble_model.h5
+    python -m benchmarks.inference            # untrained ensemble, timing only
+
+For each batch size the table compares plain `model.predict` with the
+engine's compiled graph (`predict`), then measures micro-batched throughput
+with many client threads each sending one image (`predict_batch`).
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import print_table, summarize
+
+
+def _latencies(fn, images, repeats, warmup=3):
+    for _ in range(warmup):
+        fn(images)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(images)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def _percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=None,
+                        help='saved .h5 model (default: save an untrained ensemble to a temp file)')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=512)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--inter-op-threads', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    import numpy as np
+    import tensorflow as tf
+    from inference import InferenceEngine
+
+    # Thread pools can only be sized before the TF runtime starts
+    if args.inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(args.inter_op_threads)
+
+    model_path = args.model
+    if model_path is None:
+        from ensemble import build_ensemble
+        from members import build_members
+        model_path = os.path.join(tempfile.mkdtemp(), 'ensemble_model.h5')
+        build_ensemble(build_members(compile=False).values()).save(model_path)
+
+    rng = np.random.default_rng(0)
+    keras_model = tf.keras.models.load_model(model_path, compile=False)
+    engine = InferenceEngine(model_path, max_batch_size=max(args.batch_sizes),
+                             max_wait_ms=args.max_wait_ms)
+    rows = []
+    for batch_size in args.batch_sizes:
+        images = rng.random((batch_size, 150, 150, 3), dtype=np.float32)
+        for name, fn in (('model.predict', lambda x: keras_model.predict(x, verbose=0)),
+                         ('engine.predict', engine.predict)):
+            stats = _latencies(fn, images, args.repeats)
+            rows.append({'path': name, 'batch': batch_size,
+                         'latency ms (p50)': stats['median'] * 1e3,
+                         'latency ms (max)': stats['max'] * 1e3,
+                         'images/sec': batch_size / stats['mean']})
+    print_table(rows, ['path', 'batch', 'latency ms (p50)', 'latency ms (max)', 'images/sec'])
+
+    image = rng.random((1, 150, 150, 3), dtype=np.float32)
+    latencies = []
+
+    def client(_):
+        start = time.perf_counter()
+        engine.predict_batch(image)
+        latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(args.clients) as pool:
+        start = time.perf_counter()
+        list(pool.map(client, range(args.requests)))
+        wall = time.perf_counter() - start
+    engine.close()
+    print('\nmicro-batched, %d clients x 1 image: %.1f images/sec, p50 %.1f ms, p99 %.1f ms' % (
+        args.clients, args.requests / wall,
+        _percentile(latencies, 0.5) * 1e3, _percentile(latencies, 0.99) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Throughput of the tf.data pipeline against ImageDataGenerator.flow_from_directory.
+
+    python -m benchmarks.input_pipeline --data-dir /tmp/cats_and_dogs_filtered
+    python -m benchmarks.input_pipeline --synthetic 500
+"""
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.common import (DEFAULT_DATA_DIR, make_synthetic_tree,
+                               print_table, summarize, time_batches)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='generate N random JPEGs per class instead of using --data-dir')
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--batches', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        data_dir = make_synthetic_tree(
+            os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic'), args.synthetic)
+    train_dir = os.path.join(data_dir, 'train')
+
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+    from data_pipeline import make_dataset
+
+    sources = {
+        'flow_from_directory': lambda: ImageDataGenerator(rescale=1./255).flow_from_directory(
+            train_dir, target_size=(150, 150), batch_size=args.batch_size, class_mode='binary'),
+        'tf.data': lambda: iter(make_dataset(train_dir, batch_size=args.batch_size)),
+        'tf.data (deterministic)': lambda: iter(make_dataset(
+            train_dir, batch_size=args.batch_size, seed=0, deterministic=True)),
+    }
+
+    rows = []
+    for name, build in sources.items():
+        stats = summarize(time_batches(build(), args.batches, args.warmup))
+        rows.append({
+            'loader': name,
+            'images/sec': args.batch_size / stats['mean'],
+            'step ms (mean)': stats['mean'] * 1e3,
+            'step ms (p50)': stats['median'] * 1e3,
+            'step ms (std)': stats['std'] * 1e3,
+        })
+    print_table(rows, ['loader', 'images/sec', 'step ms (mean)', 'step ms (p50)', 'step ms (std)'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Load generator for serve.py.
+
+    python serve.py --model ensemble_model.h5 &
+    python -m benchmarks.load_generator --concurrency 32 --requests 2000
+    python -m benchmarks.load_generator --image-dir /tmp/cats_and_dogs_filtered/validation
+
+Each of `--concurrency` clients keeps one connection open and posts images
+back to back. Client-side latency percentiles and throughput are printed,
+followed by the server's own /metrics.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+
+async def _request(reader, writer, host, method, path, body=b''):
+    writer.write(('%s %s HTTP/1.1\r\nHost: %s\r\nContent-Length: %d\r\n\r\n' % (
+        method, path, host, len(body))).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        if key.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+def _load_images(image_dir, count, seed):
+    if image_dir:
+        paths = [os.path.join(root, f) for root, _, files in os.walk(image_dir)
+                 for f in files if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+        random.Random(seed).shuffle(paths)
+        images = []
+        for path in paths[:count]:
+            with open(path, 'rb') as f:
+                images.append(f.read())
+        return images
+
+    import numpy as np
+    import tensorflow as tf
+    rng = np.random.default_rng(seed)
+    return [tf.io.encode_jpeg(rng.integers(0, 256, (375, 500, 3), dtype=np.uint8)).numpy()
+            for _ in range(count)]
+
+
+async def run(url, images, concurrency, total):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    latencies, statuses = [], {}
+    remaining = iter(range(total))
+
+    async def client(worker):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in remaining:
+                start = time.perf_counter()
+                status, _ = await _request(reader, writer, host, 'POST', '/predict',
+                                           images[(i + worker) % len(images)])
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(w) for w in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await _request(reader, writer, host, 'GET', '/metrics')
+    writer.close()
+    return latencies, statuses, wall, json.loads(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--image-dir', default=None,
+                        help='post real images from this tree (default: synthetic JPEGs)')
+    parser.add_argument('--distinct-images', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    images = _load_images(args.image_dir, args.distinct_images, args.seed)
+    latencies, statuses, wall, server_metrics = asyncio.run(
+        run(args.url, images, args.concurrency, args.requests))
+
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e3
+
+    print('%d requests, concurrency %d: %.1f req/s, statuses %s' % (
+        len(latencies), args.concurrency, len(latencies) / wall, statuses))
+    print('client latency ms: p50 %.1f  p95 %.1f  p99 %.1f' % (pct(0.5), pct(0.95), pct(0.99)))
+    print('server metrics: %s' % json.dumps(server_metrics, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Wall time of the member stage: eight sequential `fit` calls vs. `fit_members`.
+
+    python -m benchmarks.multi_trainer --data-dir /tmp/cats_and_dogs_filtered
+    python -m benchmarks.multi_trainer --synthetic 200 --epochs 1 --steps 20
+
+Both paths train freshly built members on the decoding tf.data pipeline
+(`--source decode`) or on the decoded-image cache (`--source cache`).
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import DEFAULT_DATA_DIR, make_synthetic_tree, print_table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='generate N random JPEGs per class instead of using --data-dir')
+    parser.add_argument('--source', choices=('decode', 'cache'), default='decode')
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--validation-steps', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        data_dir = make_synthetic_tree(
+            os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic'), args.synthetic)
+
+    from members import build_members
+    from multi_trainer import fit_members
+
+    def datasets():
+        train_dir = os.path.join(data_dir, 'train')
+        validation_dir = os.path.join(data_dir, 'validation')
+        if args.source == 'cache':
+            from image_cache import load_or_build
+            return (load_or_build(train_dir).dataset(20),
+                    load_or_build(validation_dir).dataset(20, shuffle=False))
+        from data_pipeline import make_dataset
+        return make_dataset(train_dir, 20), make_dataset(validation_dir, 20, shuffle=False)
+
+    fit_kwargs = dict(epochs=args.epochs, validation_steps=args.validation_steps, verbose=0)
+
+    models = build_members()
+    train, validation = datasets()
+    start = time.perf_counter()
+    for model in models.values():
+        model.fit(train, steps_per_epoch=args.steps, validation_data=validation, **fit_kwargs)
+    sequential = time.perf_counter() - start
+
+    models = build_members()
+    train, validation = datasets()
+    start = time.perf_counter()
+    fit_members(models, train, steps_per_epoch=args.steps, validation_data=validation, **fit_kwargs)
+    lockstep = time.perf_counter() - start
+
+    print_table([
+        {'path': 'sequential fit x%d' % len(models), 'wall s': sequential, 'speedup': 1.0},
+        {'path': 'fit_members', 'wall s': lockstep, 'speedup': sequential / lockstep},
+    ], ['path', 'wall s', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
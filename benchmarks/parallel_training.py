@@ -0,0 +1,67 @@
+"""Serial vs. process-pool training of the member models.
+
+    python -m benchmarks.parallel_training --data-dir /tmp/cats_and_dogs_filtered
+    python -m benchmarks.parallel_training --synthetic 200 --steps 20 --workers 4
+
+The serial run is the same orchestrator with one worker owning every core, so
+both sides pay identical process start-up and data costs.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import DEFAULT_DATA_DIR, make_synthetic_tree, print_table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='generate N random JPEGs per class instead of using --data-dir')
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--validation-steps', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--intra-op-threads', type=int, default=None)
+    parser.add_argument('--inter-op-threads', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        data_dir = make_synthetic_tree(
+            os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic'), args.synthetic)
+
+    from members import MEMBER_NAMES
+    from parallel_training import train_members_parallel
+
+    common = dict(names=MEMBER_NAMES,
+                  train_dir=os.path.join(data_dir, 'train'),
+                  validation_dir=os.path.join(data_dir, 'validation'),
+                  steps_per_epoch=args.steps, epochs=args.epochs,
+                  validation_steps=args.validation_steps, verbose=0)
+
+    start = time.perf_counter()
+    _, _, serial = train_members_parallel(workers=1, intra_op_threads=os.cpu_count(),
+                                          inter_op_threads=2, **common)
+    serial_wall = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, _, parallel = train_members_parallel(workers=args.workers,
+                                            intra_op_threads=args.intra_op_threads,
+                                            inter_op_threads=args.inter_op_threads, **common)
+    parallel_wall = time.perf_counter() - start
+
+    rows = [{'model': name,
+             'serial ms/step': serial[name]['step_time'] * 1e3,
+             'parallel ms/step': parallel[name]['step_time'] * 1e3}
+            for name in MEMBER_NAMES]
+    rows.append({'model': 'TOTAL wall s', 'serial ms/step': serial_wall,
+                 'parallel ms/step': parallel_wall})
+    print_table(rows, ['model', 'serial ms/step', 'parallel ms/step'])
+    print('speedup: %.2fx' % (serial_wall / parallel_wall))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""A/B of the training modes: float32 vs. XLA vs. mixed bfloat16, per model.
+
+    python -m benchmarks.precision --data-dir /tmp/cats_and_dogs_filtered
+    python -m benchmarks.precision --synthetic 100 --steps 20 --members evan sam ensemble_model
+
+Every (model, mode) pair trains in its own subprocess, because the dtype
+policy is process-global and peak RSS can only be read per process. Each run
+reports the median train step time (after the first, compiling, step), the
+process's peak RSS and the final validation accuracy.
+
+`ensemble_model` builds all eight members under the mode's policy and runs
+`train_ensemble_head` over `--steps` training and `--validation-steps`
+validation batches. Its step time is the head's, and its RSS includes the
+members. The members are freshly initialised here, so its accuracy only
+shows that the head trains under the mode; `feature pass s` is the one-off
+member prediction pass.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import DEFAULT_DATA_DIR, make_synthetic_tree, print_table
+
+ENSEMBLE = 'ensemble_model'
+
+MODES = {
+    'fp32': ('float32', False),
+    'fp32+xla': ('float32', True),
+    'bf16': ('mixed_bfloat16', False),
+    'bf16+xla': ('mixed_bfloat16', True),
+}
+
+
+def _worker(args):
+    import statistics
+
+    from tensorflow import keras
+
+    from image_cache import load_or_build
+    from members import build_member
+    from precision import set_precision
+
+    precision, jit_compile = MODES[args.mode]
+    set_precision(precision)
+
+    train = load_or_build(os.path.join(args.data_dir, 'train')).dataset(20)
+    validation = load_or_build(os.path.join(args.data_dir, 'validation')).dataset(20, shuffle=False)
+
+    class StepTimer(keras.callbacks.Callback):
+        def __init__(self):
+            super().__init__()
+            self.samples = []
+
+        def on_train_batch_begin(self, batch, logs=None):
+            self._start = time.perf_counter()
+
+        def on_train_batch_end(self, batch, logs=None):
+            self.samples.append(time.perf_counter() - self._start)
+
+    timer = StepTimer()
+    row = {}
+    if args.worker == ENSEMBLE:
+        from ensemble import train_ensemble_head
+        from members import build_members
+
+        _, history, timings = train_ensemble_head(
+            build_members(jit_compile=jit_compile).values(), train, validation,
+            train_steps=args.steps, validation_steps=args.validation_steps, epochs=args.epochs,
+            verbose=0, jit_compile=jit_compile, callbacks=[timer])
+        row['feature pass s'] = timings['features']
+    else:
+        model = build_member(args.worker, jit_compile=jit_compile)
+        history = model.fit(train, steps_per_epoch=args.steps, epochs=args.epochs,
+                            validation_data=validation, validation_steps=args.validation_steps,
+                            callbacks=[timer], verbose=0)
+    val_acc = next(v for k, v in history.history.items() if k in ('val_accuracy', 'val_acc'))
+    # ru_maxrss is in KiB on Linux
+    print(json.dumps(dict({
+        'step ms': 1000 * statistics.median(timer.samples[1:] or timer.samples),
+        'first step s': timer.samples[0],
+        'peak RSS MB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'val acc': val_acc[-1],
+    }, **row)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='generate N random JPEGs per class instead of using --data-dir')
+    parser.add_argument('--members', nargs='+', default=None,
+                        help='members to benchmark, and/or %s (default: all eight and the '
+                             'ensemble)' % ENSEMBLE)
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=list(MODES))
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--validation-steps', type=int, default=50)
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--mode', default='fp32', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return _worker(args)
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        data_dir = make_synthetic_tree(
+            os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic'), args.synthetic)
+
+    from image_cache import load_or_build
+    from members import MEMBER_NAMES
+
+    # Build the caches once up front so no run pays for decoding
+    for split in ('train', 'validation'):
+        load_or_build(os.path.join(data_dir, split))
+
+    rows = []
+    for name in args.members or list(MEMBER_NAMES) + [ENSEMBLE]:
+        baseline = None
+        for mode in args.modes:
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.precision', '--worker', name, '--mode', mode,
+                 '--data-dir', data_dir, '--epochs', str(args.epochs), '--steps', str(args.steps),
+                 '--validation-steps', str(args.validation_steps)],
+                check=True, stdout=subprocess.PIPE, text=True).stdout
+            row = json.loads(out.strip().splitlines()[-1])
+            baseline = baseline or row['step ms']
+            rows.append({'model': name, 'mode': mode, **row, 'speedup': baseline / row['step ms']})
+    print_table(rows, ['model', 'mode', 'step ms', 'first step s', 'peak RSS MB', 'val acc',
+                       'speedup', 'feature pass s'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Request throughput of the prediction server with and without its prediction cache.
+
+    python -m benchmarks.prediction_cache                       # untrained ensemble, timing only
+    python -m benchmarks.prediction_cache --model ensemble_model.h5 --duplicate-rate 0.5
+
+A stream of `--requests` uploads goes straight into `PredictionServer.predict`,
+with no HTTP in between. A `--duplicate-rate` share of the stream are
+re-uploads of earlier images, like retries and duplicate files. The same
+stream runs with no cache, with a cache large enough for every image, and
+with a cache of `--small-capacity` entries, to show evictions. `coalesced`
+counts duplicates that arrived while their first copy was still being
+computed; they wait for that result and are not counted as hits. Then the
+model file is replaced by a differently initialised ensemble. The stream runs
+again once the server has noticed: the old entries must be dropped and
+nothing answered from them.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import print_table
+from benchmarks.load_generator import _load_images
+
+
+def _stream(images, total, duplicate_rate, seed):
+    rng = random.Random(seed)
+    fresh = iter(images)
+    seen = [next(fresh)]
+    stream = [seen[0]]
+    while len(stream) < total:
+        image = next(fresh, None) if rng.random() >= duplicate_rate else None
+        if image is None:
+            image = rng.choice(seen)
+        else:
+            seen.append(image)
+        stream.append(image)
+    return stream
+
+
+async def _run(server, stream, concurrency):
+    remaining = iter(stream)
+
+    async def client():
+        for data in remaining:
+            await server.predict(data)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=None,
+                        help='saved .h5 model (default: save an untrained ensemble to a temp file)')
+    parser.add_argument('--image-dir', default=None,
+                        help='upload real images from this tree (default: synthetic JPEGs)')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--duplicate-rate', type=float, default=0.5)
+    parser.add_argument('--small-capacity', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from ensemble import build_ensemble
+    from inference import InferenceEngine
+    from members import build_members
+    from prediction_cache import PredictionCache
+    from serve import PredictionServer
+
+    tmp = tempfile.mkdtemp()
+    # The server watches this copy, so the real model is never touched
+    model_path = os.path.join(tmp, 'ensemble_model.h5')
+    if args.model is None:
+        build_ensemble(build_members(compile=False).values()).save(model_path)
+    else:
+        shutil.copyfile(args.model, model_path)
+
+    images = _load_images(args.image_dir, args.requests, args.seed)
+    stream = _stream(images, args.requests, args.duplicate_rate, args.seed)
+    distinct = len(set(stream))
+
+    def load_engine():
+        return InferenceEngine(model_path, max_batch_size=args.max_batch_size)
+
+    engine = load_engine()
+    # Cache stats once the replaced model is live, before the stream runs again
+    reloaded = {}
+
+    async def measure(cache, replace_model=False):
+        server = PredictionServer([engine], args.max_batch_size, cache=cache,
+                                  engine_factory=load_engine if replace_model else None,
+                                  watch_interval=0.1)
+        await server.start()
+        try:
+            await server.predict(stream[0])  # warm the pools; counted in the cache stats
+            if not replace_model:
+                return await _run(server, stream, args.concurrency), server
+            await _run(server, stream, args.concurrency)
+            new_path = os.path.join(tmp, 'replacement.h5')
+            build_ensemble(build_members(compile=False).values()).save(new_path)
+            os.replace(new_path, model_path)
+            deadline = time.monotonic() + 600
+            while server.metrics.reloads == 0:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('the server never reloaded the replaced model')
+                await asyncio.sleep(0.1)
+            reloaded.update(cache.stats(), coalesced=server.metrics.coalesced)
+            return await _run(server, stream, args.concurrency), server
+        finally:
+            await server.stop()
+
+    rows = []
+    for name, cache in (('no cache', None),
+                        ('cache, capacity %d' % args.requests, PredictionCache(args.requests)),
+                        ('cache, capacity %d' % args.small_capacity,
+                         PredictionCache(args.small_capacity))):
+        seconds, server = asyncio.run(measure(cache))
+        row = {'run': name, 'req/s': len(stream) / seconds, 'seconds': seconds,
+               'coalesced': server.metrics.coalesced}
+        if cache is not None:
+            stats = cache.stats()
+            row.update({k: stats[k] for k in ('hit_rate', 'evictions', 'mean_hit_ms',
+                                              'mean_miss_ms', 'latency_saved_s')})
+        rows.append(row)
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        cache = PredictionCache(args.requests, os.path.join(db_dir, 'predictions.db'))
+        fingerprint = engine.fingerprint
+        seconds, server = asyncio.run(measure(cache, replace_model=True))
+        stats, before = cache.stats(), reloaded
+        hits, misses = stats['hits'] - before['hits'], stats['misses'] - before['misses']
+        stale = sum(1 for k in cache._memory if k[0] == fingerprint)
+        stale += cache._db.execute('SELECT COUNT(*) FROM predictions WHERE fingerprint = ?',
+                                   (fingerprint,)).fetchone()[0]
+        rows.append({'run': 'after model replaced', 'req/s': len(stream) / seconds,
+                     'seconds': seconds, 'hit_rate': hits / (hits + misses),
+                     'coalesced': server.metrics.coalesced - reloaded['coalesced'],
+                     'evictions': stats['evictions'] - before['evictions']})
+        cache.close()
+        for replica in server.engines:
+            replica.close()
+    engine.close()
+    shutil.rmtree(tmp)
+
+    print('%d requests, %d distinct images, concurrency %d' % (
+        len(stream), distinct, args.concurrency))
+    print_table(rows, ['run', 'req/s', 'seconds', 'hit_rate', 'coalesced', 'evictions',
+                       'mean_hit_ms', 'mean_miss_ms', 'latency_saved_s'])
+    print('model replaced: %d reload(s), %d invalidation(s), %d entries of the old model left' % (
+        server.metrics.reloads, stats['invalidations'], stale))
+
+
+if __name__ == '__main__':
+    main()
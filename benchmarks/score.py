@@ -0,0 +1,100 @@
+"""End-to-end images/sec of bulk scoring, next to its decode-only and model-only ceilings.
+
+    python -m benchmarks.score --synthetic 2000                 # untrained ensemble, timing only
+    python -m benchmarks.score --source /data/new_images --model ensemble_model.h5 --member evan
+
+`score_directory` runs over the tree twice: once straight through, and once
+stopped halfway with `max_images` and resumed, to show what a checkpointed
+restart costs. The ceilings come from the same reader pipeline without a
+model, and from the model on one pre-decoded batch. Peak RSS is read at the
+end; it should not depend on the size of the tree.
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.common import make_synthetic_tree, print_table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default=None,
+                        help='image tree to score (default: a synthetic one)')
+    parser.add_argument('--synthetic', type=int, default=1000, metavar='N',
+                        help='random JPEGs per class in the synthetic tree')
+    parser.add_argument('--model', default=None,
+                        help='saved .h5 model (default: save an untrained ensemble to a temp file)')
+    parser.add_argument('--member', default=None)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--readers', type=int, default=None)
+    parser.add_argument('--checkpoint-every', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    source = args.source
+    if source is None:
+        root = os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic_score_%d'
+                            % args.synthetic)
+        source = os.path.join(make_synthetic_tree(root, args.synthetic, splits=('all',)), 'all')
+
+    import numpy as np
+    import tensorflow as tf
+
+    from data_pipeline import AUTOTUNE, decode_and_resize
+    from inference import InferenceEngine
+    from score import score_directory, walk_images
+
+    model_path = args.model
+    if model_path is None:
+        from ensemble import build_ensemble
+        from members import build_members
+        model_path = os.path.join(tempfile.mkdtemp(), 'ensemble_model.h5')
+        build_ensemble(build_members(compile=False).values()).save(model_path)
+
+    paths = [path for _, path in walk_images(source)]
+    decode = tf.data.Dataset.from_tensor_slices(paths).map(
+        decode_and_resize, num_parallel_calls=args.readers or AUTOTUNE).ignore_errors().batch(
+        args.batch_size)
+    start = time.perf_counter()
+    for _ in decode.prefetch(2):
+        pass
+    rows = [{'run': 'decode only', 'images/s': len(paths) / (time.perf_counter() - start)}]
+
+    engine = InferenceEngine(model_path, max_batch_size=args.batch_size, member=args.member)
+    batch = np.random.default_rng(0).integers(0, 256, (args.batch_size, 150, 150, 3), np.uint8)
+    engine.predict(batch)
+    start = time.perf_counter()
+    repeats = max(1, 512 // args.batch_size)
+    for _ in range(repeats):
+        engine.predict(batch)
+    rows.append({'run': 'model only', 'images/s': repeats * args.batch_size /
+                 (time.perf_counter() - start)})
+    engine.close()
+
+    common = dict(model_path=model_path, member=args.member, batch_size=args.batch_size,
+                  readers=args.readers, checkpoint_every=args.checkpoint_every, verbose=0)
+    with tempfile.TemporaryDirectory() as tmp:
+        summary = score_directory(source, os.path.join(tmp, 'straight.csv'), **common)
+        rows.append({'run': 'score, straight through', 'images/s': summary['images/s'],
+                     'seconds': summary['seconds']})
+        first = score_directory(source, os.path.join(tmp, 'resumed.csv'),
+                                max_images=len(paths) // 2, **common)
+        second = score_directory(source, os.path.join(tmp, 'resumed.csv'), **common)
+        seconds = first['seconds'] + second['seconds']
+        rows.append({'run': 'score, stopped + resumed', 'images/s': len(paths) / seconds,
+                     'seconds': seconds})
+        with open(os.path.join(tmp, 'straight.csv')) as a, \
+                open(os.path.join(tmp, 'resumed.csv')) as b:
+            identical = a.read() == b.read()
+
+    print('%d images under %s, batches of %d' % (len(paths), source, args.batch_size))
+    print_table(rows, ['run', 'images/s', 'seconds'])
+    print('resumed output identical to the straight run: %s' % identical)
+    # ru_maxrss is in KiB on Linux
+    print('peak RSS: %.0f MB' % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+if __name__ == '__main__':
+    main()
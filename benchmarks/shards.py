@@ -0,0 +1,93 @@
+"""Ingest and read throughput of sharded TFRecords on a synthetic 25,000-image corpus.
+
+    python -m benchmarks.shards                       # 2 x 12,500 random JPEGs, like Kaggle's train/
+    python -m benchmarks.shards --source /data/dogs-vs-cats/train
+
+The corpus (or `--source`) is converted with `shards.write_shards`. Then
+batches are pulled from the shards and, for comparison, decoded straight from
+the JPEG files with `data_pipeline.make_dataset`. Peak RSS is read after
+each loader, to show that streaming the whole set doesn't grow with its size.
+The full set decoded to 150x150 would take 25,000 x 67.5 KB = 1.7 GB.
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.common import make_synthetic_tree, print_table, summarize, time_batches
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _size_mb(paths):
+    return sum(os.path.getsize(p) for p in paths) / 2 ** 20
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default=None,
+                        help='labelled image folder to ingest (default: a synthetic corpus)')
+    parser.add_argument('--synthetic', type=int, default=12500, metavar='N',
+                        help='random JPEGs per class in the synthetic corpus')
+    parser.add_argument('--image-size', type=int, nargs=2, default=(375, 500),
+                        metavar=('H', 'W'))
+    parser.add_argument('--encodings', nargs='+', default=['jpeg', 'original'],
+                        choices=('jpeg', 'original'))
+    parser.add_argument('--compression', default='', choices=('', 'GZIP', 'ZLIB'))
+    parser.add_argument('--shard-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    source = args.source
+    if source is None:
+        root = os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic_%d_%dx%d' % (
+            args.synthetic, *args.image_size))
+        start = time.perf_counter()
+        make_synthetic_tree(root, args.synthetic, size=tuple(args.image_size), splits=('all',))
+        source = os.path.join(root, 'all')
+        print('synthetic corpus ready in %.0fs' % (time.perf_counter() - start))
+
+    from data_pipeline import make_dataset
+    from shards import list_labelled_images, load_shards, write_shards
+
+    paths, _, _ = list_labelled_images(source)
+    rows = [{'loader': 'JPEG files', 'MB on disk': _size_mb(paths)}]
+    stores = {}
+    for encoding in args.encodings:
+        out_dir = os.path.join(tempfile.gettempdir(), 'shards_bench_%s%s' % (
+            encoding, args.compression.lower()))
+        start = time.perf_counter()
+        write_shards(source, out_dir, images_per_shard=args.shard_size, encoding=encoding,
+                     compression=args.compression, workers=args.workers, verbose=0)
+        elapsed = time.perf_counter() - start
+        train, validation = load_shards(out_dir)
+        stores[encoding] = train
+        rows.append({'loader': 'shards (%s)' % encoding,
+                     'MB on disk': _size_mb(train.shards + validation.shards),
+                     'ingest images/s': len(paths) / elapsed})
+
+    loaders = {'JPEG files': lambda: make_dataset(source, args.batch_size)}
+    for encoding, train in stores.items():
+        loaders['shards (%s)' % encoding] = lambda train=train: train.dataset(args.batch_size)
+    for row in rows:
+        stats = summarize(time_batches(iter(loaders[row['loader']]()), args.batches,
+                                       args.warmup))
+        row.update({'read images/s': args.batch_size / stats['mean'],
+                    'batch ms (p50)': stats['median'] * 1e3,
+                    'peak RSS MB': _peak_rss_mb()})
+    print('%d images, %d batches of %d per loader' % (len(paths), args.batches,
+                                                       args.batch_size))
+    print_table(rows, ['loader', 'MB on disk', 'ingest images/s', 'read images/s',
+                       'batch ms (p50)', 'peak RSS MB'])
+
+
+if __name__ == '__main__':
+    main()
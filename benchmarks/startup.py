@@ -0,0 +1,75 @@
+"""Start-up cost of the command line against the old import-everything script.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --model ensemble_model.h5 --image cat.jpg
+
+Each case runs in a fresh interpreter `--repeats` times:
+
+* `--help`: parsing arguments only, nothing heavy is imported.
+* `import module`: importing project_for_nsdcwinter2024 as a library.
+* `old top-level imports`: TensorFlow, matplotlib, PIL and IPython, which the
+  script used to import (before doing any work) on every run.
+* `predict`: loading the saved model and classifying one image, when
+  `--model` and `--image` are given.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import print_table, summarize
+
+SCRIPT = 'project_for_nsdcwinter2024.py'
+
+OLD_IMPORTS = ('import requests, zipfile, os; '
+               'import matplotlib.pyplot as plt; import matplotlib.image as mpimg; '
+               'from tensorflow.keras.models import Sequential; '
+               'from tensorflow.keras import layers, Model; '
+               'from tensorflow.keras.preprocessing.image import ImageDataGenerator; '
+               'from tensorflow.keras.utils import plot_model; '
+               'from IPython.display import Image; '
+               'from PIL import Image, ImageDraw, ImageFont')
+
+
+def _time(cmd, repeats, cwd):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--model', default=None)
+    parser.add_argument('--image', default=None)
+    args = parser.parse_args(argv)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = os.path.join(root, SCRIPT)
+    cases = [
+        ('--help', [sys.executable, script, '--help']),
+        ('import module', [sys.executable, '-c', 'import project_for_nsdcwinter2024']),
+        ('old top-level imports', [sys.executable, '-c', OLD_IMPORTS]),
+    ]
+    if args.model and args.image:
+        cases.append(('predict', [sys.executable, script, '--model', args.model,
+                                  'predict', args.image]))
+
+    rows = []
+    for name, cmd in cases:
+        try:
+            stats = _time(cmd, args.repeats, root)
+        except subprocess.CalledProcessError:
+            rows.append({'case': name, 'mean s': None, 'min s': None, 'note': 'failed'})
+            continue
+        rows.append({'case': name, 'mean s': stats['mean'], 'min s': stats['min']})
+    print_table(rows, ['case', 'mean s', 'min s', 'note'])
+
+
+if __name__ == '__main__':
+    main()
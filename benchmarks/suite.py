@@ -0,0 +1,249 @@
+"""The whole CPU benchmark suite in one run, saved as JSON to compare against later runs.
+
+    python -m benchmarks.suite --synthetic 100 --out bench.json
+    python -m benchmarks.suite --data-dir /tmp/cats_and_dogs_filtered --compare bench.json
+
+It measures:
+
+    input      decode+resize throughput of `data_pipeline.make_dataset`, and the
+               decoded-image cache for reference (images/sec)
+    train      median train step time and peak RSS of every member and of
+               `ensemble_model`, each in its own subprocess so RSS is per model
+    inference  latency of the ensemble at batch size 1 and batched, through
+               `inference.InferenceEngine`
+
+GPUs are hidden and every process seeds Python, NumPy and TensorFlow with
+`--seed`. Each measurement runs `--warmup` untimed iterations first. Each
+entry in the JSON keeps its full repetition statistics, and the file records
+the machine, library versions and git commit. `--compare` prints the ratio
+to an earlier file for every shared metric and exits non-zero if any metric
+got worse by more than `--threshold`.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import (DEFAULT_DATA_DIR, make_synthetic_tree, print_table, summarize,
+                               time_batches)
+
+# Hide GPUs from this process and every worker it starts
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+
+
+def _entry(samples, unit, better, scale=1., per=None):
+    """A result entry from per-iteration seconds: `per / t` (a rate) or `t * scale`."""
+    values = [per / s for s in samples] if per else [s * scale for s in samples]
+    stats = summarize(values)
+    return {'value': stats['median'], 'unit': unit, 'better': better, 'stats': stats}
+
+
+def _seed(seed):
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+
+
+def _build(name):
+    from members import build_member
+
+    if name != 'ensemble':
+        return build_member(name)
+    from ensemble import build_ensemble, compile_ensemble
+    from members import build_members
+    return compile_ensemble(build_ensemble(build_members(compile=False).values()))
+
+
+def _train_worker(args):
+    import numpy as np
+
+    from image_cache import load_or_build
+
+    _seed(args.seed)
+    model = _build(args.worker)
+    batches = load_or_build(os.path.join(args.data_dir, 'train')).dataset(
+        args.batch_size, seed=args.seed)
+    # A few batches pulled up front and cycled, so the input pipeline isn't timed
+    batches = [tuple(np.asarray(t) for t in batch)
+               for batch, _ in zip(batches, range(min(args.warmup + args.repeats, 8)))]
+    samples = []
+    for step in range(args.warmup + args.repeats):
+        images, labels = batches[step % len(batches)]
+        start = time.perf_counter()
+        model.train_on_batch(images, labels)
+        if step >= args.warmup:
+            samples.append(time.perf_counter() - start)
+    # ru_maxrss is in KiB on Linux
+    print(json.dumps({'samples': samples,
+                      'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def bench_input(data_dir, args):
+    from data_pipeline import make_dataset
+    from image_cache import load_or_build
+
+    train_dir = os.path.join(data_dir, 'train')
+    sources = {
+        'tf.data decode+resize': lambda: make_dataset(train_dir, args.batch_size, seed=args.seed,
+                                                      deterministic=True),
+        'image cache': lambda: load_or_build(train_dir).dataset(args.batch_size, seed=args.seed),
+    }
+    results = {}
+    for name, build in sources.items():
+        samples = time_batches(iter(build()), args.batches, args.warmup)
+        results['input/%s images/s' % name] = _entry(samples, 'images/s', 'higher',
+                                                     per=args.batch_size)
+    return results
+
+
+def bench_train(data_dir, args):
+    from members import MEMBER_NAMES
+
+    results = {}
+    for name in list(args.models or MEMBER_NAMES + ('ensemble',)):
+        out = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.suite', '--worker', name, '--data-dir', data_dir,
+             '--seed', str(args.seed), '--warmup', str(args.warmup),
+             '--repeats', str(args.repeats), '--batch-size', str(args.batch_size)],
+            check=True, stdout=subprocess.PIPE, text=True).stdout
+        row = json.loads(out.strip().splitlines()[-1])
+        results['train/%s step ms' % name] = _entry(row['samples'], 'ms', 'lower', scale=1e3)
+        results['train/%s peak RSS MB' % name] = {
+            'value': row['peak_rss_mb'], 'unit': 'MB', 'better': 'lower'}
+    return results
+
+
+def bench_inference(args):
+    import numpy as np
+
+    from inference import InferenceEngine
+
+    model_path = args.model
+    if model_path is None:
+        model_path = os.path.join(tempfile.mkdtemp(), 'ensemble_model.h5')
+        _build('ensemble').save(model_path)
+
+    engine = InferenceEngine(model_path, max_batch_size=max(args.inference_batch_sizes))
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for batch_size in args.inference_batch_sizes:
+        images = rng.random((batch_size, 150, 150, 3), dtype=np.float32)
+        for _ in range(args.warmup):
+            engine.predict(images)
+        samples = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            engine.predict(images)
+            samples.append(time.perf_counter() - start)
+        results['inference/batch %d latency ms' % batch_size] = _entry(
+            samples, 'ms', 'lower', scale=1e3)
+        results['inference/batch %d images/s' % batch_size] = _entry(
+            samples, 'images/s', 'higher', per=batch_size)
+    engine.close()
+    return results
+
+
+def machine_info():
+    import numpy as np
+    import tensorflow as tf
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'platform': platform.platform(), 'processor': platform.processor(),
+            'cpu_count': os.cpu_count(), 'python': platform.python_version(),
+            'tensorflow': tf.__version__, 'numpy': np.__version__, 'commit': commit,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results, baseline, threshold):
+    """Rows of `new / old` per shared metric; `worse` is the relative regression."""
+    rows = []
+    for key, entry in results.items():
+        if key not in baseline:
+            continue
+        old, new = baseline[key]['value'], entry['value']
+        ratio = new / old if old else float('nan')
+        worse = ratio - 1 if entry['better'] == 'lower' else 1 / ratio - 1 if ratio else 0.
+        rows.append({'metric': key, 'old': old, 'new': new, 'ratio': ratio,
+                     'status': 'REGRESSED' if worse > threshold else 'ok'})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='generate N random JPEGs per class instead of using --data-dir')
+    parser.add_argument('--groups', nargs='+', choices=('input', 'train', 'inference'),
+                        default=['input', 'train', 'inference'])
+    parser.add_argument('--models', nargs='+', default=None,
+                        help="models to train-benchmark (default: every member and 'ensemble')")
+    parser.add_argument('--model', default=None,
+                        help='saved ensemble for inference (default: an untrained one)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=30)
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--inference-batch-sizes', type=int, nargs='+', default=[1, 32])
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--compare', default=None, metavar='JSON',
+                        help='earlier --out file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown counted as a regression (default: %(default)s)')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        return _train_worker(args)
+
+    data_dir = args.data_dir
+    if args.synthetic:
+        data_dir = make_synthetic_tree(
+            os.path.join(tempfile.gettempdir(), 'cats_and_dogs_synthetic'), args.synthetic)
+    _seed(args.seed)
+
+    from image_cache import load_or_build
+
+    # Built up front so neither the train workers nor the cache timing pay for decoding
+    for split in ('train', 'validation'):
+        load_or_build(os.path.join(data_dir, split))
+
+    results = {}
+    if 'input' in args.groups:
+        results.update(bench_input(data_dir, args))
+    if 'train' in args.groups:
+        results.update(bench_train(data_dir, args))
+    if 'inference' in args.groups:
+        results.update(bench_inference(args))
+
+    report = {'machine': machine_info(), 'config': vars(args), 'results': results}
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print_table([{'metric': key, 'median': e['value'], 'unit': e['unit'],
+                  'std': e.get('stats', {}).get('std')} for key, e in results.items()],
+                ['metric', 'median', 'unit', 'std'])
+    print('\nwritten to %s' % args.out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        rows = compare(results, baseline, args.threshold)
+        print()
+        print_table(rows, ['metric', 'old', 'new', 'ratio', 'status'])
+        if any(row['status'] != 'ok' for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
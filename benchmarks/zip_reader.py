@@ -0,0 +1,88 @@
+"""Time-to-first-batch: extract-then-read vs. streaming out of the zip.
+
+    python -m benchmarks.zip_reader --archive ~/.cache/cats_and_dogs/cats_and_dogs_filtered.zip
+    python -m benchmarks.zip_reader --synthetic 500
+
+"extract" runs `extractall` into a fresh directory and then pulls the first
+batch through `data_pipeline.make_dataset`; "zip" indexes the archive and
+pulls the first batch through `ZipImageArchive`. A full epoch is timed for both
+afterwards, and the disk space extraction would have used is reported.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+from benchmarks.common import make_synthetic_tree, print_table
+
+
+def _zip_tree(root, path):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for dirpath, _, files in os.walk(root):
+            for fname in files:
+                full = os.path.join(dirpath, fname)
+                zf.write(full, os.path.join('cats_and_dogs_filtered', os.path.relpath(full, root)))
+    return path
+
+
+def _epoch(dataset, steps):
+    start = time.perf_counter()
+    for _ in dataset.take(steps):
+        pass
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archive', default=None)
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='zip up N random JPEGs per class instead of using --archive')
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--readers', type=int, default=None,
+                        help='parallel zip readers (default: autotune)')
+    args = parser.parse_args(argv)
+
+    from data_pipeline import AUTOTUNE, make_dataset
+    from zip_reader import ZipImageArchive
+
+    work = tempfile.mkdtemp(prefix='zip_reader_bench_')
+    try:
+        archive = args.archive
+        if archive is None:
+            tree = make_synthetic_tree(os.path.join(work, 'tree'), args.synthetic or 500)
+            archive = _zip_tree(tree, os.path.join(work, 'cats_and_dogs_filtered.zip'))
+
+        start = time.perf_counter()
+        with zipfile.ZipFile(archive) as zf:
+            zf.extractall(os.path.join(work, 'extracted'))
+            footprint = sum(info.file_size for info in zf.infolist())
+        train_dir = os.path.join(work, 'extracted', 'cats_and_dogs_filtered', 'train')
+        extracted = make_dataset(train_dir, args.batch_size, repeat=False)
+        next(iter(extracted))
+        extract_first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        zipped = ZipImageArchive(archive)
+        split = zipped.split('train')
+        streamed = split.dataset(args.batch_size, repeat=False,
+                                 num_readers=args.readers or AUTOTUNE)
+        next(iter(streamed))
+        zip_first = time.perf_counter() - start
+
+        steps = -(-len(split) // args.batch_size)
+        print_table([
+            {'path': 'extract then read', 'first batch s': extract_first,
+             'epoch s': _epoch(extracted, steps), 'disk MB': footprint / 2**20},
+            {'path': 'stream from zip', 'first batch s': zip_first,
+             'epoch s': _epoch(streamed, steps), 'disk MB': 0.0},
+        ], ['path', 'first batch s', 'epoch s', 'disk MB'])
+        zipped.close()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
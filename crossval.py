@@ -0,0 +1,160 @@
+"""K-fold, multi-seed evaluation of the members on one shared decoded copy of the data.
+
+    results = cross_validate(train_dir, validation_dir, folds=5, seeds=(0, 1), epochs=15)
+    print(format_report(summarize(results)))
+
+The train and validation caches are pooled into one memory-mapped array
+(`image_cache.pool_caches`), decoded once. Each seed splits the pool into
+`folds` stratified folds. Every `(member, fold, seed)` job trains a fresh
+member on the other folds and evaluates it on the held-out fold. All members
+get the same number of steps per epoch (one pass over the training folds)
+and the same epochs. Model comparisons then rest on
+`folds x len(seeds)` runs each, not on one run per member against a single
+fixed split with per-member step counts.
+
+Jobs run in a pool of spawned worker processes with an even split of the
+cores, like `parallel_training`. Workers only memory-map the pooled arrays,
+so the OS page cache holds one copy of the images for all of them. Fold
+index arrays are a few KB per job. Each result is appended to a JSON-lines
+file as it arrives, and rerunning with the same file skips the jobs it
+already holds. A long 5-fold x 8-member run can therefore be stopped and
+picked up again.
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+
+def fold_indices(labels, folds=5, seed=0):
+    """`[(train, test)]` index arrays of `folds` stratified folds, shuffled with `seed`."""
+    if folds < 2:
+        raise ValueError('need at least 2 folds, got %d' % folds)
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    assignment = np.empty(len(labels), int)
+    for label in np.unique(labels):
+        members = rng.permutation(np.flatnonzero(labels == label))
+        # Deal each class out round-robin so every fold keeps the class balance
+        assignment[members] = (np.arange(len(members)) + rng.integers(folds)) % folds
+    return [(np.flatnonzero(assignment != k), np.flatnonzero(assignment == k))
+            for k in range(folds)]
+
+
+def _run_job(name, fold, folds, seed, cache_dir, train_indices, test_indices, epochs,
+             batch_size):
+    import tensorflow as tf
+
+    from image_cache import open_cache
+    from members import build_member
+
+    # Same seed, same initial weights in every fold: fold-to-fold spread is the data's
+    tf.keras.utils.set_random_seed(seed)
+    cache = open_cache(cache_dir)
+    model = build_member(name)
+    train = cache.dataset(batch_size, seed=seed, indices=train_indices)
+    test = cache.dataset(batch_size, shuffle=False, repeat=False, indices=test_indices)
+    start = time.perf_counter()
+    history = model.fit(train, steps_per_epoch=math.ceil(len(train_indices) / batch_size),
+                        epochs=epochs, verbose=0).history
+    scores = model.evaluate(test, verbose=0, return_dict=True)
+    return {
+        'member': name, 'fold': fold, 'folds': folds, 'seed': seed, 'epochs': epochs,
+        'batch_size': batch_size,
+        'loss': float(scores['loss']),
+        'accuracy': float(scores.get('accuracy', scores.get('acc'))),
+        'train_accuracy': float(history.get('accuracy', history.get('acc'))[-1]),
+        'wall_time': time.perf_counter() - start,
+        'pid': os.getpid(),
+    }
+
+
+def _read_results(path):
+    if path is None or not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def cross_validate(train_dir, validation_dir, names=None, folds=5, seeds=(0,), epochs=15,
+                   batch_size=20, workers=None, intra_op_threads=None, results_path=None,
+                   cache_dir=None, verbose=1):
+    """Train and evaluate every member on every fold for every seed; one dict per job.
+
+    `results_path` is a JSON-lines file that results are appended to as they
+    finish. Jobs it already holds (same member, fold, number of folds, seed,
+    epochs and batch size) are not run again. Rows from runs with other
+    settings are ignored, since a different fold count splits the data
+    differently.
+    """
+    from image_cache import default_cache_dir, load_or_build, pool_caches
+    from members import MEMBER_NAMES
+    from parallel_training import configure_threads, default_thread_budget
+
+    names = list(names or MEMBER_NAMES)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(default_cache_dir(train_dir)),
+                                 'pooled_' + os.path.basename(default_cache_dir(train_dir)))
+    pooled = pool_caches([load_or_build(train_dir), load_or_build(validation_dir)], cache_dir)
+
+    results = [r for r in _read_results(results_path)
+               if (r['epochs'], r.get('folds'), r.get('batch_size')) == (epochs, folds, batch_size)]
+    done = {(r['member'], r['fold'], r['seed']) for r in results}
+    jobs = []
+    for seed in seeds:
+        for fold, (train, test) in enumerate(fold_indices(pooled.labels, folds, seed)):
+            jobs += [(name, fold, seed, train, test) for name in names
+                     if (name, fold, seed) not in done]
+    results = [r for r in results if r['member'] in names and r['seed'] in seeds]
+    if verbose:
+        print('%d images in %d folds x %d seeds x %d members: %d jobs to run, %d already done'
+              % (len(pooled), folds, len(seeds), len(names), len(jobs), len(results)))
+    if not jobs:
+        return results
+
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    intra_op_threads = intra_op_threads or default_thread_budget(workers)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=configure_threads,
+                             initargs=(intra_op_threads, 1)) as pool:
+        futures = [pool.submit(_run_job, name, fold, folds, seed, cache_dir, train, test,
+                               epochs, batch_size)
+                   for name, fold, seed, train, test in jobs]
+        for i, future in enumerate(as_completed(futures)):
+            result = future.result()
+            results.append(result)
+            if results_path is not None:
+                with open(results_path, 'a') as f:
+                    f.write(json.dumps(result) + '\n')
+            if verbose:
+                print('[%d/%d] %s fold %d seed %d: val acc %.4f, loss %.4f (%.0fs, worker %d)'
+                      % (i + 1, len(jobs), result['member'], result['fold'], result['seed'],
+                         result['accuracy'], result['loss'], result['wall_time'],
+                         result['pid']))
+    if verbose:
+        print('%d jobs in %.0fs on %d workers' % (len(jobs), time.perf_counter() - start,
+                                                  workers))
+    return results
+
+
+def summarize(results):
+    """Mean and standard deviation of held-out accuracy and loss per member, best first."""
+    rows = []
+    for name in dict.fromkeys(r['member'] for r in results):
+        runs = [r for r in results if r['member'] == name]
+        accuracy = np.array([r['accuracy'] for r in runs])
+        loss = np.array([r['loss'] for r in runs])
+        ddof = 1 if len(runs) > 1 else 0
+        rows.append({'member': name, 'runs': len(runs),
+                     'acc mean': accuracy.mean(), 'acc std': accuracy.std(ddof=ddof),
+                     'loss mean': loss.mean(), 'loss std': loss.std(ddof=ddof),
+                     'train acc': np.mean([r['train_accuracy'] for r in runs]),
+                     'wall s': np.mean([r['wall_time'] for r in runs])})
+    return sorted(rows, key=lambda row: -row['acc mean'])
@@ -0,0 +1,195 @@
+"""Cached, checksum-verified download and extraction of cats_and_dogs_filtered.zip.
+
+The archive lives in a cache directory (`$CATS_DOGS_CACHE`, default
+`~/.cache/cats_and_dogs`) instead of the working directory. Interrupted
+downloads are kept as `<name>.part` and resumed with an HTTP Range request.
+Every complete archive gets a `<name>.sha256.json` sidecar recording its
+SHA-256, size and mtime, so later runs only re-hash it if the file changed;
+when an expected checksum is configured the archive must match it.
+
+Extraction writes a marker next to the extracted tree listing every member and
+its size. If the marker matches the archive and every file is still in place,
+extraction is skipped.
+
+Mirrors and pre-placed archives make this work offline: pass `mirrors=[...]`
+to try other URLs first, or `local_path=` to use an archive already on disk.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import zipfile
+
+DATA_URL = "https://storage.googleapis.com/mledu-datasets/cats_and_dogs_filtered.zip"
+DEFAULT_CACHE_DIR = os.environ.get(
+    'CATS_DOGS_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'cats_and_dogs'))
+
+
+class ChecksumError(Exception):
+    pass
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _sidecar(path):
+    return path + '.sha256.json'
+
+
+def archive_checksum(path):
+    """SHA-256 of `path`, reusing the sidecar if the file is unchanged since it was written."""
+    st = os.stat(path)
+    try:
+        with open(_sidecar(path)) as f:
+            record = json.load(f)
+        if record['size'] == st.st_size and record['mtime_ns'] == st.st_mtime_ns:
+            return record['sha256']
+    except (OSError, ValueError, KeyError):
+        pass
+    checksum = sha256_file(path)
+    with open(_sidecar(path), 'w') as f:
+        json.dump({'sha256': checksum, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}, f)
+    return checksum
+
+
+def verify_archive(path, sha256=None):
+    """True if `path` is a complete archive (matching `sha256` when given)."""
+    if not os.path.isfile(path):
+        return False
+    if sha256 is not None:
+        return archive_checksum(path) == sha256.lower()
+    # Without an expected checksum, trust archives we finished downloading
+    # (they have a sidecar) as long as they are still readable zips.
+    return os.path.exists(_sidecar(path)) and zipfile.is_zipfile(path)
+
+
+def _download(url, target, chunk_size=1 << 20, timeout=60):
+    import requests
+
+    partial = target + '.part'
+    offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+    headers = {'Range': 'bytes=%d-' % offset} if offset else {}
+    with requests.get(url, stream=True, headers=headers, timeout=timeout) as response:
+        if response.status_code == 416:
+            # Range not satisfiable: the partial file already holds everything
+            pass
+        else:
+            response.raise_for_status()
+            resumed = response.status_code == 206
+            if offset and not resumed:
+                print('Server ignored the Range request; restarting download')
+            elif offset:
+                print('Resuming download at %d bytes' % offset)
+            with open(partial, 'ab' if resumed else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+    os.replace(partial, target)
+
+
+def fetch_archive(url=DATA_URL, cache_dir=DEFAULT_CACHE_DIR, sha256=None, mirrors=(),
+                  local_path=None):
+    """Return the path of a verified archive, downloading it only if needed.
+
+    Sources are tried in order: `local_path`, the cached copy, each of
+    `mirrors`, then `url`. Raises `ChecksumError` if nothing matches `sha256`.
+    """
+    if local_path is not None:
+        if sha256 is not None and archive_checksum(local_path) != sha256.lower():
+            raise ChecksumError('%s does not match sha256 %s' % (local_path, sha256))
+        return local_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    target = os.path.join(cache_dir, os.path.basename(url))
+    if verify_archive(target, sha256):
+        return target
+
+    errors = []
+    for source in list(mirrors) + [url]:
+        try:
+            _download(source, target)
+        except Exception as e:  # try the next source, keeping the partial file
+            errors.append('%s: %s' % (source, e))
+            continue
+        checksum = archive_checksum(target)
+        if sha256 is not None and checksum != sha256.lower():
+            os.remove(target)
+            os.remove(_sidecar(target))
+            errors.append('%s: sha256 %s does not match %s' % (source, checksum, sha256))
+            continue
+        if not zipfile.is_zipfile(target):
+            os.remove(target)
+            os.remove(_sidecar(target))
+            errors.append('%s: not a zip file' % source)
+            continue
+        return target
+    raise ChecksumError('could not fetch a valid archive:\n  ' + '\n  '.join(errors))
+
+
+def _marker_path(archive, extract_to):
+    return os.path.join(extract_to, '.%s.extracted.json' % os.path.basename(archive))
+
+
+def extraction_intact(archive, extract_to):
+    """True if `extract_to` holds every file of `archive` at the right size."""
+    try:
+        with open(_marker_path(archive, extract_to)) as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if marker.get('archive_sha256') != archive_checksum(archive):
+        return False
+    for name, size in marker['files']:
+        try:
+            if os.path.getsize(os.path.join(extract_to, name)) != size:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def extract_archive(archive, extract_to='/tmp'):
+    """Extract `archive` into `extract_to` unless an intact copy is already there."""
+    if extraction_intact(archive, extract_to):
+        return False
+    with zipfile.ZipFile(archive) as zip_ref:
+        members = [info for info in zip_ref.infolist() if not info.is_dir()]
+        for top in {info.filename.split('/')[0] for info in members if '/' in info.filename}:
+            # Drop stale or half-extracted trees so removed files don't linger
+            shutil.rmtree(os.path.join(extract_to, top), ignore_errors=True)
+        zip_ref.extractall(extract_to)
+    with open(_marker_path(archive, extract_to), 'w') as f:
+        json.dump({'archive_sha256': archive_checksum(archive),
+                   'files': [[info.filename, info.file_size] for info in members]}, f)
+    return True
+
+
+def prepare_dataset(url=DATA_URL, cache_dir=DEFAULT_CACHE_DIR, extract_to='/tmp', sha256=None,
+                    mirrors=(), local_path=None, verbose=True, extract=True):
+    """Fetch (if needed) and extract (if needed) the dataset.
+
+    Returns the extracted base dir, or with `extract=False` the archive path
+    (for reading it in place with zip_reader.py).
+    """
+    start = time.perf_counter()
+    archive = fetch_archive(url, cache_dir, sha256, mirrors, local_path)
+    fetched = time.perf_counter()
+    if not extract:
+        if verbose:
+            print('archive %s ready in %.2fs' % (archive, fetched - start))
+        return archive
+    extracted = extract_archive(archive, extract_to)
+    done = time.perf_counter()
+    if verbose:
+        print('archive %s ready in %.2fs; %s in %.2fs' % (
+            archive, fetched - start,
+            'extracted' if extracted else 'extracted tree intact, skipped extraction',
+            done - fetched))
+    name = os.path.splitext(os.path.basename(archive))[0]
+    return os.path.join(extract_to, name)
@@ -0,0 +1,188 @@
+"""Distil the eight-member ensemble into one small student convnet.
+
+The teacher (the trained `ensemble_model`) is run once over the training set.
+Its probabilities are kept as soft targets, aligned with the decoded-image
+cache, and the student is fit to both those and the true labels:
+
+    loss = alpha * BCE(label, sigmoid(z)) + (1 - alpha) * T^2 * BCE(soft_T, sigmoid(z / T))
+
+Here `z` is the student's logit and `soft_T = sigmoid(logit(p_teacher) / T)`.
+A temperature `T > 1` softens both sides, so the student also learns how
+confident the teacher was and not just which side of 0.5 it landed on.
+
+Students are member-style specs (see members.py), so any spec in
+`STUDENT_SPECS`, or a new dict in the same format, can be distilled into.
+`compare` reports params, FLOPs, latency and validation accuracy for teacher
+vs. student.
+"""
+
+import os
+
+import numpy as np
+
+from members import INPUT_SHAPE, build_from_spec, make_optimizer
+
+STUDENT_SPECS = {
+    'small': {
+        'layers': [
+            ('conv', {'filters': 16, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 32, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 64, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 64, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('flatten', {}),
+            ('dense', {'units': 64}),
+        ],
+        'optimizer': ('Adam', {'learning_rate': 0.001}),
+    },
+    'tiny': {
+        'layers': [
+            ('conv', {'filters': 8, 'kernel_size': 3, 'strides': 2}),
+            ('conv', {'filters': 16, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 32, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 32, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('flatten', {}),
+            ('dense', {'units': 32}),
+        ],
+        'optimizer': ('Adam', {'learning_rate': 0.002}),
+    },
+}
+
+
+def soft_targets(teacher, cache, batch_size=64, path=None, key=None):
+    """The teacher's probability for every image of `cache`, in cache order.
+
+    With `path` the result is saved there as `.npz` and reused on later calls
+    as long as it was computed for the same `key` (e.g. the teacher file's
+    size and mtime) and the same number of images.
+    """
+    from evaluation import keras_predictor
+
+    if path is not None and os.path.exists(path):
+        saved = np.load(path)
+        if str(saved['key']) == str(key) and len(saved['targets']) == len(cache):
+            return saved['targets']
+
+    predict = keras_predictor(teacher)
+    targets = np.concatenate([predict(np.asarray(cache.images[i:i + batch_size]))
+                              for i in range(0, len(cache), batch_size)]).astype(np.float32)
+    if path is not None:
+        np.savez(path, targets=targets, key=str(key))
+    return targets
+
+
+def distillation_loss(temperature=4.0, alpha=0.1):
+    """Keras loss over logits; `y_true` columns are `[label, teacher probability]`."""
+    import tensorflow as tf
+
+    def loss(y_true, logits):
+        labels, teacher = y_true[:, :1], y_true[:, 1:2]
+        teacher = tf.clip_by_value(teacher, 1e-7, 1 - 1e-7)
+        soft = tf.sigmoid((tf.math.log(teacher) - tf.math.log1p(-teacher)) / temperature)
+        hard_loss = tf.nn.sigmoid_cross_entropy_with_logits(labels, logits)
+        soft_loss = tf.nn.sigmoid_cross_entropy_with_logits(soft, logits / temperature)
+        return tf.reduce_mean(alpha * hard_loss + (1 - alpha) * temperature ** 2 * soft_loss)
+    return loss
+
+
+def label_accuracy(y_true, logits):
+    import tensorflow as tf
+
+    return tf.reduce_mean(tf.cast(tf.equal(y_true[:, :1] > 0.5, logits > 0), tf.float32))
+
+
+def label_loss(y_true, logits):
+    """Plain binary cross-entropy against the true labels, comparable to the members' loss."""
+    import tensorflow as tf
+
+    return tf.reduce_mean(tf.nn.sigmoid_cross_entropy_with_logits(y_true[:, :1], logits))
+
+
+def build_student(spec='small', name='student'):
+    """Uncompiled student that ends in a logit; `spec` is a name or a spec dict."""
+    spec = STUDENT_SPECS[spec] if isinstance(spec, str) else spec
+    return build_from_spec(spec, name=name + '_logits', output_activation=None)
+
+
+def with_sigmoid(logits_model, name='student'):
+    """Wrap a logit model so it returns probabilities like the ensemble."""
+    from tensorflow.keras import Model, layers
+
+    inputs = layers.Input(shape=INPUT_SHAPE)
+    outputs = layers.Activation('sigmoid', dtype='float32')(logits_model(inputs))
+    model = Model(inputs, outputs, name=name)
+    model.compile(loss='binary_crossentropy', optimizer='rmsprop', metrics=['accuracy'])
+    return model
+
+
+def distill(teacher, train_cache, validation_cache=None, student='small', temperature=4.0,
+            alpha=0.1, epochs=15, batch_size=20, targets_path=None, targets_key=None,
+            verbose=2):
+    """Fit a student to `teacher` on the images of `train_cache`.
+
+    Returns `(student_model, history)`. The student model outputs
+    probabilities and can be saved and served like `ensemble_model`.
+    `label_loss` and `label_accuracy` in the history are measured against the
+    true labels alone, on both the training and validation sets.
+    """
+    spec = STUDENT_SPECS[student] if isinstance(student, str) else student
+    targets = soft_targets(teacher, train_cache, path=targets_path, key=targets_key)
+
+    logits_model = build_student(spec)
+    logits_model.compile(optimizer=make_optimizer(spec),
+                         loss=distillation_loss(temperature, alpha),
+                         metrics=[label_loss, label_accuracy])
+    validation = None
+    if validation_cache is not None:
+        # Hard labels in both columns. val_loss then scores T^2-scaled soft terms against
+        # 0/1 targets and is not comparable to the training loss. Compare
+        # val_label_loss and val_label_accuracy instead.
+        val_labels = np.asarray(validation_cache.labels)
+        validation = validation_cache.dataset(batch_size, shuffle=False, repeat=False,
+                                              targets=val_labels)
+    history = logits_model.fit(
+        train_cache.dataset(batch_size, repeat=False, targets=targets),
+        epochs=epochs, validation_data=validation, verbose=verbose)
+    return with_sigmoid(logits_model), history
+
+
+def count_flops(model):
+    """FLOPs of one forward pass of one image, counting a multiply-add as 2.
+
+    Only convolutions and dense layers are counted (pooling, batchnorm and
+    activations are comparatively free); nested models are walked.
+    """
+    from tensorflow.keras import layers
+
+    flops = 0
+    for layer in model.layers:
+        if hasattr(layer, 'layers'):
+            flops += count_flops(layer)
+        elif isinstance(layer, layers.Conv2D):
+            kernel_h, kernel_w, channels_in, channels_out = layer.kernel.shape
+            _, out_h, out_w, _ = layer.output.shape
+            flops += 2 * out_h * out_w * kernel_h * kernel_w * channels_in * channels_out
+        elif isinstance(layer, layers.Dense):
+            units_in, units_out = layer.kernel.shape
+            flops += 2 * units_in * units_out
+    return int(flops)
+
+
+def compare(models, validation_cache, batch_size=32, latency_runs=50):
+    """Params, FLOPs, single-image latency and validation accuracy of each `{name: model}`."""
+    from evaluation import evaluate, keras_predictor
+
+    rows = []
+    for name, model in models.items():
+        accuracy, latency = evaluate(keras_predictor(model), validation_cache,
+                                     batch_size, latency_runs)
+        rows.append({'model': name, 'params': model.count_params(),
+                     'MFLOPs': count_flops(model) / 1e6, 'latency ms': 1000 * latency,
+                     'accuracy': accuracy})
+    return rows
@@ -0,0 +1,124 @@
+"""The ensemble: eight member convnets averaged, followed by a small dense head.
+
+`build_ensemble` wires already-trained members onto one input, averages their
+sigmoid outputs with `Average()` and feeds the average through the head. The
+members are frozen by default, and since frozen members are fixed functions of
+the image, `train_ensemble_head` never runs them inside the training loop:
+their predictions for the training and validation sets are computed once into
+a feature table and only the dense/dropout/batchnorm head is fit on it.
+"""
+
+import time
+
+import numpy as np
+from tensorflow.keras import Model, layers
+from tensorflow.keras.optimizers import RMSprop
+
+from members import INPUT_SHAPE
+
+
+def build_head():
+    """The dense head that turns the averaged member probability into the final one."""
+    average = layers.Input(shape=(1,), name='member_average')
+    # Add additional layers to increase complexity
+    x = layers.Dense(256, activation='relu')(average)
+    x = layers.Dropout(0.5)(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.Dense(128, activation='relu')(x)
+    x = layers.Dropout(0.5)(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.Dense(64, activation='relu')(x)
+    x = layers.Dropout(0.5)(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.Dense(32, activation='relu')(x)
+    x = layers.LeakyReLU()(x)
+    # Kept in float32 under mixed precision policies
+    output = layers.Dense(1, activation='sigmoid', dtype='float32')(x)
+    return Model(average, output, name='ensemble_head')
+
+
+def compile_ensemble(model, jit_compile=False):
+    from precision import compile_kwargs
+
+    model.compile(loss='binary_crossentropy',
+                  optimizer=RMSprop(learning_rate=0.001),
+                  metrics=['accuracy'],
+                  **compile_kwargs(jit_compile))
+    return model
+
+
+def build_ensemble(members, head=None, freeze_members=True):
+    """Average `members` (a list of models, in order) and put `head` on top.
+
+    With `freeze_members` the members' weights are excluded from training and
+    their batchnorm layers run in inference mode.
+    """
+    members = list(members)
+    if freeze_members:
+        for member in members:
+            member.trainable = False
+    input_layer = layers.Input(shape=INPUT_SHAPE)
+    average_output = layers.Average()([member(input_layer) for member in members])
+    head = head if head is not None else build_head()
+    return Model(inputs=input_layer, outputs=head(average_output), name='ensemble_model')
+
+
+def member_predictions(members, data, steps=None):
+    """Predict every member over one pass of `data`.
+
+    `data` yields `(images, labels)` batches and should not shuffle or repeat
+    (or pass `steps`). Returns `(features, labels)` where `features` is
+    `(N, len(members))`, one column per member.
+    """
+    members = list(members)
+    input_layer = layers.Input(shape=INPUT_SHAPE)
+    towers = Model(input_layer, layers.Concatenate()([m(input_layer) for m in members]))
+
+    features, labels = [], []
+    for step, (images, batch_labels) in enumerate(data):
+        if steps is not None and step >= steps:
+            break
+        features.append(towers.predict_on_batch(images))
+        labels.append(np.asarray(batch_labels))
+    return (np.concatenate(features).astype(np.float32),
+            np.concatenate(labels).astype(np.float32))
+
+
+def train_ensemble_head(members, train_data, validation_data=None, train_steps=None,
+                        validation_steps=None, epochs=15, batch_size=20, verbose=2,
+                        jit_compile=False, harness=None, callbacks=()):
+    """Freeze `members`, cache their predictions and fit only the head.
+
+    Returns `(ensemble_model, history, timings)`; the ensemble is compiled and
+    shares the trained head, and `timings` splits the cost into the one-off
+    feature pass and the head fit. With a `harness.TrainingHarness` the head
+    fit stops early, checkpoints and resumes. `callbacks` are passed to the
+    head's `fit`.
+    """
+    members = list(members)
+    for member in members:
+        member.trainable = False
+
+    start = time.perf_counter()
+    train_features, train_labels = member_predictions(members, train_data, train_steps)
+    validation = None
+    if validation_data is not None:
+        val_features, val_labels = member_predictions(members, validation_data, validation_steps)
+        validation = (val_features.mean(axis=1, keepdims=True), val_labels)
+    features_time = time.perf_counter() - start
+
+    head = compile_ensemble(build_head(), jit_compile)
+    start = time.perf_counter()
+    fit_kwargs = dict(batch_size=batch_size, epochs=epochs, validation_data=validation,
+                      shuffle=True, verbose=verbose)
+    if harness is not None:
+        from harness import resumable_fit
+        history = resumable_fit(head, train_features.mean(axis=1, keepdims=True), harness,
+                                y=train_labels, callbacks=callbacks, **fit_kwargs)
+    else:
+        history = head.fit(train_features.mean(axis=1, keepdims=True), train_labels,
+                           callbacks=list(callbacks), **fit_kwargs)
+    head_time = time.perf_counter() - start
+
+    ensemble_model = compile_ensemble(build_ensemble(members, head=head), jit_compile)
+    return ensemble_model, history, {'features': features_time, 'head_fit': head_time}
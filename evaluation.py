@@ -0,0 +1,66 @@
+"""Model-agnostic evaluation helpers shared by the training, export and analysis steps.
+
+    predict = keras_predictor(model)                      # or TFLiteModel(path).predict
+    accuracy, latency = evaluate(predict, validation_cache)
+    print(format_report(rows))
+
+`member_models` pulls the `model_*` towers out of a saved ensemble, and
+`format_report` renders a list of dicts as the plain-text tables every
+command prints.
+"""
+
+import time
+
+import numpy as np
+
+from members import INPUT_SHAPE
+
+
+def member_models(ensemble_model):
+    """`{name: member}` for the `model_*` towers inside a (loaded) ensemble."""
+    return {layer.name[len('model_'):]: layer for layer in ensemble_model.layers
+            if layer.name.startswith('model_')}
+
+
+def keras_predictor(model):
+    """`predict(images)` for an in-memory Keras model, traced once for any batch size."""
+    import tensorflow as tf
+
+    forward = tf.function(lambda images: model(images, training=False),
+                          input_signature=[tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32)])
+
+    def predict(images):
+        if images.dtype == np.uint8:
+            images = images.astype(np.float32) / 255.
+        return forward(images).numpy().reshape(-1)
+    return predict
+
+
+def evaluate(predict, cache, batch_size=32, latency_runs=50):
+    """`(accuracy, median single-image latency in s)` of `predict` over an `ImageCache`."""
+    # Latency first, on the first image, after one warm-up call
+    image = cache.images[:1]
+    predict(image)
+    latencies = []
+    for _ in range(latency_runs):
+        start = time.perf_counter()
+        predict(image)
+        latencies.append(time.perf_counter() - start)
+
+    probabilities = np.concatenate([predict(np.asarray(cache.images[i:i + batch_size]))
+                                    for i in range(0, len(cache), batch_size)])
+    accuracy = float(np.mean((probabilities > 0.5) == (cache.labels > 0.5)))
+    return accuracy, float(np.median(latencies)) if latencies else float('nan')
+
+
+def format_report(rows, columns=None):
+    """Plain-text table of `rows` (dicts), in `columns` order (default: the first row's)."""
+    columns = columns or list(rows[0])
+    cells = [[row[c] if isinstance(row[c], str) else
+              '%d' % row[c] if isinstance(row[c], int) else '%.4g' % row[c] for c in columns]
+             for row in rows]
+    widths = [max([len(c)] + [len(line[i]) for line in cells]) for i, c in enumerate(columns)]
+    lines = ['  '.join(c.ljust(w) for c, w in zip(columns, widths)),
+             '  '.join('-' * w for w in widths)]
+    lines += ['  '.join(c.ljust(w) for c, w in zip(line, widths)) for line in cells]
+    return '\n'.join(lines)
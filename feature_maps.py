@@ -0,0 +1,82 @@
+"""Render the conv/pool feature maps of any member as image grids, vectorised.
+
+    grids = render(model, images)                       # {layer name: uint8 (N, rows*H, cols*W)}
+    write_feature_maps(model, images, 'figs')           # headless PNGs, one per layer and image
+
+Every channel of every image is normalised in a single NumPy expression per
+layer. The old code normalised one channel at a time in Python, which
+divided by zero on dead (constant) channels. A channel with zero variance now
+renders as flat mid-grey. Grids are assembled with a reshape/transpose
+instead of copying channel by channel. With the default `columns=None`
+they are one horizontal strip, as the notebook plotted them.
+"""
+
+import os
+
+import numpy as np
+
+
+def feature_extractor(model):
+    """`(extractor, layer names)`: a model returning every 4-D (conv/pool) output of `model`."""
+    from tensorflow.keras import Model
+
+    layers = [layer for layer in model.layers if len(layer.output.shape) == 4]
+    extractor = Model(inputs=model.inputs, outputs=[layer.output for layer in layers])
+    return extractor, [layer.name for layer in layers]
+
+
+def normalize(maps):
+    """Per-channel `(x - mean) / std * 64 + 128` of `(N, H, W, C)` maps, as uint8."""
+    maps = np.asarray(maps, np.float32)
+    centred = maps - maps.mean(axis=(1, 2), keepdims=True)
+    std = centred.std(axis=(1, 2), keepdims=True)
+    scaled = centred * np.divide(64., std, out=np.zeros_like(std), where=std > 0)
+    return np.clip(scaled + 128., 0, 255).astype(np.uint8)
+
+
+def tile(maps, columns=None):
+    """Lay out `(N, H, W, C)` maps as `(N, rows*H, columns*W)` grids, channel-major.
+
+    `columns=None` puts every channel in one row. Missing cells in the last
+    row are zero.
+    """
+    n, height, width, channels = maps.shape
+    columns = columns or channels
+    rows = -(-channels // columns)
+    if rows * columns != channels:
+        maps = np.concatenate(
+            [maps, np.zeros((n, height, width, rows * columns - channels), maps.dtype)], axis=-1)
+    grid = maps.reshape(n, height, width, rows, columns).transpose(0, 3, 1, 4, 2)
+    return grid.reshape(n, rows * height, columns * width)
+
+
+def render(model, images, columns=None, batch_size=32):
+    """`{layer name: uint8 grids}` for `images`, float32 `(N, 150, 150, 3)` in `[0, 1]`."""
+    extractor, names = feature_extractor(model)
+    images = np.asarray(images, np.float32)
+    outputs = [extractor.predict_on_batch(images[i:i + batch_size])
+               for i in range(0, len(images), batch_size)]
+    grids = {}
+    for layer_index, name in enumerate(names):
+        maps = np.concatenate([np.asarray(out[layer_index]) for out in outputs])
+        grids[name] = tile(normalize(maps), columns)
+    return grids
+
+
+def write_feature_maps(model, images, out_dir, columns=None, cmap='viridis', prefix='features_'):
+    """Write every layer's grid for every image to `out_dir` as PNG; returns the paths.
+
+    Files are `<prefix><layer>.png` for a single image and
+    `<prefix><layer>_<i>.png` for batches. No figure or display is needed.
+    """
+    from matplotlib.image import imsave
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, grids in render(model, images, columns).items():
+        for i, grid in enumerate(grids):
+            suffix = '_%d' % i if len(grids) > 1 else ''
+            path = os.path.join(out_dir, '%s%s%s.png' % (prefix, name, suffix))
+            imsave(path, grid, cmap=cmap, vmin=0, vmax=255)
+            paths.append(path)
+    return paths
@@ -0,0 +1,217 @@
+"""Early stopping, best-weight restoration and resumable checkpoints for every fit.
+
+`TrainingHarness` is a Keras callback, so the same object plugs into
+`model.fit` (the ensemble head, the parallel workers) and into
+`multi_trainer.fit_members`, which drives the epoch hooks for every member.
+Per model it keeps
+
+    <run_dir>/<name>/last.weights.h5      weights after the last saved epoch
+    <run_dir>/<name>/last.optimizer.npz   the optimizer's variables at that point
+    <run_dir>/<name>/best.weights.h5      weights of the best epoch so far
+    <run_dir>/<name>/state.json           epochs done, early-stopping counters, history
+
+Each file is written under a temporary name and moved into place, and
+`state.json` is written last. A run killed mid-save therefore resumes from
+the previous checkpoint. `resume` loads the checkpoint back into a freshly
+built model and returns the epoch to continue from. A model that had
+already stopped early (or finished) is not trained again. A harness's `key`
+(e.g. the state of the inputs a model was trained on) is saved with its
+checkpoint, and a checkpoint saved under another key is not resumed.
+
+    harnesses = make_harnesses(models, 'checkpoints', patience=3)
+    histories = resumable_fit_members(models, train, harnesses, steps_per_epoch=100, epochs=15)
+    print(format_report(savings_report(harnesses, 15, 100)))   # from evaluation.py
+"""
+
+import json
+import os
+
+import numpy as np
+from tensorflow.keras.callbacks import Callback, History
+
+_LAST_WEIGHTS = 'last.weights.h5'
+_LAST_OPTIMIZER = 'last.optimizer.npz'
+_BEST_WEIGHTS = 'best.weights.h5'
+_STATE = 'state.json'
+
+
+class TrainingHarness(Callback):
+    """Early stopping on `monitor` plus per-epoch checkpoints in `directory`.
+
+    `patience=None` never stops early, and `directory=None` keeps the best
+    weights in memory only. With `restore_best_weights` the model ends
+    training with the weights of its best epoch. `key` is any JSON value the
+    checkpoint is only valid for; it can also be set after construction.
+    """
+
+    def __init__(self, directory=None, monitor='val_loss', mode='min', patience=3,
+                 min_delta=0., restore_best_weights=True, save_every=1, key=None):
+        super().__init__()
+        if mode not in ('min', 'max'):
+            raise ValueError("mode must be 'min' or 'max', got %r" % (mode,))
+        self.directory = directory
+        self.monitor = monitor
+        self.sign = 1. if mode == 'min' else -1.
+        self.patience = patience
+        self.min_delta = min_delta
+        self.restore_best_weights = restore_best_weights
+        self.save_every = save_every
+        self.key = key
+        self.best = None
+        self.best_epoch = None
+        self.wait = 0
+        self.stopped = False
+        self.completed = 0
+        self.resumed_from = 0
+        self.history = {}
+        self._best_weights = None
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def resume(self, model):
+        """Load the last checkpoint into `model`; returns the epoch to continue from."""
+        self.set_model(model)
+        if self.directory is None:
+            return 0
+        try:
+            with open(self._path(_STATE)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        # Round-trip through JSON so tuples and lists compare equal
+        if state.get('key') != json.loads(json.dumps(self.key)):
+            print('%s was saved for other inputs; starting over' % self.directory)
+            return 0
+        # Built first so the weight files' optimizer entries have somewhere to go
+        if not model.optimizer.built:
+            model.optimizer.build(model.trainable_variables)
+        if self.restore_best_weights and os.path.exists(self._path(_BEST_WEIGHTS)):
+            model.load_weights(self._path(_BEST_WEIGHTS))
+            self._best_weights = model.get_weights()
+        model.load_weights(self._path(_LAST_WEIGHTS))
+        with np.load(self._path(_LAST_OPTIMIZER)) as saved:
+            values = [saved['arr_%d' % i] for i in range(len(saved.files))]
+        for variable, value in zip(model.optimizer.variables, values):
+            variable.assign(value)
+
+        self.best = state['best']
+        self.best_epoch = state['best_epoch']
+        self.wait = state['wait']
+        self.stopped = state['stopped']
+        self.completed = self.resumed_from = state['completed']
+        self.history = state['history']
+        return self.completed
+
+    def _replace(self, save, filename):
+        # Keras insists on the '.weights.h5' suffix, so keep it on the temporary name
+        tmp = self._path('tmp.' + filename)
+        save(tmp)
+        os.replace(tmp, self._path(filename))
+
+    def save(self):
+        """Checkpoint the model, its optimizer and the harness state."""
+        state = {'completed': self.completed, 'best': self.best, 'best_epoch': self.best_epoch,
+                 'wait': self.wait, 'stopped': self.stopped, 'monitor': self.monitor,
+                 'history': self.history, 'key': self.key}
+
+        def save_optimizer(path):
+            with open(path, 'wb') as f:
+                np.savez(f, *[v.numpy() for v in self.model.optimizer.variables])
+
+        def save_state(path):
+            with open(path, 'w') as f:
+                json.dump(state, f)
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._replace(self.model.save_weights, _LAST_WEIGHTS)
+        self._replace(save_optimizer, _LAST_OPTIMIZER)
+        self._replace(save_state, _STATE)
+
+    def restore_best(self):
+        if self.restore_best_weights and self._best_weights is not None:
+            self.model.set_weights(self._best_weights)
+
+    def on_train_begin(self, logs=None):
+        self.model.stop_training = self.stopped
+
+    def on_epoch_end(self, epoch, logs=None):
+        for k, v in (logs or {}).items():
+            self.history.setdefault(k, []).append(float(v))
+        self.completed = epoch + 1
+        current = (logs or {}).get(self.monitor)
+        if current is not None:
+            current = float(current)
+            if self.best is None or self.sign * (self.best - current) > self.min_delta:
+                self.best, self.best_epoch, self.wait = current, epoch, 0
+                self._best_weights = self.model.get_weights()
+                if self.directory is not None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    self._replace(self.model.save_weights, _BEST_WEIGHTS)
+            else:
+                self.wait += 1
+                if self.patience is not None and self.wait >= self.patience:
+                    self.stopped = self.model.stop_training = True
+        if self.directory is not None and (self.completed % self.save_every == 0 or self.stopped):
+            self.save()
+
+    def on_train_end(self, logs=None):
+        if self.directory is not None and self.completed > self.resumed_from:
+            self.save()
+        self.restore_best()
+
+    def to_history(self):
+        """A `History` holding every epoch, including the ones before a resume."""
+        history = History()
+        history.set_model(self.model)
+        history.history = {k: list(v) for k, v in self.history.items()}
+        history.epoch = list(range(self.completed))
+        return history
+
+
+def make_harnesses(names, run_dir=None, **kwargs):
+    """`{name: TrainingHarness}` checkpointing under `run_dir/<name>` (if given)."""
+    return {name: TrainingHarness(os.path.join(run_dir, name) if run_dir else None, **kwargs)
+            for name in names}
+
+
+def resumable_fit(model, x, harness, epochs=1, callbacks=(), **fit_kwargs):
+    """`model.fit` under `harness`, continuing from its last checkpoint.
+
+    Returns a `History` covering every epoch of the run, resumed or not.
+    """
+    initial_epoch = harness.resume(model)
+    if initial_epoch < epochs and not harness.stopped:
+        model.fit(x, epochs=epochs, initial_epoch=initial_epoch,
+                  callbacks=[harness] + list(callbacks), **fit_kwargs)
+    else:
+        harness.restore_best()
+    return harness.to_history()
+
+
+def resumable_fit_members(models, x, harnesses, epochs=1, **kwargs):
+    """`multi_trainer.fit_members` with one harness per member, resuming each one."""
+    from multi_trainer import fit_members
+
+    initial_epoch = {name: harnesses[name].resume(model) for name, model in models.items()}
+    fit_members(models, x, epochs=epochs, initial_epoch=initial_epoch,
+                callbacks={name: [harnesses[name]] for name in models}, **kwargs)
+    return {name: harnesses[name].to_history() for name in models}
+
+
+def savings_report(harnesses, epochs, steps_per_epoch):
+    """Epochs and train steps run vs. the fixed `epochs` schedule, per model.
+
+    `steps_per_epoch` is one number or a `{name: steps}` dict. Epochs run
+    before a resume count as run, not as saved.
+    """
+    rows = []
+    for name, harness in harnesses.items():
+        steps = steps_per_epoch[name] if isinstance(steps_per_epoch, dict) else steps_per_epoch
+        rows.append({'model': name, 'epochs run': harness.completed,
+                     'best epoch': -1 if harness.best_epoch is None else harness.best_epoch + 1,
+                     'resumed at': harness.resumed_from,
+                     'steps saved': (epochs - harness.completed) * steps,
+                     'saved %': 100. * (epochs - harness.completed) / epochs})
+    return rows
+
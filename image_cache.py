@@ -0,0 +1,216 @@
+"""Decode-once image cache backed by memory-mapped uint8 arrays.
+
+Every training run used to decode and resize the same JPEGs once per epoch per
+model. `load_or_build` decodes a `train`/`validation` directory a single time
+into a cache directory holding
+
+    images.npy     uint8 (N, 150, 150, 3), opened with mmap_mode='r'
+    labels.npy     float32 (N,)
+    manifest.json  relative path, size and mtime of every source file
+
+and on later calls only re-stats the source tree. If any file was added,
+removed or touched (or the target size changed) the cache is rebuilt.
+`ImageCache.dataset` gathers batches straight out of the mapped pages, so the
+only copy made is the batch handed to TensorFlow.
+"""
+
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import (AUTOTUNE, IMAGE_SIZE, decode_and_resize,
+                           list_image_files, rescale)
+
+CACHE_VERSION = 1
+
+_IMAGES = 'images.npy'
+_LABELS = 'labels.npy'
+_MANIFEST = 'manifest.json'
+
+
+class ImageCache:
+    """Decoded images and labels of one directory tree, memory-mapped read-only."""
+
+    def __init__(self, cache_dir, manifest):
+        self.cache_dir = cache_dir
+        self.manifest = manifest
+        self.class_names = manifest['class_names']
+        self.images = np.load(os.path.join(cache_dir, _IMAGES), mmap_mode='r')
+        self.labels = np.load(os.path.join(cache_dir, _LABELS), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _gather(self, indices):
+        # Sorted indices turn the gather into mostly sequential page reads
+        indices = np.sort(indices)
+        return self.images[indices], self.labels[indices]
+
+    def _gather_with(self, targets):
+        def gather(indices):
+            indices = np.sort(indices)
+            return self.images[indices], np.column_stack([self.labels[indices], targets[indices]])
+        return gather
+
+    def dataset(self, batch_size=20, shuffle=True, seed=None, repeat=True,
+                num_parallel_calls=AUTOTUNE, targets=None, indices=None):
+        """Batched float32 `[0, 1]` dataset with the flow_from_directory contract.
+
+        `targets` is an optional float32 array with one row per image (e.g. a
+        teacher's predictions). It is stacked next to the labels, so each
+        batch's labels become `(batch, 1 + targets per image)`. `indices`
+        restricts the dataset to those images (e.g. one cross-validation fold).
+        """
+        height, width = self.images.shape[1:3]
+        gather_fn, label_shape = self._gather, (None,)
+        if targets is not None:
+            targets = np.asarray(targets, np.float32).reshape(len(self), -1)
+            gather_fn, label_shape = self._gather_with(targets), (None, 1 + targets.shape[1])
+        if indices is None:
+            ds = tf.data.Dataset.range(len(self))
+        else:
+            ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices, np.int64))
+        if shuffle:
+            ds = ds.shuffle(ds.cardinality(), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size)
+
+        def gather(indices):
+            images, labels = tf.numpy_function(
+                gather_fn, [indices], (tf.uint8, tf.float32), stateful=False)
+            images.set_shape((None, height, width, 3))
+            labels.set_shape(label_shape)
+            return images, labels
+
+        ds = ds.map(gather, num_parallel_calls=num_parallel_calls)
+        ds = ds.map(rescale, num_parallel_calls=num_parallel_calls)
+        if repeat:
+            ds = ds.repeat()
+        return ds.prefetch(AUTOTUNE)
+
+
+def default_cache_dir(directory, target_size=IMAGE_SIZE):
+    """`/tmp/cats_and_dogs_filtered/train` -> `/tmp/cats_and_dogs_filtered/.cache/train_150x150`."""
+    directory = os.path.abspath(directory)
+    return os.path.join(os.path.dirname(directory), '.cache', '%s_%dx%d' % (
+        (os.path.basename(directory),) + tuple(target_size)))
+
+
+def build_manifest(directory, target_size=IMAGE_SIZE, interpolation='nearest'):
+    """Describe the current state of `directory`; two equal manifests mean an equal cache."""
+    paths, labels, class_names = list_image_files(directory)
+    entries = []
+    for path, label in zip(paths, labels):
+        st = os.stat(path)
+        entries.append([os.path.relpath(path, directory), st.st_size, st.st_mtime_ns, label])
+    return {
+        'version': CACHE_VERSION,
+        'target_size': list(target_size),
+        'interpolation': interpolation,
+        'class_names': class_names,
+        'files': entries,
+    }
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, _MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(cache_dir, manifest, shape, labels, fill):
+    """Write a cache's arrays and then its manifest, so a crash leaves no valid-looking cache.
+
+    `fill(images)` writes the uint8 images into the `shape` memmap it is given.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    # The manifest is the commit marker: drop it first so a crash mid-build
+    # can never leave a manifest pointing at half-written arrays.
+    manifest_path = os.path.join(cache_dir, _MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    images_tmp = os.path.join(cache_dir, _IMAGES + '.tmp')
+    images = np.lib.format.open_memmap(images_tmp, mode='w+', dtype=np.uint8, shape=shape)
+    fill(images)
+    images.flush()
+    del images
+    os.replace(images_tmp, os.path.join(cache_dir, _IMAGES))
+    np.save(os.path.join(cache_dir, _LABELS), labels)
+
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def _build(directory, cache_dir, manifest, num_parallel_calls):
+    target_size = tuple(manifest['target_size'])
+    paths = [os.path.join(directory, entry[0]) for entry in manifest['files']]
+    labels = np.asarray([entry[3] for entry in manifest['files']], dtype=np.float32)
+
+    def fill(images):
+        decoded = tf.data.Dataset.from_tensor_slices(paths).map(
+            lambda path: decode_and_resize(path, target_size, manifest['interpolation']),
+            num_parallel_calls=num_parallel_calls, deterministic=True).batch(64).prefetch(
+            AUTOTUNE)
+        start = 0
+        for batch in decoded:
+            images[start:start + len(batch)] = batch.numpy()
+            start += len(batch)
+
+    _write_cache(cache_dir, manifest, (len(paths),) + target_size + (3,), labels, fill)
+
+
+def load_or_build(directory, cache_dir=None, target_size=IMAGE_SIZE,
+                  interpolation='nearest', num_parallel_calls=AUTOTUNE):
+    """Return an `ImageCache` for `directory`, decoding it only if the cache is stale."""
+    if cache_dir is None:
+        cache_dir = default_cache_dir(directory, target_size)
+    manifest = build_manifest(directory, target_size, interpolation)
+    if _read_manifest(cache_dir) != manifest:
+        print('Decoding %d images from %s into %s'
+              % (len(manifest['files']), directory, cache_dir))
+        _build(directory, cache_dir, manifest, num_parallel_calls)
+    return ImageCache(cache_dir, manifest)
+
+
+def open_cache(cache_dir):
+    """Open an already built cache without re-statting its sources (e.g. in a worker)."""
+    manifest = _read_manifest(cache_dir)
+    if manifest is None:
+        raise FileNotFoundError('no image cache in %r' % cache_dir)
+    return ImageCache(cache_dir, manifest)
+
+
+def pool_caches(caches, cache_dir):
+    """One `ImageCache` holding the images of all `caches`, in order (e.g. train + validation).
+
+    The pooled arrays are copied from the decoded caches, never from the
+    JPEGs. They are rebuilt only when one of the sources changes.
+    """
+    class_names = caches[0].class_names
+    if any(cache.class_names != class_names for cache in caches):
+        raise ValueError('cannot pool caches with different classes: %r'
+                         % [cache.class_names for cache in caches])
+    manifest = {
+        'version': CACHE_VERSION,
+        'target_size': caches[0].manifest['target_size'],
+        'interpolation': caches[0].manifest['interpolation'],
+        'class_names': class_names,
+        'files': [entry for cache in caches for entry in cache.manifest['files']],
+        'pooled': [[os.path.abspath(cache.cache_dir), len(cache)] for cache in caches],
+    }
+    if _read_manifest(cache_dir) != manifest:
+        def fill(images):
+            start = 0
+            for cache in caches:
+                images[start:start + len(cache)] = cache.images
+                start += len(cache)
+
+        _write_cache(cache_dir, manifest,
+                     (sum(len(cache) for cache in caches),) + caches[0].images.shape[1:],
+                     np.concatenate([cache.labels for cache in caches]), fill)
+    return ImageCache(cache_dir, manifest)
@@ -0,0 +1,178 @@
+"""Inference engine for a saved ensemble (or any single member) model.
+
+The model is loaded once and its forward pass is wrapped in a single
+`tf.function` with a fixed `(None, 150, 150, 3)` float32 input signature, so it
+is traced once and never retraced for new batch sizes. Inside that graph the
+eight member towers have no dependencies on each other, so TensorFlow's
+inter-op thread pool runs them concurrently; `inter_op_threads` controls how
+many run at once.
+
+`predict_batch` puts callers' images on a queue that a single worker thread
+drains into micro-batches: it waits at most `max_wait_ms` for more requests
+before running, and never runs more than `max_batch_size` images at a time.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from members import INPUT_SHAPE
+
+
+class MicroBatcher:
+    """Group concurrent `submit` calls into batches for `fn`.
+
+    `fn` takes an `(N, ...)` array and returns `N` results. Each `submit`
+    returns a `Future` that resolves to the results for its own images.
+    """
+
+    def __init__(self, fn, max_batch_size=32, max_wait_ms=5.0):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, images):
+        future = Future()
+        self._queue.put((np.asarray(images), future))
+        return future
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch, size = [request], len(request[0])
+            deadline = time.perf_counter() + self.max_wait
+            stop = False
+            while size < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self._execute(batch)
+            if stop:
+                return
+
+    def _execute(self, batch):
+        try:
+            outputs = self.fn(np.concatenate([images for images, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        start = 0
+        for images, future in batch:
+            future.set_result(outputs[start:start + len(images)])
+            start += len(images)
+
+
+class InferenceEngine:
+    """Load a saved model once and serve predictions from it.
+
+    `predict` runs synchronously in the caller's thread; `predict_batch` goes
+    through the micro-batcher and is meant to be called from many threads.
+    Both take float32 images in `[0, 1]` (or uint8 images, which are rescaled)
+    and return a 1-D array of dog probabilities. The thread settings only
+    take effect if the engine is created before TensorFlow runs anything.
+    With `member` (e.g. `'evan'`) only that tower of a saved ensemble is run.
+    `fingerprint` identifies the weights actually loaded (see prediction_cache.py)
+and `signature` is the `file_signature` of the file they came from.
+    """
+
+    def __init__(self, model_path='ensemble_model.h5', max_batch_size=32, max_wait_ms=5.0,
+                 inter_op_threads=None, intra_op_threads=None, jit_compile=False, member=None):
+        import tensorflow as tf
+
+        try:
+            if inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+            if intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        except RuntimeError as e:
+            print('Keeping existing TensorFlow thread pools: %s' % e)
+
+        from prediction_cache import file_fingerprint, file_signature
+
+        self.model_path = model_path
+        while True:
+            # Hash and load the same file, even if it is replaced meanwhile
+            signature = file_signature(model_path)
+            self.fingerprint = file_fingerprint(model_path)
+            self.model = tf.keras.models.load_model(model_path, compile=False)
+            if file_signature(model_path) == signature:
+                break
+        self.signature = signature
+        if member is not None:
+            from evaluation import member_models
+            members = member_models(self.model)
+            if member not in members:
+                raise ValueError('%r has no member %r; it has %s' % (
+                    model_path, member, ', '.join(sorted(members))))
+            self.model = members[member]
+            self.fingerprint += ':' + member
+        self.max_batch_size = max_batch_size
+        self._forward = tf.function(
+            lambda images: self.model(images, training=False),
+            input_signature=[tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32)],
+            jit_compile=jit_compile)
+        # Trace (and compile) the graph up front rather than on the first request
+        self._forward(np.zeros((1,) + INPUT_SHAPE, np.float32))
+        self._batcher = MicroBatcher(self.predict, max_batch_size, max_wait_ms)
+
+    def predict(self, images):
+        images = np.asarray(images)
+        if images.dtype == np.uint8:
+            images = images.astype(np.float32) / 255.
+        images = images.astype(np.float32, copy=False).reshape((-1,) + INPUT_SHAPE)
+        outputs = [self._forward(images[i:i + self.max_batch_size]).numpy()
+                   for i in range(0, len(images), self.max_batch_size)]
+        if not outputs:
+            return np.zeros((0,), np.float32)
+        return np.concatenate(outputs).reshape(-1)
+
+    def predict_batch(self, images):
+        return self._batcher.submit(images).result()
+
+    def queue_depth(self):
+        return self._batcher.qsize()
+
+    def close(self):
+        self._batcher.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def decode_images(encoded, target_size=INPUT_SHAPE[:2]):
+    """Decode a list of encoded image bytes into a uint8 `(N, 150, 150, 3)` array."""
+    import tensorflow as tf
+    from data_pipeline import decode_image_bytes
+
+    if not encoded:
+        return np.zeros((0,) + tuple(target_size) + (3,), np.uint8)
+    return np.stack([decode_image_bytes(tf.constant(data), target_size).numpy()
+                     for data in encoded])
@@ -0,0 +1,160 @@
+"""Per-step timing, throughput and memory records for every model being trained.
+
+    monitor = TrainingMonitor('logs/train', profile_steps=[20])
+    fit_members(models, train, ..., monitor=monitor)          # see multi_trainer.py
+    head.fit(..., callbacks=[monitor.callback('ensemble', batch_size=20)])
+    print(format_report(monitor.summary()))                   # from evaluation.py
+
+Each model gets `<log_dir>/<name>.jsonl`. It holds one `step` record per
+training step (data wait, compute, examples/s, peak RSS) and one `epoch`
+record summing them up, along with that epoch's Keras logs. The epoch record's
+`bottleneck` says whether the model spent more of its time waiting for input
+or computing.
+
+`fit_members` pulls every batch itself, so it can time the wait for the
+batch apart from each member's train step. The shared wait is charged to
+every member that trained on the batch. Under `model.fit` Keras fetches the
+batch inside the train function, so `callback` can only time the whole step.
+There `data_s` is `null` and the step time includes the input wait.
+
+The steps listed in `profile_steps` (counted per model from 0) are traced
+with the TensorFlow profiler into `<log_dir>/traces/<name>/step_<n>`. Open
+them in TensorBoard's Profile tab for per-op and per-layer timings.
+
+A step costs two `perf_counter` calls and one `getrusage`. Records are
+buffered and written once per epoch, so the monitor can stay on for real
+runs.
+"""
+
+import json
+import os
+import resource
+import time
+
+from tensorflow.keras.callbacks import Callback
+
+
+def peak_rss_mb():
+    """High-water mark of this process' resident memory, in MB."""
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _bottleneck(data_s, compute_s):
+    if data_s is None:
+        return '-'
+    return 'input' if data_s > compute_s else 'compute'
+
+
+class TrainingMonitor:
+    """Buffered JSONL step/epoch records for any number of models, one file each."""
+
+    def __init__(self, log_dir, profile_steps=()):
+        self.log_dir = log_dir
+        self.profile_steps = set(profile_steps)
+        self.totals = {}
+        self._buffers = {}
+        self._steps = {}
+        self._profiling = False
+        os.makedirs(log_dir, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.log_dir, name + '.jsonl')
+
+    def begin_step(self, name):
+        """Call right before `name`'s train step; starts the profiler on listed steps."""
+        step = self._steps.get(name, 0)
+        if step in self.profile_steps and not self._profiling:
+            import tensorflow as tf
+            tf.profiler.experimental.start(
+                os.path.join(self.log_dir, 'traces', name, 'step_%d' % step))
+            self._profiling = True
+        return step
+
+    def end_step(self, name, epoch, data_s, compute_s, examples):
+        """Record one train step of `name`; `data_s` is None when it can't be told apart."""
+        if self._profiling:
+            import tensorflow as tf
+            tf.profiler.experimental.stop()
+            self._profiling = False
+        step = self._steps.get(name, 0)
+        self._steps[name] = step + 1
+        total_s = (data_s or 0.) + compute_s
+        self._buffers.setdefault(name, []).append({
+            'event': 'step', 'model': name, 'epoch': epoch, 'step': step, 'time': time.time(),
+            'data_s': data_s, 'compute_s': compute_s, 'examples': examples,
+            'examples_per_s': examples / total_s if total_s > 0 else None,
+            'peak_rss_mb': peak_rss_mb()})
+
+    def end_epoch(self, name, epoch, logs=None):
+        """Write `name`'s buffered steps and an epoch summary record; returns the summary."""
+        steps = self._buffers.pop(name, [])
+        known = all(r['data_s'] is not None for r in steps)
+        data_s = sum(r['data_s'] for r in steps) if known else None
+        compute_s = sum(r['compute_s'] for r in steps)
+        examples = sum(r['examples'] for r in steps)
+        total_s = (data_s or 0.) + compute_s
+        summary = {'event': 'epoch', 'model': name, 'epoch': epoch, 'time': time.time(),
+                   'steps': len(steps), 'data_s': data_s, 'compute_s': compute_s,
+                   'examples': examples,
+                   'examples_per_s': examples / total_s if total_s > 0 else None,
+                   'data_fraction': data_s / total_s if known and total_s > 0 else None,
+                   'bottleneck': _bottleneck(data_s, compute_s),
+                   'peak_rss_mb': peak_rss_mb(),
+                   'logs': {k: float(v) for k, v in (logs or {}).items()}}
+        with open(self.path(name), 'a') as f:
+            for record in steps + [summary]:
+                f.write(json.dumps(record) + '\n')
+
+        totals = self.totals.setdefault(name, {'steps': 0, 'data_s': 0., 'compute_s': 0.,
+                                               'examples': 0})
+        totals['steps'] += len(steps)
+        totals['data_s'] = None if data_s is None or totals['data_s'] is None else \
+            totals['data_s'] + data_s
+        totals['compute_s'] += compute_s
+        totals['examples'] += examples
+        totals['peak_rss_mb'] = summary['peak_rss_mb']
+        return summary
+
+    def callback(self, name, batch_size):
+        """Keras callback recording the train steps of `model.fit` under `name`."""
+        return _MonitorCallback(self, name, batch_size)
+
+    def summary(self):
+        """One row per model over every epoch recorded so far."""
+        rows = []
+        for name, t in self.totals.items():
+            total_s = (t['data_s'] or 0.) + t['compute_s']
+            rows.append({'model': name, 'steps': t['steps'],
+                         'data s': '-' if t['data_s'] is None else t['data_s'],
+                         'compute s': t['compute_s'],
+                         'input %': '-' if t['data_s'] is None or not total_s
+                         else 100. * t['data_s'] / total_s,
+                         'examples/s': t['examples'] / total_s if total_s else 0.,
+                         'peak RSS MB': t['peak_rss_mb'],
+                         'bottleneck': _bottleneck(t['data_s'], t['compute_s'])})
+        return rows
+
+
+class _MonitorCallback(Callback):
+
+    def __init__(self, monitor, name, batch_size):
+        super().__init__()
+        self.monitor = monitor
+        self.name = name
+        self.batch_size = batch_size
+        self.epoch = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.monitor.begin_step(self.name)
+        self.start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.monitor.end_step(self.name, self.epoch, None, time.perf_counter() - self.start,
+                              self.batch_size)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.monitor.end_epoch(self.name, epoch, logs)
@@ -0,0 +1,203 @@
+"""The eight member convnets of the ensemble, described as plain data.
+
+Each member is a spec: a list of `(kind, kwargs)` layer entries plus the
+optimizer and metrics it is compiled with. Specs are picklable, so they can be
+handed to worker processes and rebuilt there with `build_member`. Every model
+takes a (150, 150, 3) image and ends in `Dense(1, activation='sigmoid')`, which
+`build_from_spec` appends in float32 even under a mixed precision policy (see
+precision.py).
+"""
+
+from tensorflow.keras import layers, optimizers
+from tensorflow.keras.models import Sequential
+
+# Our input feature is of dimension (150,150,3)
+INPUT_SHAPE = (150, 150, 3)
+
+# Definition order, which is also the order the ensemble averages them in
+MEMBER_NAMES = ('jordan', 'sam', 'jackie', 'evan', 'max', 'rosie', 'saumya', 'elise')
+
+MEMBER_SPECS = {
+    'jordan': {
+        'layers': [
+            ('conv', {'filters': 16, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 32, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 64, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('flatten', {}),
+            ('dense', {'units': 64}),
+        ],
+        'optimizer': ('Adadelta', {'learning_rate': 1.0, 'rho': 0.95}),
+        'metrics': ['accuracy'],
+    },
+    'sam': {
+        'layers': [
+            ('conv', {'filters': 32, 'kernel_size': (3, 3), 'kernel_initializer': 'he_normal'}),
+            ('batchnorm', {}),
+            ('dropout', {'rate': 0.2}),
+            ('maxpool', {'pool_size': (2, 2)}),
+            ('conv', {'filters': 64, 'kernel_size': (3, 3), 'kernel_initializer': 'glorot_normal'}),
+            ('batchnorm', {}),
+            ('dropout', {'rate': 0.2}),
+            ('maxpool', {'pool_size': (2, 2)}),
+            ('conv', {'filters': 128, 'kernel_size': (2, 2), 'kernel_initializer': 'random_normal'}),
+            ('batchnorm', {}),
+            ('dropout', {'rate': 0.2}),
+            ('flatten', {}),
+            ('dense', {'units': 64}),
+            ('dense', {'units': 128}),
+        ],
+        'optimizer': ('Adam', {'learning_rate': 0.001}),
+        'metrics': ['accuracy'],
+    },
+    'jackie': {
+        'layers': [
+            ('conv', {'filters': 40, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 80, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 150, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('flatten', {}),
+            ('dense', {'units': 700}),
+        ],
+        'optimizer': ('RMSprop', {'learning_rate': 0.0001}),
+        'metrics': ['accuracy'],
+    },
+    'evan': {
+        'layers': [
+            ('conv', {'filters': 20, 'kernel_size': 3, 'kernel_initializer': 'lecun_uniform'}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 60, 'kernel_size': 3, 'padding': 'same',
+                      'kernel_initializer': 'lecun_uniform'}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 100, 'kernel_size': 3, 'padding': 'same'}),
+            ('maxpool', {'pool_size': 2}),
+            ('dropout', {'rate': 0.3}),
+            ('conv', {'filters': 160, 'kernel_size': 3, 'padding': 'same'}),
+            ('maxpool', {'pool_size': 3}),
+            ('dropout', {'rate': 0.6}),
+            ('conv', {'filters': 200, 'kernel_size': 3, 'padding': 'same'}),
+            ('maxpool', {'pool_size': 3}),
+            ('flatten', {}),
+            ('dense', {'units': 616}),
+        ],
+        'optimizer': ('RMSprop', {'learning_rate': 0.0008}),
+        'metrics': ['accuracy'],
+    },
+    'max': {
+        'layers': [
+            ('conv', {'filters': 64, 'kernel_size': (2, 2), 'kernel_initializer': 'he_normal'}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 64, 'kernel_size': (3, 3), 'kernel_initializer': 'he_normal'}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 64, 'kernel_size': (4, 4), 'kernel_initializer': 'he_normal'}),
+            ('avgpool', {'pool_size': 2}),
+            ('maxpool', {'pool_size': 2}),
+            ('flatten', {}),
+            ('dense', {'units': 512}),
+        ],
+        'optimizer': ('RMSprop', {'learning_rate': 0.003}),
+        'metrics': ['acc'],
+    },
+    'rosie': {
+        'layers': [
+            ('conv', {'filters': 16, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 32, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 64, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('flatten', {}),
+            ('dense', {'units': 64}),
+        ],
+        'optimizer': ('SGD', {'learning_rate': 0.01}),
+        'metrics': ['acc'],
+    },
+    'saumya': {
+        'layers': [
+            ('conv', {'filters': 4, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 8, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 16, 'kernel_size': 3}),
+            ('maxpool', {'pool_size': 2}),
+            ('flatten', {}),
+            ('dense', {'units': 128}),
+        ],
+        'optimizer': ('RMSprop', {'learning_rate': 0.001}),
+        'metrics': ['acc'],
+    },
+    'elise': {
+        'layers': [
+            ('conv', {'filters': 5, 'kernel_size': 9}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 30, 'kernel_size': 4}),
+            ('maxpool', {'pool_size': 2}),
+            ('conv', {'filters': 11, 'kernel_size': 2}),
+            ('maxpool', {'pool_size': 2}),
+            ('flatten', {}),
+            ('dense', {'units': 128}),
+        ],
+        'optimizer': ('Adamax', {'learning_rate': 0.003, 'beta_1': 0.9, 'beta_2': 0.999}),
+        'metrics': ['acc'],
+    },
+}
+
+# Hidden conv and dense layers are relu unless the spec says otherwise
+_LAYERS = {
+    'conv': lambda kw: layers.Conv2D(**{'activation': 'relu', **kw}),
+    'dense': lambda kw: layers.Dense(**{'activation': 'relu', **kw}),
+    'maxpool': lambda kw: layers.MaxPooling2D(**kw),
+    'avgpool': lambda kw: layers.AveragePooling2D(**kw),
+    'batchnorm': lambda kw: layers.BatchNormalization(**kw),
+    'dropout': lambda kw: layers.Dropout(**kw),
+    'flatten': lambda kw: layers.Flatten(**kw),
+}
+
+
+def build_from_spec(spec, name=None, output_activation='sigmoid'):
+    """Build an uncompiled `Sequential` model from a member spec.
+
+    `output_activation=None` leaves the final unit as a logit.
+    """
+    model_layers = [layers.Input(shape=INPUT_SHAPE)]
+    model_layers += [_LAYERS[kind](dict(kwargs)) for kind, kwargs in spec['layers']]
+    model_layers.append(layers.Dense(1, activation=output_activation, dtype='float32'))
+    return Sequential(model_layers, name=name)
+
+
+def make_optimizer(spec):
+    name, kwargs = spec['optimizer']
+    return getattr(optimizers, name)(**kwargs)
+
+
+def compile_from_spec(model, spec, **kwargs):
+    """Compile `model` with the optimizer and metrics from `spec`.
+
+    Extra keyword arguments are passed through to `model.compile`.
+    """
+    model.compile(optimizer=make_optimizer(spec),
+                  loss='binary_crossentropy',
+                  metrics=list(spec['metrics']),
+                  **kwargs)
+    return model
+
+
+def build_member(name, compile=True, jit_compile=False):
+    """Build (and by default compile) the member called `name`, e.g. `'evan'`."""
+    from precision import compile_kwargs
+
+    spec = MEMBER_SPECS[name]
+    model = build_from_spec(spec, name='model_' + name)
+    if compile:
+        compile_from_spec(model, spec, **compile_kwargs(jit_compile))
+    return model
+
+
+def build_members(names=MEMBER_NAMES, compile=True, jit_compile=False):
+    """`{name: model}` for every member in `names`, in order."""
+    return {name: build_member(name, compile=compile, jit_compile=jit_compile)
+            for name in names}
@@ -0,0 +1,127 @@
+"""Train several compiled models in lockstep over a single input stream.
+
+Calling `model.fit` once per member pulls (and, without a cache, decodes) the
+whole dataset once per member. `fit_members` pulls each batch once and runs a
+training step for every model on it, each with the optimizer it was compiled
+with, then validates every model on a shared pass over the validation data.
+It returns one `History` per model carrying the same keys `fit` would record
+(`accuracy` or `acc`, `val_loss`, ...), so the plotting code keeps working.
+
+Per-model Keras callbacks get the epoch-level hooks `fit` would call them
+with (`on_train_begin`, `on_epoch_end`, `on_train_end`), and a model whose
+callback sets `model.stop_training` sits out the remaining epochs while the
+others carry on; see harness.py.
+
+With an `instrument.TrainingMonitor` every step's wait for the batch and
+each member's train step are timed separately and logged per member.
+"""
+
+import time
+
+from tensorflow.keras.callbacks import History
+
+
+class _RunningMean:
+    """Epoch average of per-batch logs, weighted by batch size, like `fit` reports."""
+
+    def __init__(self):
+        self.totals = {}
+        self.count = 0
+
+    def add(self, logs, batch_size):
+        for k, v in logs.items():
+            self.totals[k] = self.totals.get(k, 0.) + float(v) * batch_size
+        self.count += batch_size
+
+    def result(self):
+        return {k: v / self.count for k, v in self.totals.items()}
+
+
+def _per_model(value, names):
+    if isinstance(value, dict):
+        return {name: value[name] for name in names}
+    return {name: value for name in names}
+
+
+def _format_logs(logs):
+    return ' - '.join('%s: %.4f' % (k, v) for k, v in logs.items())
+
+
+def fit_members(models, x, steps_per_epoch, epochs=1, validation_data=None,
+                validation_steps=None, verbose=1, callbacks=None, initial_epoch=0,
+                monitor=None):
+    """Train every model in `models` (a `{name: compiled model}` dict) on the batches of `x`.
+
+    `x` must yield `(images, labels)` batches indefinitely, like the repeating
+    datasets in `data_pipeline` and `image_cache`. `steps_per_epoch` is either
+    one number for all models or a `{name: steps}` dict; a model with fewer
+    steps just sits out the last batches of each epoch. `callbacks` is a
+    `{name: [callback, ...]}` dict and `initial_epoch` one number or a
+    `{name: epoch}` dict, as when resuming. `monitor` is an optional
+    `instrument.TrainingMonitor`. Returns `{name: History}`.
+    """
+    names = list(models)
+    steps = _per_model(steps_per_epoch, names)
+    first_epoch = _per_model(initial_epoch, names)
+    callbacks = {name: list((callbacks or {}).get(name, ())) for name in names}
+    train_iter = iter(x)
+    val_iter = iter(validation_data) if validation_data is not None else None
+
+    histories = {}
+    for name, model in models.items():
+        history = History()
+        histories[name] = history
+        model.stop_training = False
+        for callback in [history] + callbacks[name]:
+            callback.set_model(model)
+            callback.on_train_begin()
+
+    for epoch in range(min(first_epoch.values(), default=0), epochs):
+        active = [name for name in names
+                  if epoch >= first_epoch[name] and not models[name].stop_training]
+        if not active:
+            break
+        start = time.perf_counter()
+        train_logs = {name: _RunningMean() for name in active}
+        for step in range(max(steps[name] for name in active)):
+            fetch_start = time.perf_counter()
+            images, labels = next(train_iter)
+            data_s = time.perf_counter() - fetch_start
+            for name in active:
+                if step < steps[name]:
+                    if monitor is not None:
+                        monitor.begin_step(name)
+                        step_start = time.perf_counter()
+                    logs = models[name].train_on_batch(images, labels, return_dict=True)
+                    if monitor is not None:
+                        monitor.end_step(name, epoch, data_s, time.perf_counter() - step_start,
+                                         len(labels))
+                    train_logs[name].add(logs, len(labels))
+        logs = {name: train_logs[name].result() for name in active}
+
+        if val_iter is not None:
+            val_logs = {name: _RunningMean() for name in active}
+            for _ in range(validation_steps):
+                images, labels = next(val_iter)
+                for name in active:
+                    val_logs[name].add(models[name].test_on_batch(images, labels, return_dict=True),
+                                       len(labels))
+            for name in active:
+                logs[name].update(('val_' + k, v) for k, v in val_logs[name].result().items())
+
+        for name in active:
+            if monitor is not None:
+                monitor.end_epoch(name, epoch, logs[name])
+            for callback in [histories[name]] + callbacks[name]:
+                callback.on_epoch_end(epoch, logs[name])
+
+        if verbose:
+            print('Epoch %d/%d - %.0fs' % (epoch + 1, epochs, time.perf_counter() - start))
+            for name in active:
+                stopped = ' (stopping)' if models[name].stop_training else ''
+                print('  %s - %s%s' % (name, _format_logs(logs[name]), stopped))
+
+    for name in names:
+        for callback in callbacks[name]:
+            callback.on_train_end()
+    return histories
@@ -0,0 +1,151 @@
+"""Train member models concurrently in worker processes.
+
+A single TensorFlow process rarely keeps a many-core CPU busy with convnets
+this small, so `train_members_parallel` ships member specs (just their names,
+see `members.py`) to a pool of spawned worker processes. Each worker gets its
+own intra/inter-op thread budget, rebuilds the member, trains it and sends the
+weights, the metric history and its step timings back to the parent, where the
+models are rebuilt and returned alongside `History` objects.
+
+The decoded-image cache is built once in the parent before the pool starts, so
+workers only memory-map it and share the OS page cache.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def default_thread_budget(workers):
+    """Split the machine's cores evenly between `workers` processes."""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def configure_threads(intra_op_threads, inter_op_threads):
+    """Pin this process' TensorFlow thread pools; must run before any TF op."""
+    os.environ['OMP_NUM_THREADS'] = str(intra_op_threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
+def member_datasets(train_dir, validation_dir, use_cache=True, batch_size=20):
+    """The repeating training and validation datasets every member trains on."""
+    if use_cache:
+        from image_cache import load_or_build
+        return (load_or_build(train_dir).dataset(batch_size),
+                load_or_build(validation_dir).dataset(batch_size, shuffle=False))
+    from data_pipeline import make_dataset
+    return (make_dataset(train_dir, batch_size),
+            make_dataset(validation_dir, batch_size, shuffle=False))
+
+
+def _train_member(name, train_dir, validation_dir, use_cache, fit_kwargs, harness_kwargs=None,
+                  monitor_kwargs=None):
+    from tensorflow.keras.callbacks import Callback
+    from members import build_member
+
+    class StepTimer(Callback):
+        def on_train_batch_begin(self, batch, logs=None):
+            self.start = time.perf_counter()
+
+        def on_train_batch_end(self, batch, logs=None):
+            step_times.append(time.perf_counter() - self.start)
+
+    step_times = []
+    model = build_member(name)
+    train, validation = member_datasets(train_dir, validation_dir, use_cache)
+    callbacks = [StepTimer()]
+    monitor = None
+    if monitor_kwargs is not None:
+        from instrument import TrainingMonitor
+        monitor = TrainingMonitor(**monitor_kwargs)
+        callbacks.append(monitor.callback(name, batch_size=20))
+    start = time.perf_counter()
+    if harness_kwargs is not None:
+        from harness import TrainingHarness, resumable_fit
+        harness = TrainingHarness(**harness_kwargs)
+        history = resumable_fit(model, train, harness, validation_data=validation, verbose=0,
+                                callbacks=callbacks, **fit_kwargs)
+    else:
+        history = model.fit(train, validation_data=validation, verbose=0,
+                            callbacks=callbacks, **fit_kwargs)
+    return {
+        'name': name,
+        'weights': model.get_weights(),
+        'history': history.history,
+        'wall_time': time.perf_counter() - start,
+        'step_time': sum(step_times) / max(len(step_times), 1),
+        'pid': os.getpid(),
+        'monitor': monitor.summary() if monitor is not None else [],
+    }
+
+
+def train_members_parallel(names, train_dir, validation_dir, steps_per_epoch=100,
+                           epochs=15, validation_steps=50, workers=None,
+                           intra_op_threads=None, inter_op_threads=1,
+                           use_cache=True, verbose=1, run_dir=None, patience=None,
+                           log_dir=None, profile_steps=()):
+    """Train the members in `names` across `workers` processes.
+
+    `steps_per_epoch` is one number or a `{name: steps}` dict. Thread budgets
+    default to an even split of the cores. Returns `(models, histories, stats)`
+    keyed by name; `stats[name]` holds the worker's wall time and mean step time.
+    Optimizer state stays in the workers, only weights come back. With
+    `run_dir` or `patience` each worker trains under a `harness.TrainingHarness`
+    checkpointing to `run_dir/<name>`. With `log_dir` each worker logs its
+    steps there through an `instrument.TrainingMonitor`, and `stats[name]['monitor']`
+    holds the worker's summary rows.
+    """
+    from tensorflow.keras.callbacks import History
+    from members import build_member
+
+    names = list(names)
+    workers = workers or min(len(names), os.cpu_count() or 1)
+    intra_op_threads = intra_op_threads or default_thread_budget(workers)
+    if use_cache:
+        from image_cache import load_or_build
+        load_or_build(train_dir)
+        load_or_build(validation_dir)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=configure_threads,
+                             initargs=(intra_op_threads, inter_op_threads)) as pool:
+        futures = []
+        for name in names:
+            steps = steps_per_epoch[name] if isinstance(steps_per_epoch, dict) else steps_per_epoch
+            fit_kwargs = dict(steps_per_epoch=steps, epochs=epochs,
+                              validation_steps=validation_steps)
+            harness_kwargs = None
+            if run_dir is not None or patience is not None:
+                harness_kwargs = dict(directory=run_dir and os.path.join(run_dir, name),
+                                      patience=patience)
+            monitor_kwargs = None
+            if log_dir is not None:
+                monitor_kwargs = dict(log_dir=log_dir, profile_steps=profile_steps)
+            futures.append(pool.submit(_train_member, name, train_dir, validation_dir,
+                                       use_cache, fit_kwargs, harness_kwargs, monitor_kwargs))
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['name']] = result
+            if verbose:
+                print('%s done in %.0fs (worker %d, %.1f ms/step)' % (
+                    result['name'], result['wall_time'], result['pid'],
+                    result['step_time'] * 1e3))
+
+    models, histories, stats = {}, {}, {}
+    for name in names:
+        result = results[name]
+        models[name] = build_member(name)
+        models[name].set_weights(result['weights'])
+        history = History()
+        history.set_model(models[name])
+        history.history = result['history']
+        history.epoch = list(range(len(next(iter(result['history'].values()), []))))
+        histories[name] = history
+        stats[name] = {'wall_time': result['wall_time'], 'step_time': result['step_time'],
+                       'monitor': result['monitor']}
+    return models, histories, stats
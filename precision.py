@@ -0,0 +1,36 @@
+"""Training precision / XLA switch shared by the members and the ensemble.
+
+    set_precision('mixed_bfloat16')               # before any model is built
+    build_member('evan', jit_compile=True)        # or build_members(jit_compile=True)
+
+`precision` is a Keras dtype policy:
+
+* `float32`: the default, what every model used to train with.
+* `mixed_bfloat16`: compute in bfloat16 and keep variables in float32.
+  This is fast on CPUs with AVX512-BF16/AMX, and needs no loss scaling
+  because bfloat16 has float32's exponent range.
+* `mixed_float16`: compute in float16. Keras wraps the optimizer in a
+  `LossScaleOptimizer` when the model is compiled so small gradients don't
+  underflow.
+
+The policy is global and only affects layers created after it is set. Every
+model keeps its final sigmoid `Dense` in float32 (see `members.py` and
+`ensemble.py`), so probabilities and the loss stay full precision.
+`jit_compile=True` is passed to `compile` and has XLA fuse each train step.
+"""
+
+PRECISIONS = ('float32', 'mixed_bfloat16', 'mixed_float16')
+
+
+def set_precision(precision='float32'):
+    """Set the global Keras dtype policy for models built from now on."""
+    if precision not in PRECISIONS:
+        raise ValueError('precision must be one of %s, got %r' % (PRECISIONS, precision))
+    from tensorflow.keras import mixed_precision
+
+    mixed_precision.set_global_policy(precision)
+
+
+def compile_kwargs(jit_compile=False):
+    """Extra `model.compile` arguments for the chosen mode."""
+    return {'jit_compile': True} if jit_compile else {}
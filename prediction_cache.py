@@ -0,0 +1,207 @@
+"""Prediction cache keyed by image content and model fingerprint.
+
+    cache = PredictionCache(capacity=10000, disk_path='predictions.db')
+    key = cache.key(image_bytes)
+    dog = cache.get(engine.fingerprint, key)
+    if dog is None:
+        dog = ...run the model...
+        cache.put(engine.fingerprint, key, dog, seconds=elapsed)
+
+An entry is found by the SHA-256 of the raw uploaded bytes together with the
+fingerprint of the model that computed it, which is the SHA-256 of the saved
+model file (`file_fingerprint`, see `InferenceEngine.fingerprint`).
+Re-uploads, retries and duplicate files skip both the decode and the eight-tower
+forward pass. A new model can never be answered from an old model's entries.
+
+The in-memory tier is an LRU of at most `capacity` entries. The optional
+disk tier is a SQLite table that survives restarts. Disk hits are promoted
+into memory, and every computed result is written to both tiers.
+`ModelWatcher` polls the model file. When it is replaced with different
+content, the server loads the new model, `accept`s it and calls
+`invalidate`, which drops every entry of other fingerprints from both tiers.
+`stats()` reports hits per tier, hit rate, evictions, invalidations and the
+latency saved. The saved latency is the mean time of a miss times the number
+of hits, minus the time spent on hit lookups.
+"""
+
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def file_fingerprint(path):
+    """SHA-256 of a file's bytes, read in 1 MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(path):
+    """`(inode, size, mtime)` of `path`; changes whenever the file is replaced or rewritten."""
+    st = os.stat(path)
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class ModelWatcher:
+    """Notice when the model file at `path` is replaced by one with different content."""
+
+    def __init__(self, path, fingerprint, check_interval=1.0, signature=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.check_interval = check_interval
+        # `file_signature` of the file `fingerprint` was taken from; without it the
+        # first poll hashes the file, in case it changed since
+        self._signature = signature
+        # (signature, fingerprint) of new content that has not been accepted yet
+        self._candidate = None
+        self._next_check = time.monotonic() + check_interval
+
+    def poll(self):
+        """The fingerprint of new content in the file, else None.
+
+        Only stats the file, at most every `check_interval` seconds. It is
+        hashed again only when the stat result changes. A missing file (e.g.
+        mid-copy) counts as unchanged. Nothing is recorded until `accept`, so
+        content that fails to load (e.g. a half-written copy) is offered
+        again on the next poll.
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return None
+        self._next_check = now + self.check_interval
+        try:
+            signature = file_signature(self.path)
+            if signature == self._signature:
+                return None
+            if self._candidate is not None and self._candidate[0] == signature:
+                return self._candidate[1]
+            fingerprint = file_fingerprint(self.path)
+        except OSError:
+            return None
+        if fingerprint == self.fingerprint:
+            # Rewritten with the same content
+            self._signature = signature
+            return None
+        self._candidate = (signature, fingerprint)
+        return fingerprint
+
+    def accept(self, fingerprint):
+        """Record that the model with `fingerprint` is now the one in use."""
+        if self._candidate is not None:
+            self._signature = self._candidate[0]
+            self._candidate = None
+        self.fingerprint = fingerprint
+
+
+class PredictionCache:
+    """Bounded in-memory LRU of predictions with an optional SQLite disk tier."""
+
+    def __init__(self, capacity=10000, disk_path=None):
+        self.capacity = capacity
+        self.disk_path = disk_path
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if disk_path is not None:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.executescript('''
+                PRAGMA journal_mode = WAL;
+                CREATE TABLE IF NOT EXISTS predictions (
+                    fingerprint TEXT, image TEXT, probability REAL, created REAL,
+                    PRIMARY KEY (fingerprint, image));
+            ''')
+        self.memory_hits = self.disk_hits = self.misses = 0
+        self.evictions = self.invalidations = 0
+        self._hit_seconds = self._miss_seconds = 0.
+        self._timed_misses = 0
+
+    @staticmethod
+    def key(data):
+        """Content key of raw image bytes."""
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, fingerprint, key):
+        """Cached probability for `key` under `fingerprint`, or None (a miss)."""
+        start = time.perf_counter()
+        with self._lock:
+            value = self._memory.get((fingerprint, key))
+            if value is not None:
+                self._memory.move_to_end((fingerprint, key))
+                self.memory_hits += 1
+            elif self._db is not None:
+                row = self._db.execute(
+                    'SELECT probability FROM predictions WHERE fingerprint = ? AND image = ?',
+                    (fingerprint, key)).fetchone()
+                if row is not None:
+                    value = row[0]
+                    self._remember(fingerprint, key, value)
+                    self.disk_hits += 1
+            if value is None:
+                self.misses += 1
+            else:
+                self._hit_seconds += time.perf_counter() - start
+        return value
+
+    def put(self, fingerprint, key, probability, seconds=None):
+        """Store a computed prediction; `seconds` is what computing it cost."""
+        probability = float(probability)
+        with self._lock:
+            self._remember(fingerprint, key, probability)
+            if seconds is not None:
+                self._miss_seconds += seconds
+                self._timed_misses += 1
+            if self._db is not None:
+                with self._db:
+                    self._db.execute('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)',
+                                     (fingerprint, key, probability, time.time()))
+
+    def _remember(self, fingerprint, key, value):
+        self._memory[(fingerprint, key)] = value
+        self._memory.move_to_end((fingerprint, key))
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, keep_fingerprint):
+        """Drop every entry not computed by the model `keep_fingerprint`; returns how many."""
+        with self._lock:
+            stale = [k for k in self._memory if k[0] != keep_fingerprint]
+            for k in stale:
+                del self._memory[k]
+            dropped = len(stale)
+            if self._db is not None:
+                with self._db:
+                    dropped += self._db.execute(
+                        'DELETE FROM predictions WHERE fingerprint != ?',
+                        (keep_fingerprint,)).rowcount
+            self.invalidations += 1
+        return dropped
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            mean_miss = self._miss_seconds / self._timed_misses if self._timed_misses else 0.
+            return {
+                'entries': len(self._memory),
+                'capacity': self.capacity,
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'mean_hit_ms': 1e3 * self._hit_seconds / hits if hits else None,
+                'mean_miss_ms': 1e3 * mean_miss if self._timed_misses else None,
+                'latency_saved_s': max(0., hits * mean_miss - self._hit_seconds),
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
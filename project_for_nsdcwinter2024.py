@@ -47,724 +47,811 @@ Let's go!
 Let's start by downloading our example data, a .zip of 2,000 JPG pictures of cats and dogs, and extracting it locally in `/tmp`.
 
 **NOTE:** The 2,000 images used in this exercise are excerpted from the ["Dogs vs. Cats" dataset](https://www.kaggle.com/c/dogs-vs-cats/data) available on Kaggle, which contains 25,000 images. Here, we use a subset of the full dataset to decrease training time for educational purposes.
-"""
-
-
-import requests
-import zipfile
-import os
-
-# Download the zip file
-url = "https://storage.googleapis.com/mledu-datasets/cats_and_dogs_filtered.zip"
-output_path = "cats_and_dogs_filtered.zip"
-
-response = requests.get(url, stream=True)
-
-with open(output_path, 'wb') as file:
-    for chunk in response.iter_content(chunk_size=8192):
-        file.write(chunk)
-
-# Extract the contents of the zip file
-zip_ref = zipfile.ZipFile(output_path, 'r')
-zip_ref.extractall('/tmp')
-zip_ref.close()
-
-# Define directory paths
-base_dir = '/tmp/cats_and_dogs_filtered'
-train_dir = os.path.join(base_dir, 'train')
-validation_dir = os.path.join(base_dir, 'validation')
-
-# Directory with training cat pictures
-train_cats_dir = os.path.join(train_dir, 'cats')
-
-# Directory with training dog pictures
-train_dogs_dir = os.path.join(train_dir, 'dogs')
-
-# Directory with validation cat pictures
-validation_cats_dir = os.path.join(validation_dir, 'cats')
-
-# Directory with validation dog pictures
-validation_dogs_dir = os.path.join(validation_dir, 'dogs')
-
-
-"""Now, let's see what the filenames look like in the `cats` and `dogs` `train` directories (file naming conventions are the same in the `validation` directory):"""
 
-train_cat_fnames = os.listdir(train_cats_dir)
-print(train_cat_fnames[:10])
+Running it
+----------
+The notebook steps are now functions behind a small command line, and
+TensorFlow / matplotlib are only imported by the commands that need them:
 
-train_dog_fnames = os.listdir(train_dogs_dir)
-train_dog_fnames.sort()
-print(train_dog_fnames[:10])
+    python project_for_nsdcwinter2024.py all          # the whole notebook, top to bottom
+    python project_for_nsdcwinter2024.py --help       # every subcommand (see also the README)
 
-"""Let's find out the total number of cat and dog images in the `train` and `validation` directories:"""
-
-print('total training cat images:', len(os.listdir(train_cats_dir)))
-print('total training dog images:', len(os.listdir(train_dogs_dir)))
-print('total validation cat images:', len(os.listdir(validation_cats_dir)))
-print('total validation dog images:', len(os.listdir(validation_dogs_dir)))
-
-"""For both cats and dogs, we have 1,000 training images and 500 test images.
-
-Now let's take a look at a few pictures to get a better sense of what the cat and dog datasets look like. First, configure the matplot parameters:
+Plots are shown interactively unless `--out-dir` is given, in which case they
+are written there as PNGs.
 """
 
-# Commented out IPython magic to ensure Python compatibility.
-# %matplotlib inline
-
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
-
-# Parameters for our graph; we'll output images in a 4x4 configuration
-nrows = 4
-ncols = 4
-
-# Index for iterating over images
-pic_index = 0
-
-"""Now, display a batch of 8 cat and 8 dog pictures. You can rerun the cell to see
-
-*   List item
-*   List item
+import argparse
+import functools
+import json
+import os
+import random
+import shutil
+
+from dataset import DATA_URL, DEFAULT_CACHE_DIR
+
+BASE_DIR = '/tmp/cats_and_dogs_filtered'
+MODEL_PATH = 'ensemble_model.h5'
+HISTORY_PATH = 'histories.json'
+
+# Member name -> how it is labelled and coloured in the plots
+PLOT_STYLE = {
+    'jordan': ('Jordan\'s', 'purple'),
+    'sam': ('Sam\'s', 'orange'),
+    'jackie': ('Jackie\'s model', 'pink'),
+    'max': ('Max\'s model', 'red'),
+    'evan': ('Evan\'s model', 'cyan'),
+    'rosie': ('Rosie\'s model', 'blue'),
+    'saumya': ('Saumya\'s model', 'indigo'),
+    'elise': ('Elise\'s model', 'green'),
+}
+COLOR_ENSEMBLE = 'black'
+
+# Steps per epoch for each member; Elise's model was tuned with 95
+STEPS_PER_EPOCH = {'jordan': 100, 'sam': 100, 'jackie': 100, 'max': 100,
+                   'rosie': 100, 'evan': 100, 'saumya': 100, 'elise': 95}
+
+
+"""## Explore the Example Data"""
+
+
+def download_dataset(url=DATA_URL, cache_dir=DEFAULT_CACHE_DIR, extract_to='/tmp',
+                     sha256=None, mirrors=(), local_path=None, extract=True):
+    """Fetch the zip file into the cache and extract it into `extract_to`.
+
+    Both steps are skipped when a verified archive / intact tree already
+    exists; see dataset.py. Returns the extracted base directory, or the
+    archive path with `extract=False`.
+    """
+    from dataset import prepare_dataset
+
+    return prepare_dataset(url, cache_dir, extract_to, sha256, mirrors, local_path,
+                           extract=extract)
+
+
+def dataset_dirs(base_dir=BASE_DIR):
+    """Directory paths of the train/validation splits and their class folders."""
+    train_dir = os.path.join(base_dir, 'train')
+    validation_dir = os.path.join(base_dir, 'validation')
+    return {
+        'train': train_dir,
+        'validation': validation_dir,
+        # Directories with training / validation cat and dog pictures
+        'train_cats': os.path.join(train_dir, 'cats'),
+        'train_dogs': os.path.join(train_dir, 'dogs'),
+        'validation_cats': os.path.join(validation_dir, 'cats'),
+        'validation_dogs': os.path.join(validation_dir, 'dogs'),
+    }
+
+
+def _finish_figure(plt, out_dir, filename):
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        plt.savefig(os.path.join(out_dir, filename), bbox_inches='tight')
+        plt.close()
+    else:
+        plt.show()
+
+
+def explore_dataset(base_dir=BASE_DIR, out_dir=None, pic_index=8):
+    """Print file names and counts, then display 8 cat and 8 dog pictures in a 4x4 grid.
+
+    Pass a larger `pic_index` (in steps of 8) to see a fresh batch.
+    """
+    dirs = dataset_dirs(base_dir)
+    # File naming conventions are the same in the `validation` directory
+    train_cat_fnames = sorted(os.listdir(dirs['train_cats']))
+    train_dog_fnames = sorted(os.listdir(dirs['train_dogs']))
+    print(train_cat_fnames[:10])
+    print(train_dog_fnames[:10])
+
+    print('total training cat images:', len(train_cat_fnames))
+    print('total training dog images:', len(train_dog_fnames))
+    print('total validation cat images:', len(os.listdir(dirs['validation_cats'])))
+    print('total validation dog images:', len(os.listdir(dirs['validation_dogs'])))
+
+    import matplotlib
+    if out_dir:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.image as mpimg
+
+    # Parameters for our graph; we'll output images in a 4x4 configuration
+    nrows = 4
+    ncols = 4
+
+    # Set up matplotlib fig, and size it to fit 4x4 pics
+    fig = plt.gcf()
+    fig.set_size_inches(ncols * 4, nrows * 4)
+
+    next_cat_pix = [os.path.join(dirs['train_cats'], fname)
+                    for fname in train_cat_fnames[pic_index-8:pic_index]]
+    next_dog_pix = [os.path.join(dirs['train_dogs'], fname)
+                    for fname in train_dog_fnames[pic_index-8:pic_index]]
+
+    for i, img_path in enumerate(next_cat_pix+next_dog_pix):
+        # Set up subplot; subplot indices start at 1
+        sp = plt.subplot(nrows, ncols, i + 1)
+        sp.axis('Off') # Don't show axes (or gridlines)
+
+        img = mpimg.imread(img_path)
+        plt.imshow(img)
+
+    _finish_figure(plt, out_dir, 'samples.png')
+
+
+"""## Building, Training and Ensembling the Convnets
+
+The images that go into our convnets are 150x150 color images. Every member is
+written down as a spec in members.py (its layers plus the optimizer it trains
+with) and trained against the `binary_crossentropy` loss, because it's a binary
+classification problem and the final activation is a sigmoid.
 
-a fresh batch each time:
+The first member, Jordan's, is a configuration that is widely used and known to
+work well for image classification: 3 {convolution + relu + maxpooling}
+modules with 3x3 convolution windows, 2x2 pooling windows and more filters in
+later layers. With relatively few training examples (1,000 per class), three
+convolutional modules keep the model small, which lowers the risk of
+overfitting.
 """
 
-# Set up matplotlib fig, and size it to fit 4x4 pics
-fig = plt.gcf()
-fig.set_size_inches(ncols * 4, nrows * 4)
-
-pic_index += 8
-next_cat_pix = [os.path.join(train_cats_dir, fname)
-                for fname in train_cat_fnames[pic_index-8:pic_index]]
-next_dog_pix = [os.path.join(train_dogs_dir, fname)
-                for fname in train_dog_fnames[pic_index-8:pic_index]]
-
-for i, img_path in enumerate(next_cat_pix+next_dog_pix):
-  # Set up subplot; subplot indices start at 1
-  sp = plt.subplot(nrows, ncols, i + 1)
-  sp.axis('Off') # Don't show axes (or gridlines)
-
-  img = mpimg.imread(img_path)
-  plt.imshow(img)
-
-plt.show()
-
-"""## Building a Small Convnet from Scratch
 
-The images that will go into our convnet are 150x150 color images.
-
-**NOTE**: The first example CNN model, model_1, is a configuration that is widely used and known to work well for image classification. Namely, the configuration of stacking 3 {convolution + relu + maxpooling} modules, each convolutions having 3x3 windows, each maxpooling having 2x2 windows, having the number of convolution filters increase as we go to later layers. Also, since model_1 has relatively few training examples (1,000), using just three convolutional modules keeps the model small, which lowers the risk of overfitting.
-"""
+def build_models(summary=True, precision='float32', jit_compile=False):
+    """`{name: compiled member}` for all eight members.
+
+    `precision` and `jit_compile` select mixed precision and XLA training;
+    see precision.py.
+    """
+    from members import build_members
+    from precision import set_precision
+
+    set_precision(precision)
+    models = build_members(jit_compile=jit_compile)
+    if summary:
+        # sample model summary
+        models['sam'].summary()
+    return models
+
+
+def load_data(base_dir=BASE_DIR, zip_path=None, shards_dir=None):
+    """Decode the train and validation folders once into the memory-mapped image cache.
+
+    Images are normalised to `[0, 1]` and served in batches of 20 with their
+    binary labels (see image_cache.py); the cache is rebuilt automatically
+    whenever a folder changes. With `zip_path` the images are instead read
+    and decoded straight out of the downloaded archive (see zip_reader.py),
+    so nothing has to be extracted. With `shards_dir` they are streamed from
+    a sharded TFRecord store written by `ingest` (see shards.py).
+    """
+    if shards_dir is not None:
+        from shards import load_shards
+
+        return load_shards(shards_dir)
+    if zip_path is not None:
+        from zip_reader import ZipImageArchive
+
+        archive = ZipImageArchive(zip_path)
+        return archive.split('train'), archive.split('validation')
+
+    from image_cache import load_or_build
+
+    dirs = dataset_dirs(base_dir)
+    return load_or_build(dirs['train']), load_or_build(dirs['validation'])
+
+
+def steps_per_epoch(num_images):
+    """`STEPS_PER_EPOCH`, which were for 2,000 training images, scaled to `num_images`."""
+    return {name: max(1, steps * num_images // 2000) for name, steps in STEPS_PER_EPOCH.items()}
+
+
+def train_members(models, train_cache, validation_cache, epochs=15, harnesses=None,
+                  monitor=None, augment=None):
+    """Train every member on the same batches, pulling each batch only once.
+
+    With `harnesses` (see harness.py) members stop early, checkpoint every
+    epoch and resume from their last checkpoint. With an
+    `instrument.TrainingMonitor` every step's input wait and compute are logged.
+    `augment` maps the training dataset to an augmented one (see augment.py).
+    """
+    from harness import resumable_fit_members
+    from multi_trainer import fit_members
+
+    steps = steps_per_epoch(len(train_cache))
+    fit_kwargs = dict(
+        steps_per_epoch={name: steps[name] for name in models},
+        epochs=epochs,
+        validation_data=validation_cache.dataset(batch_size=20, shuffle=False),
+        validation_steps=-(-len(validation_cache) // 20),
+        verbose=1,
+        monitor=monitor)
+    train = train_cache.dataset(batch_size=20)
+    if augment is not None:
+        train = augment(train)
+    if harnesses is not None:
+        return resumable_fit_members(models, train, harnesses, **fit_kwargs)
+    return fit_members(models, train, **fit_kwargs)
+
+
+def training_savings(harnesses, epochs, num_images):
+    """Table of the epochs and steps each model skipped vs. the fixed schedule.
+
+    `num_images` is the size of the training set; the head takes one step
+    per batch of 20 cached features.
+    """
+    from harness import savings_report
+    from evaluation import format_report
+
+    rows = savings_report(harnesses, epochs,
+                          dict(steps_per_epoch(num_images), ensemble=-(-num_images // 20)))
+    total = sum(row['steps saved'] for row in rows)
+    return format_report(rows) + '\n%d train steps saved in total' % total
+
+
+def train_ensemble(models, train_cache, validation_cache, epochs=15, jit_compile=False,
+                   harness=None, monitor=None, augment=None):
+    """Freeze the trained members and fit the ensemble head on their cached predictions.
+
+    Letting the ensemble fit backprop through all eight convnets would cost
+    minutes per epoch and silently retrain them; see ensemble.py. With
+    `augment` the head's features come from augmented training images.
+    """
+    from ensemble import train_ensemble_head
+    from members import MEMBER_NAMES
+
+    train = train_cache.dataset(batch_size=20, shuffle=False, repeat=False)
+    if augment is not None:
+        train = augment(train)
+    ensemble_model, history, timings = train_ensemble_head(
+        [models[name] for name in MEMBER_NAMES],
+        train,
+        validation_cache.dataset(batch_size=20, shuffle=False, repeat=False),
+        epochs=epochs,
+        batch_size=20,
+        verbose=2,
+        jit_compile=jit_compile,
+        harness=harness,
+        callbacks=[monitor.callback('ensemble', batch_size=20)] if monitor else ())
+    print('member predictions: %.1fs, head training: %.1fs'
+          % (timings['features'], timings['head_fit']))
+    # Display the ensemble model summary
+    ensemble_model.summary()
+    return ensemble_model, history
 
-from tensorflow.keras.models import Sequential
-from tensorflow.keras import layers, Model
-
-# Our input feature is of dimension (150,150,3)
-
-model_jordan = Sequential([
-    layers.Conv2D(16, 3, activation='relu', input_shape=(150, 150, 3)),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(32, 3, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(64, 3, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Flatten(),
-    layers.Dense(64, activation='relu'),
-    layers.Dense(1, activation='sigmoid')
-])
-
-model_sam = Sequential([
-    layers.Input(shape = (150, 150, 3)),
-    layers.Conv2D(filters = 32, kernel_size = (3,3), activation = 'relu', kernel_initializer = 'he_normal'),
-    layers.BatchNormalization(),
-    layers.Dropout(0.2),
-    layers.MaxPooling2D((2,2)),
-    layers.Conv2D(filters = 64, kernel_size = (3,3), activation = 'relu', kernel_initializer = 'glorot_normal'),
-    layers.BatchNormalization(),
-    layers.Dropout(0.2),
-    layers.MaxPooling2D((2,2)),
-    layers.Conv2D(filters = 128, kernel_size = (2,2), activation = 'relu', kernel_initializer = 'random_normal'),
-    layers.BatchNormalization(),
-    layers.Dropout(0.2),
-    layers.Flatten(),
-    layers.Dense(units = 64, activation = 'relu'),
-    layers.Dense(units = 128, activation = 'relu'),
-    layers.Dense(1, activation = 'sigmoid')
-])
-
-model_jackie = Sequential([
-    layers.Input(shape=(150, 150, 3)),
-    layers.Conv2D(40, 3, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(80, 3, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(150, 3, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Flatten(),
-    layers.Dense(700, activation='relu'),
-    layers.Dense(1, activation='sigmoid')
-])
-
-model_evan = Sequential([
-    layers.Input(shape=(150, 150, 3)),
-    layers.Conv2D(20, 3, activation='relu', kernel_initializer = "lecun_uniform"),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(60, 3, activation='relu', padding = "same", kernel_initializer = "lecun_uniform"),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(100, 3, activation='relu', padding = "same"),
-    layers.MaxPooling2D(2),
-    layers.Dropout(0.3),
-    layers.Conv2D(160, 3, activation='relu', padding = "same"),
-    layers.MaxPooling2D(3),
-    layers.Dropout(0.6),
-    layers.Conv2D(200, 3, activation='relu', padding = "same"),
-    layers.MaxPooling2D(3),
-    layers.Flatten(),
-    layers.Dense(616, activation='relu'),
-    layers.Dense(1, activation='sigmoid')
-])
-
-model_max = Sequential([
-    layers.Input(shape=(150, 150, 3)),
-    layers.Conv2D(filters = 64, kernel_size = (2, 2), activation = 'relu', kernel_initializer = 'he_normal'),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(filters = 64, kernel_size = (3, 3), activation = 'relu', kernel_initializer = 'he_normal'),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(filters = 64, kernel_size = (4, 4), activation = 'relu', kernel_initializer = 'he_normal'),
-    layers.AveragePooling2D(2),
-    layers.MaxPooling2D(2),
-    layers.Flatten(),
-    layers.Dense(512, activation='relu'),
-    layers.Dense(1, activation='sigmoid')
-])
-
-model_rosie = Sequential([
-    layers.Input(shape=(150, 150, 3)),
-    layers.Conv2D(16, 3, activation='relu', input_shape=(150, 150, 3)),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(32, 3, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(64, 3, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Flatten(),
-    layers.Dense(64, activation='relu'),
-    layers.Dense(1, activation='sigmoid')
-])
-
-model_saumya = Sequential([
-    layers.Input(shape=(150, 150, 3)),
-    layers.Conv2D(4, 3, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(8, 3, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(16, 3, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Flatten(),
-    layers.Dense(128, activation='relu'),
-    layers.Dense(1, activation='sigmoid')
-])
-
-model_elise = Sequential([
-    layers.Input(shape=(150, 150, 3)),
-    layers.Conv2D(5, 9, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(30, 4, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Conv2D(11, 2, activation='relu'),
-    layers.MaxPooling2D(2),
-    layers.Flatten(),
-    layers.Dense(128, activation='relu'),
-    layers.Dense(1, activation='sigmoid')
- ])
-
-"""We can summarize the model architecture:"""
-
-# sample model summary
-
-model_sam.summary()
-
-"""The "output shape" column shows how the size of your feature map evolves in each successive layer. The convolution layers reduce the size of the feature maps by a bit due to padding, and each pooling layer halves the feature map.
-
-Next, we'll configure the specifications for model training. We will train our model with the `binary_crossentropy` loss, because it's a binary classification problem and our final activation is a sigmoid. (For a refresher on loss metrics, see the [Machine Learning Crash Course](https://developers.google.com/machine-learning/crash-course/descending-into-ml/video-lecture).) We will use the `rmsprop` optimizer with a learning rate of `0.001`. During training, we will want to monitor classification accuracy.
-"""
 
-from tensorflow.keras.optimizers import RMSprop, Adam, Adagrad, SGD, Adadelta, Nadam, Ftrl, Adamax
+def save_histories(histories, path=HISTORY_PATH):
+    """Write `{name: History or dict}` to JSON so `plot` can run without retraining."""
+    with open(path, 'w') as f:
+        json.dump({name: {k: [float(v) for v in values]
+                          for k, values in getattr(h, 'history', h).items()}
+                   for name, h in histories.items()}, f)
 
-# besides the optimizers used below, here are the keyword arguments for other optimizers:
-# optimizer = SGD(learning_rate=0.01, momentum=0.9)
-# optimizer = Adadelta(learning_rate=1.0, rho=0.95)
-# optimizer = Nadam(learning_rate=0.002, beta_1=0.9, beta_2=0.999)
-# optimizer = FTRL(learning_rate=0.001, learning_rate_power=-0.5, initial_accumulator_value=0.1, l1_regularization_strength=0.0, l2_regularization_strength=0.0)
-# optimizer = Adamax(learning_rate=0.002, beta_1=0.9, beta_2=0.999)
-
-model_jordan.compile(Adadelta(learning_rate=1.0, rho=0.95),
-              loss='binary_crossentropy',
-              metrics=['accuracy'])
 
-model_sam.compile(optimizer = Adam(learning_rate = 0.001),
-                  loss = 'binary_crossentropy',
-                  metrics=['accuracy'])
+def load_histories(path=HISTORY_PATH):
+    with open(path) as f:
+        return json.load(f)
 
-model_jackie.compile(loss='binary_crossentropy',
-                     optimizer=RMSprop(learning_rate= 0.0001),
-                     metrics = ['accuracy'])
-
-model_evan.compile(loss = 'binary_crossentropy',
-                   optimizer = RMSprop(learning_rate=0.0008),
-                   metrics = ['accuracy'])
-
-model_max.compile(loss='binary_crossentropy',
-              optimizer=RMSprop(learning_rate=0.003),
-              metrics=['acc'])
-
-model_rosie.compile(loss='binary_crossentropy',
-              optimizer=SGD(learning_rate=0.01),
-              metrics=['acc'])
-
-model_saumya.compile(loss='binary_crossentropy',
-              optimizer=RMSprop(learning_rate=0.001),
-              metrics=['acc'])
-
-model_elise.compile(loss = 'binary_crossentropy',
-                    optimizer = Adamax(learning_rate = 0.003,
-                                       beta_1=0.9, beta_2=0.999),
-                    metrics = ['acc'])
-
-# Examples
-# model_1.compile(loss='binary_crossentropy',
-#               optimizer=RMSprop(learning_rate=0.0001),
-#               metrics=['acc'])
-
-# model_2.compile(loss='binary_crossentropy',
-#               optimizer=Adam(learning_rate=0.005),
-#               metrics=['acc'])
-
-# model_3.compile(loss='binary_crossentropy',
-#               optimizer=Adagrad(learning_rate=0.001),
-#               metrics=['acc'])
-
-
-
-## Now for our ensemble model!
-
-
-from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Input, Average
-
-# Input layer for the ensemble model
-input_layer = Input(shape=(150, 150, 3))
-from tensorflow.keras.layers import Dropout, BatchNormalization, LeakyReLU
-
-# USe the previously defined models as the first step in our ensemble model
-output_model_1 = model_jordan(input_layer)
-output_model_2 = model_sam(input_layer)
-output_model_3 = model_jackie(input_layer)
-output_model_4 = model_evan(input_layer)
-output_model_5 = model_max(input_layer)
-output_model_6 = model_rosie(input_layer)
-output_model_7 = model_saumya(input_layer)
-output_model_8 = model_elise(input_layer)
-
-# Average the outputs of the three models
-average_output = Average()([output_model_1, output_model_2, output_model_3,
-                            output_model_4, output_model_5, output_model_6,
-                            output_model_7, output_model_8])
-
-# Add additional layers to increase complexity
-dense_layer1 = layers.Dense(256, activation='relu')(average_output)
-dropout_layer1 = Dropout(0.5)(dense_layer1)
-batchnorm_layer1 = BatchNormalization()(dropout_layer1)
-dense_layer2 = layers.Dense(128, activation='relu')(batchnorm_layer1)
-dropout_layer2 = Dropout(0.5)(dense_layer2)
-batchnorm_layer2 = BatchNormalization()(dropout_layer2)
-dense_layer3 = layers.Dense(64, activation='relu')(batchnorm_layer2)
-dropout_layer3 = Dropout(0.5)(dense_layer3)
-batchnorm_layer3 = BatchNormalization()(dropout_layer3)
-dense_layer4 = layers.Dense(32, activation='relu')(batchnorm_layer3)
-leaky_relu_layer = LeakyReLU()(dense_layer4)
-ensemble_output = layers.Dense(1, activation='sigmoid')(leaky_relu_layer)
-
-ensemble_model = Model(inputs=input_layer, outputs=ensemble_output)
-
-# Display the ensemble model summary
-ensemble_model.summary()
-
-# Compile the ensemble model
-ensemble_model.compile(loss='binary_crossentropy',
-                      optimizer=RMSprop(learning_rate=0.001),
-                      metrics=['accuracy'])
-
-### Data Preprocessing
-# Let's set up data generators that will read pictures in our source folders, convert them to `float32` tensors, and feed them (with their labels) to our network. We'll have one generator for the training images and one for the validation images. Our generators will yield batches of 20 images of size 150x150 and their labels (binary).
-# As you may already know, data that goes into neural networks should usually be normalized in some way to make it more amenable to processing by the network. (It is uncommon to feed raw pixels into a convnet.) In our case, we will preprocess our images by normalizing the pixel values to be in the `[0, 1]` range (originally all values are in the `[0, 255]` range).
-# In Keras this can be done via the `keras.preprocessing.image.ImageDataGenerator` class using the `rescale` parameter. This `ImageDataGenerator` class allows you to instantiate generators of augmented image batches (and their labels) via `.flow(data, labels)` or `.flow_from_directory(directory)`. These generators can then be used with the Keras model methods that accept data generators as inputs: `fit_generator`, `evaluate_generator`, and `predict_generator`.
-
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-
-# All images will be rescaled by 1./255
-train_datagen = ImageDataGenerator(rescale=1./255)
-val_datagen = ImageDataGenerator(rescale=1./255)
-
-# Flow training images in batches of 20 using train_datagen generator
-train_generator = train_datagen.flow_from_directory(
-        train_dir,  # This is the source directory for training images
-        target_size=(150, 150),  # All images will be resized to 150x150
-        batch_size=20,
-        # Since we use binary_crossentropy loss, we need binary labels
-        class_mode='binary')
 
-# Flow validation images in batches of 20 using val_datagen generator
-validation_generator = val_datagen.flow_from_directory(
-        validation_dir,
-        target_size=(150, 150),
-        batch_size=20,
-        class_mode='binary')
+def load_ensemble(model_path=MODEL_PATH):
+    import tensorflow as tf
 
-"""### Training
-Let's train on all 2,000 images available, for 15 epochs, and validate on all 1,000 validation images. (This may take a few minutes to run.)
-"""
+    return tf.keras.models.load_model(model_path)
 
-# Model training
-
-history_jordan = model_jordan.fit(
-    train_generator,
-    steps_per_epoch=100,
-    epochs=15,
-    validation_data=validation_generator,
-    validation_steps=50,
-    verbose=1
-)
-
-history_sam = model_sam.fit(
-    train_generator,
-    steps_per_epoch=100,
-    epochs=15,
-    validation_data=validation_generator,
-    validation_steps=50,
-    verbose=1
-)
-
-history_jackie = model_jackie.fit(
-    train_generator,
-    steps_per_epoch=100,
-    epochs=15,
-    validation_data=validation_generator,
-    validation_steps=50,
-    verbose=1
-)
-
-history_max = model_max.fit(
-    train_generator,
-    steps_per_epoch=100,
-    epochs=15,
-    validation_data=validation_generator,
-    validation_steps=50,
-    verbose=1
-)
-
-history_rosie = model_rosie.fit(
-    train_generator,
-    steps_per_epoch=100,
-    epochs=15,
-    validation_data=validation_generator,
-    validation_steps=50,
-    verbose=1
-)
-
-history_evan = model_evan.fit(
-    train_generator,
-    steps_per_epoch=100,
-    epochs=15,
-    validation_data=validation_generator,
-    validation_steps=50,
-    verbose=1
-)
-
-history_saumya = model_saumya.fit(
-    train_generator,
-    steps_per_epoch=100,
-    epochs=15,
-    validation_data=validation_generator,
-    validation_steps=50,
-    verbose=1
-)
-
-history_elise = model_elise.fit(
-    train_generator,
-    steps_per_epoch = 95,
-    epochs = 15,
-    validation_data = validation_generator,
-    validation_steps = 50,
-    verbose = 1
-)
-
-# Training the ensemble model
-history_ensemble = ensemble_model.fit(
-    train_generator,
-    steps_per_epoch=100,
-    epochs=15,
-    validation_data=validation_generator,
-    validation_steps=50,
-    verbose=2
-)
 
 """### Visualizing Intermediate Representations
 
 To get a feel for what kind of features our convnet has learned, one fun thing to do is to visualize how an input gets transformed as it goes through the convnet.
 
 Let's pick a random cat or dog image from the training set, and then generate a figure where each row is the output of a layer, and each image in the row is a specific filter in that output feature map. Rerun this cell to generate intermediate representations for a variety of training images.
-"""
-
-import numpy as np
-import random
-from tensorflow.keras.preprocessing.image import img_to_array, load_img
-
-img_input = layers.Input(shape=(150, 150, 3))
-
-# redefining a model using the Tensorflow Functional API
-x = layers.Conv2D(16, 3, activation='relu')(img_input)
-x = layers.MaxPooling2D(2)(x)
-x = layers.Conv2D(32, 3, activation='relu')(x)
-x = layers.MaxPooling2D(2)(x)
-x = layers.Conv2D(64, 3, activation='relu')(x)
-x = layers.MaxPooling2D(2)(x)
-x = layers.Flatten()(x)
-x = layers.Dense(64, activation='relu')(x)
-output_layer = layers.Dense(1, activation='sigmoid')(x)
-model_jordan_functional = Model(img_input, output_layer)
-
-# Define a new model that will take an image as input, and will output
-# intermediate representations for all layers in the previous model after the first
-successive_outputs = [layer.output for layer in model_jordan_functional.layers[1:]]
-visualization_model = Model(inputs=img_input, outputs=successive_outputs)
-
-# Prepare a random input image of a cat or dog from the training set
-cat_img_files = [os.path.join(train_cats_dir, f) for f in train_cat_fnames]
-dog_img_files = [os.path.join(train_dogs_dir, f) for f in train_dog_fnames]
-img_path = random.choice(cat_img_files + dog_img_files)
-
-img = load_img(img_path, target_size=(150, 150))  # this is a PIL image
-plt.imshow(img)
-# display the chosen sample image
-plt.show()
-
-# Visual representation of the convolutional layers
-# we only visualize the conv layers and not the fully connected layers
-
-x = img_to_array(img)  # Numpy array with shape (150, 150, 3)
-x = x.reshape((1,) + x.shape)  # Numpy array with shape (1, 150, 150, 3)
-
-# Rescale by 1/255
-x /= 255
-
-# Run our image through our network and thus obtain all
-# intermediate representations for this image
-successive_feature_maps = visualization_model.predict(x)
-
-# Names of the layers, so that we can have them as part of our plot
-layer_names = [layer.name for layer in model_jordan.layers[1:]]
-
-# Display our representations
-for layer_name, feature_map in zip(layer_names, successive_feature_maps):
-  if len(feature_map.shape) == 4:
-    # Just do this for the conv / maxpool layers, not the fully-connected layers
-    n_features = feature_map.shape[-1]  # number of features in feature map
-    # The feature map has shape (1, size, size, n_features)
-    size = feature_map.shape[1]
-    # Tile our images in this matrix
-    display_grid = np.zeros((size, size * n_features))
-    for i in range(n_features):
-      # Postprocess the feature to make it visually palatable
-      x = feature_map[0, :, :, i]
-      x -= x.mean()
-      x /= x.std()
-      x *= 64
-      x += 128
-      x = np.clip(x, 0, 255).astype('uint8')
-      # Tile each filter into this big horizontal grid
-      display_grid[:, i * size : (i + 1) * size] = x
-    # Display the grid
-    scale = 20. / n_features
-    plt.figure(figsize=(scale * n_features, scale))
-    plt.title(layer_name)
-    plt.grid(False)
-    plt.imshow(display_grid, aspect='auto', cmap='viridis')
-
-"""As you can see we go from the raw pixels of the images to increasingly abstract and compact representations. The representations downstream start highlighting what the network pays attention to, and they show fewer and fewer features being "activated"; most are set to zero. This is called "sparsity." Representation sparsity is a key feature of deep learning.
 
+As you can see we go from the raw pixels of the images to increasingly abstract and compact representations. The representations downstream start highlighting what the network pays attention to, and they show fewer and fewer features being "activated"; most are set to zero. This is called "sparsity." Representation sparsity is a key feature of deep learning.
 
 These representations carry increasingly less information about the original pixels of the image, but increasingly refined information about the class of the image. You can think of a convnet (or a deep network in general) as an information distillation pipeline.
-
-### Evaluating Accuracy and Loss for the Model
-
-Let's plot the training/validation accuracy and loss as collected during training:
 """
 
-# color for each model
-color_model_jordan = 'purple'
-color_model_sam = 'orange'
-color_model_jackie = 'pink'
-color_model_max = 'red'
-color_model_evan = 'cyan'
-color_model_rosie = 'blue'
-color_model_saumya = 'indigo'
-color_model_elise = 'green'
-
-color_ensemble = 'black'
-
-plt.figure(figsize=(14,8))
-
-# Plotting training and validation accuracy for individual models
-plt.plot(history_jordan.history['accuracy'], '--', label='Jordan\'s Training Acc', color=color_model_jordan)
-plt.plot(history_jordan.history['val_accuracy'], label='Jordan\'s Validation Acc', color=color_model_jordan)
 
-plt.plot(history_sam.history['accuracy'], '--', label='Sam\'s Training Acc', color=color_model_sam)
-plt.plot(history_sam.history['val_accuracy'], label='Sam\'s Validation Acc', color=color_model_sam)
+def visualize_intermediate(model, base_dir=BASE_DIR, img_path=None, out_dir=None):
+    """Plot every conv/pool feature map of `model` (a member) for one image.
 
-plt.plot(history_jackie.history['accuracy'], '--', label='Jackie\'s model Training Acc', color=color_model_jackie)
-plt.plot(history_jackie.history['val_accuracy'], label='Jackie\'s model Validation Acc', color=color_model_jackie)
+    With `out_dir` the grids are written straight to PNGs (see feature_maps.py).
+    """
+    import matplotlib
+    if out_dir:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from tensorflow.keras.preprocessing.image import img_to_array, load_img
 
-plt.plot(history_max.history['acc'], '--', label='Max\'s model Training Acc', color=color_model_max)
-plt.plot(history_max.history['val_acc'], label='Max\'s model Validation Acc', color=color_model_max)
+    from feature_maps import render, write_feature_maps
 
-plt.plot(history_evan.history['accuracy'], '--', label='Evan\'s model Training Acc', color=color_model_evan)
-plt.plot(history_evan.history['val_accuracy'], label='Evan\'s model Validation Acc', color=color_model_evan)
+    if img_path is None:
+        # Prepare a random input image of a cat or dog from the training set
+        dirs = dataset_dirs(base_dir)
+        img_files = [os.path.join(dirs[d], f) for d in ('train_cats', 'train_dogs')
+                     for f in os.listdir(dirs[d])]
+        img_path = random.choice(img_files)
 
-plt.plot(history_rosie.history['acc'], '--', label='Rosie\'s model Training Acc', color=color_model_rosie)
-plt.plot(history_rosie.history['val_acc'], label='Rosie\'s model Validation Acc', color=color_model_rosie)
+    img = load_img(img_path, target_size=(150, 150))  # this is a PIL image
+    plt.imshow(img)
+    # display the chosen sample image
+    _finish_figure(plt, out_dir, 'sample.png')
 
-plt.plot(history_saumya.history['acc'], '--', label='Saumya\'s model Training Acc', color=color_model_saumya)
-plt.plot(history_saumya.history['val_acc'], label='Saumya\'s model Validation Acc', color=color_model_saumya)
+    x = img_to_array(img)  # Numpy array with shape (150, 150, 3)
+    x = x.reshape((1,) + x.shape)  # Numpy array with shape (1, 150, 150, 3)
 
-plt.plot(history_elise.history['acc'], '--', label='Elise\'s model Training Acc', color=color_model_elise)
-plt.plot(history_elise.history['val_acc'], label='Elise\'s model Validation Acc', color=color_model_elise)
+    # Rescale by 1/255
+    x /= 255
 
+    if out_dir:
+        write_feature_maps(model, x, out_dir)
+        return
 
-# Plotting training and validation accuracy for the ensemble model
-# plt.plot(history_ensemble.history['accuracy'], '--', label='Ensemble Training Acc', color=color_ensemble)
-# plt.plot(history_ensemble.history['val_accuracy'], label='Ensemble Validation Acc', color=color_ensemble)
+    # Display our representations, one horizontal strip of filters per conv / pool layer
+    for layer_name, grids in render(model, x).items():
+        height, width = grids[0].shape
+        plt.figure(figsize=(20., max(20. * height / width, 0.5)))
+        plt.title(layer_name)
+        plt.grid(False)
+        plt.imshow(grids[0], aspect='auto', cmap='viridis')
+        _finish_figure(plt, None, 'features_%s.png' % layer_name)
 
 
-# Display the plot
-# plt.legend()
-plt.xlabel("Epochs")
-plt.ylabel("Accuracy")
-plt.title('Training and Validation Accuracy for Individual Models')
-# Add text at the bottom of the plot
-plt.annotate('Dashed lines: training accuracies \n Solid lines: validation accuracies', (0.4, 0.1), xycoords='figure fraction', ha='center')
-plt.show()
+"""### Evaluating Accuracy and Loss for the Model
 
-#  Models' training and validation losses
-
-plt.figure(figsize=(14,8))
-
-plt.plot(history_jordan.history['loss'], '--', label='Jordan\'s Training Loss', color=color_model_jordan)
-plt.plot(history_jordan.history['val_loss'], label='Jordan\'s Validation Loss', color=color_model_jordan)
-
-plt.plot(history_sam.history['loss'], '--', label='Sam\'s model Training Loss', color=color_model_sam)
-plt.plot(history_sam.history['val_loss'], label='Sam\'s model Validation Loss', color=color_model_sam)
-
-plt.plot(history_jackie.history['loss'], '--', label='Jackie\'s model Training Loss', color=color_model_jackie)
-plt.plot(history_jackie.history['val_loss'], label='Jackie\'s model Validation Loss', color=color_model_jackie)
-
-plt.plot(history_max.history['loss'], '--', label='Max\'s model Training Loss', color=color_model_max)
-plt.plot(history_max.history['val_loss'], label='Max\'s model Validation Loss', color=color_model_max)
-
-plt.plot(history_evan.history['loss'], '--', label='Evan\'s model Training Loss', color=color_model_evan)
-plt.plot(history_evan.history['val_loss'], label='Evan\'s model Validation Loss', color=color_model_evan)
-
-plt.plot(history_rosie.history['loss'], '--', label='Rosie\'s model Training Loss', color=color_model_rosie)
-plt.plot(history_rosie.history['val_loss'], label='Rosie\'s model Validation Loss', color=color_model_rosie)
-
-plt.plot(history_saumya.history['loss'], '--', label='Saumya\'s Training Loss', color=color_model_saumya)
-plt.plot(history_saumya.history['val_loss'], label='Saumya\'s Validation Loss', color=color_model_saumya)
-
-plt.plot(history_elise.history['loss'], '--', label='Elise\'s model Training Loss', color=color_model_elise)
-plt.plot(history_elise.history['val_loss'], label='Elise\'s model Validation Loss', color=color_model_elise)
-
-# Plotting training and validation loss for the ensemble model
-# plt.plot(history_ensemble.history['loss'], '--', label='Ensemble Training Loss', color=color_ensemble)
-# plt.plot(history_ensemble.history['val_loss'], label='Ensemble Validation Loss', color=color_ensemble)
-
-# Display the plot
-# plt.legend()
-plt.xlabel("Epochs")
-plt.ylabel("Accuracy")
-plt.title('Training and Validation Losses for Individual Models')
-# Add text at the bottom of the plot
-plt.annotate('Dashed lines: training losses \n Solid lines: validation losses', (0.15, 0.6), xycoords='figure fraction', ha='center')
-plt.show()
-
-# Best performing model
-
-
-plt.plot(history_evan.history['accuracy'], '--', label='Evan\'s model Training Acc', color=color_model_evan)
-plt.plot(history_evan.history['val_accuracy'], label='Evan\'s model Validation Acc', color=color_model_evan)
+Let's plot the training/validation accuracy and loss as collected during training.
+"""
 
-plt.title("Best Performing Model's accuracy")
-plt.legend()
-plt.show()
 
-# showing just the result of our ensemble model
+def plot_histories(histories, out_dir=None):
+    """Plot the curves in `{name: History or history dict}`; 'ensemble' is plotted on its own.
+
+    Shown one by one, or saved to `out_dir`; `report` renders the same charts
+    in parallel into an HTML bundle.
+    """
+    from report import chart_specs, normalize_metrics, render_chart
+
+    histories = {name: normalize_metrics(h) for name, h in histories.items()}
+    # Members in the notebook's plotting order, then anything else (e.g. the ensemble)
+    ordered = {name: histories[name] for name in PLOT_STYLE if name in histories}
+    ordered.update(histories)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    for spec in chart_specs(ordered, PLOT_STYLE, COLOR_ENSEMBLE):
+        render_chart(spec, out_dir)
 
-# Plotting training and validation accuracy for the ensemble model
-plt.plot(history_ensemble.history['accuracy'], '--', label='Ensemble Training Acc', color=color_ensemble)
-plt.plot(history_ensemble.history['val_accuracy'], label='Ensemble Validation Acc', color=color_ensemble)
 
-plt.legend()
-plt.title('Training and Validation Accuracy')
-plt.show()
+"""### Exporting"""
 
-# Plotting training and validation loss for the ensemble model
-plt.plot(history_ensemble.history['loss'], '--', label='Ensemble Training Loss', color=color_ensemble)
-plt.plot(history_ensemble.history['val_loss'], label='Ensemble Validation Loss', color=color_ensemble)
 
-plt.legend()
-plt.title('Training and Validation Loss')
-plt.show()
+def export_diagrams(ensemble_model, out_dir='.'):
+    """Write model.png, model_partial.png and model_with_title.png (needs pydot and graphviz)."""
+    from report import write_diagrams
 
-from tensorflow.keras.utils import plot_model
+    #pip install pydot graphviz
+    # NOTES
+    #"None" means any batch sizes (the number of data pts in subsets of the data) can be used
+    return write_diagrams(ensemble_model, out_dir)
 
-# Assuming your model is named 'model_evan'
-plot_model(ensemble_model, to_file='model.png', show_shapes=True, show_layer_names=True)
 
-#pip install pydot graphviz
+def open_in_netron(model_path=MODEL_PATH):
+    try:
+        import netron
+    except ImportError:
+        raise SystemExit('netron is not installed: pip install netron')
+    netron.start(model_path)
 
-from IPython.display import Image
-Image(retina=True, filename='model.png')
 
-# NOTES
-#"None" means any batch sizes (the number of data pts in subsets of the data) can be used
+def predict_images(image_paths, model_path=MODEL_PATH):
+    """Print the dog probability of each image according to the saved model."""
+    from inference import InferenceEngine, decode_images
 
-# Create a model that includes the layers up to the 5th layer of the original model
-model_partial = Model(inputs=ensemble_model.inputs, outputs=ensemble_model.layers[9].output)
+    encoded = []
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            encoded.append(f.read())
+    with InferenceEngine(model_path) as engine:
+        probabilities = engine.predict(decode_images(encoded))
+    for path, p in zip(image_paths, probabilities):
+        print('%s\t%.4f\t%s' % (path, p, 'dog' if p >= 0.5 else 'cat'))
+    return probabilities
 
-# Now you can visualize this partial model
-plot_model(model_partial, to_file='model_partial.png', show_shapes=True, show_layer_names=True)
 
-from PIL import Image, ImageDraw, ImageFont
+"""## Command line"""
 
-# Open the image file
-img = Image.open('model.png')
 
-# Create ImageDraw object
-draw = ImageDraw.Draw(img)
+def _cmd_download(args):
+    download_dataset(args.url, args.cache_dir, os.path.dirname(args.data_dir.rstrip('/')) or '.',
+                     args.sha256, args.mirror, args.archive, not args.no_extract)
 
-# Specify font size
-font = ImageFont.load_default()
-#font = ImageFont.truetype('/path/to/arial.ttf', 15)
 
-# Add text
-draw.text((0, 0), "Model Visualization", (0,0,0), font=font)
+def _cmd_explore(args):
+    explore_dataset(args.data_dir, args.out_dir)
 
-# Save the image
-img.save('model_with_title.png')
 
-ensemble_model.save('ensemble_model.h5')
-#pip install netron
-import subprocess
+def _cmd_train(args):
+    from harness import make_harnesses
 
-# Install netron using pip
-subprocess.run(["pip", "install", "netron"])
-import netron
-netron.start('ensemble_model.h5')
\ No newline at end of file
+    if args.fresh and args.run_dir and os.path.isdir(args.run_dir):
+        shutil.rmtree(args.run_dir)
+    models = build_models(precision=args.precision, jit_compile=args.jit)
+    harnesses = make_harnesses(list(models) + ['ensemble'], args.run_dir,
+                               patience=args.patience or None)
+    monitor = None
+    if args.log_dir:
+        from instrument import TrainingMonitor
+        monitor = TrainingMonitor(args.log_dir, args.profile_steps)
+    augment = None
+    if args.augment:
+        from augment import AUGMENTATION, augment_dataset
+        augment = functools.partial(
+            augment_dataset, config=dict(AUGMENTATION, mixup=args.mixup, cutmix=args.cutmix),
+            seed=args.augment_seed, deterministic=args.augment_seed is not None)
+    train_cache, validation_cache = load_data(args.data_dir, getattr(args, 'zip', None),
+                                              getattr(args, 'shards', None))
+    histories = train_members(models, train_cache, validation_cache, args.epochs, harnesses,
+                              monitor, augment)
+    # The head is fit on the members' outputs: its checkpoint is stale once any
+    # member trained further or settled on another best epoch
+    harnesses['ensemble'].key = {name: [harnesses[name].completed, harnesses[name].best_epoch]
+                                 for name in models}
+    ensemble_model, histories['ensemble'] = train_ensemble(
+        models, train_cache, validation_cache, args.epochs, args.jit, harnesses['ensemble'],
+        monitor, augment)
+    print(training_savings(harnesses, args.epochs, len(train_cache)))
+    if monitor is not None:
+        from evaluation import format_report
+        print(format_report(monitor.summary()))
+    save_histories(histories, args.histories)
+    ensemble_model.save(args.model)
+    return models, ensemble_model, histories
+
+
+def _cmd_ingest(args):
+    from shards import write_shards
+
+    write_shards(args.source, args.shards_dir, args.validation_split, args.shard_size,
+                 args.encoding, args.compression, seed=args.seed, workers=args.workers)
+
+
+def _cmd_visualize(args):
+    member = load_ensemble(args.model).get_layer('model_' + args.member)
+    visualize_intermediate(member, args.data_dir, args.image, args.out_dir)
+
+
+def _cmd_plot(args):
+    plot_histories(load_histories(args.histories), args.out_dir)
+
+
+def _cmd_report(args):
+    from report import build_report, load_histories as load_logs
+
+    out_dir = args.out_dir or 'report'
+    index = build_report(load_logs(args.run_dir or args.histories), out_dir,
+                         model_path=None if args.no_diagrams else args.model,
+                         styles=PLOT_STYLE, ensemble_color=COLOR_ENSEMBLE)
+    print('report written to %s' % index)
+
+
+def _cmd_export(args):
+    export_diagrams(load_ensemble(args.model), args.out_dir or '.')
+
+
+def _cmd_quantize(args):
+    from evaluation import format_report
+    from quantize import export_models, validate
+
+    ensemble_model = load_ensemble(args.model)
+    validation_dir = dataset_dirs(args.data_dir)['validation']
+    artifacts = export_models(ensemble_model, args.quant_dir, validation_dir,
+                              args.quantizations, not args.no_members, args.num_samples)
+    if not args.no_validate:
+        print(format_report(validate(ensemble_model, artifacts, validation_dir,
+                                     num_threads=args.threads)))
+
+
+def _cmd_distill(args):
+    from distill import compare, distill
+    from image_cache import load_or_build
+    from evaluation import format_report
+
+    teacher = load_ensemble(args.model)
+    dirs = dataset_dirs(args.data_dir)
+    train_cache, validation_cache = load_or_build(dirs['train']), load_or_build(dirs['validation'])
+    st = os.stat(args.model)
+    student, _ = distill(teacher, train_cache, validation_cache, args.student, args.temperature,
+                         args.alpha, args.epochs,
+                         targets_path=os.path.join(train_cache.cache_dir, 'soft_targets.npz'),
+                         targets_key='%s:%d:%d' % (os.path.abspath(args.model), st.st_size,
+                                                   st.st_mtime_ns))
+    student.save(args.student_model)
+    print(format_report(compare({'teacher': teacher, 'student': student}, validation_cache)))
+
+
+def _cmd_prune(args):
+    from ensemble import build_ensemble, compile_ensemble
+    from image_cache import load_or_build
+    from members import MEMBER_NAMES, MEMBER_SPECS
+    from prune import compare, prune_member
+    from evaluation import format_report, member_models
+
+    ensemble_model = load_ensemble(args.model)
+    members = member_models(ensemble_model)
+    dirs = dataset_dirs(args.data_dir)
+    train_cache, validation_cache = load_or_build(dirs['train']), load_or_build(dirs['validation'])
+    pruned, rows = dict(members), []
+    for name in args.members or MEMBER_NAMES:
+        pruned[name], _, rounds = prune_member(
+            members[name], MEMBER_SPECS[name], train_cache, validation_cache, args.tolerance,
+            args.fraction, args.fine_tune_steps, args.max_rounds)
+        before, after = compare({name: members[name], name + ' pruned': pruned[name]},
+                                validation_cache)
+        rows += [dict(before, rounds=0), dict(after, rounds=sum(r['accepted'] == 'yes' for r in rounds) - 1)]
+    pruned_ensemble = compile_ensemble(build_ensemble(
+        [pruned[name] for name in MEMBER_NAMES], head=ensemble_model.get_layer('ensemble_head')))
+    pruned_ensemble.save(args.pruned_model)
+    rows += [dict(row, rounds='-') for row in compare(
+        {'ensemble': ensemble_model, 'ensemble pruned': pruned_ensemble}, validation_cache)]
+    print(format_report(rows, ['model', 'rounds', 'params', 'size MB', 'latency ms',
+                               'accuracy']))
+
+
+def _cmd_search(args):
+    from evaluation import format_report
+    from search import successive_halving
+
+    dirs = dataset_dirs(args.data_dir)
+    leaderboard = successive_halving(
+        args.study, dirs['train'], dirs['validation'], n_trials=args.trials,
+        min_epochs=args.min_epochs, max_epochs=args.max_epochs, eta=args.eta,
+        steps_per_epoch=args.steps, workers=args.workers, store_path=args.db,
+        include_members=args.include_members)
+    print(format_report(leaderboard))
+
+
+def _cmd_crossval(args):
+    from crossval import cross_validate, summarize
+    from evaluation import format_report
+
+    dirs = dataset_dirs(args.data_dir)
+    results = cross_validate(dirs['train'], dirs['validation'], names=args.members,
+                             folds=args.folds, seeds=args.seeds, epochs=args.epochs,
+                             workers=args.workers, results_path=args.results)
+    print(format_report(summarize(results)))
+
+
+def _cmd_predict(args):
+    predict_images(args.images, args.model)
+
+
+def _cmd_score(args):
+    from score import score_directory
+
+    output = args.output or ('scores.csv' if args.format == 'csv' else 'scores')
+    score_directory(args.root, output, args.model, member=args.member,
+                    output_format=args.format, batch_size=args.batch_size, readers=args.readers,
+                    checkpoint_every=args.checkpoint_every, max_images=args.max_images)
+
+
+def _cmd_view(args):
+    open_in_netron(args.model)
+
+
+def _cmd_all(args):
+    _cmd_download(args)
+    explore_dataset(args.data_dir, args.out_dir)
+    models, ensemble_model, histories = _cmd_train(args)
+    visualize_intermediate(models['jordan'], args.data_dir, out_dir=args.out_dir)
+    if args.out_dir:
+        from report import build_report
+
+        build_report(histories, args.out_dir, model_path=args.model, styles=PLOT_STYLE,
+                     ensemble_color=COLOR_ENSEMBLE)
+    else:
+        plot_histories(histories)
+        export_diagrams(ensemble_model)
+
+
+def _add_download_args(p):
+    p.add_argument('--url', default=DATA_URL)
+    p.add_argument('--mirror', action='append', default=[],
+                   help='URL to try before --url (repeatable)')
+    p.add_argument('--archive', default=None,
+                   help='use this local zip instead of downloading')
+    p.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                   help='where the downloaded zip is kept (default: %(default)s)')
+    p.add_argument('--sha256', default=None,
+                   help='expected checksum of the zip')
+    p.add_argument('--no-extract', action='store_true',
+                   help='only fetch the zip (train --zip reads it in place)')
+
+
+def _add_training_args(p):
+    p.add_argument('--epochs', type=int, default=15)
+    p.add_argument('--precision', default='float32',
+                   choices=('float32', 'mixed_bfloat16', 'mixed_float16'),
+                   help='Keras dtype policy for every model (default: %(default)s)')
+    p.add_argument('--jit', action='store_true',
+                   help='compile every train step with XLA')
+    p.add_argument('--patience', type=int, default=3,
+                   help='stop a model after this many epochs without a lower val_loss '
+                        '(0: never; default: %(default)s)')
+    p.add_argument('--run-dir', default='checkpoints',
+                   help='per-model checkpoints; an interrupted train resumes from here '
+                        '(default: %(default)s)')
+    p.add_argument('--fresh', action='store_true',
+                   help='discard existing checkpoints in --run-dir first')
+    p.add_argument('--augment', action='store_true',
+                   help='random flips, rotations, zoom, shifts and colour jitter, applied to '
+                        'whole batches inside the input pipeline')
+    p.add_argument('--mixup', type=float, default=0., metavar='ALPHA',
+                   help='with --augment, also mixup with Beta(ALPHA, ALPHA)')
+    p.add_argument('--cutmix', type=float, default=0., metavar='ALPHA',
+                   help='with --augment, also cutmix with Beta(ALPHA, ALPHA)')
+    p.add_argument('--augment-seed', type=int, default=None,
+                   help='make the augmentation reproducible')
+    p.add_argument('--log-dir', default=None,
+                   help='log per-step input wait, compute, throughput and memory of every model '
+                        'here as <model>.jsonl')
+    p.add_argument('--profile-steps', type=int, nargs='*', default=[],
+                   help='with --log-dir, trace these steps of every model with the '
+                        'TensorFlow profiler (e.g. --profile-steps 20 21)')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description='Cat vs. dog convnet ensemble (NSDC Winter 2024).')
+    parser.add_argument('--data-dir', default=BASE_DIR,
+                        help='extracted cats_and_dogs_filtered directory (default: %(default)s)')
+    parser.add_argument('--model', default=MODEL_PATH,
+                        help='saved ensemble model (default: %(default)s)')
+    parser.add_argument('--histories', default=HISTORY_PATH,
+                        help='training curves written by train, read by plot (default: %(default)s)')
+    parser.add_argument('--out-dir', default=None,
+                        help='write figures here instead of showing them')
+    sub = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    p = sub.add_parser('download', help='download and extract the dataset')
+    _add_download_args(p)
+    p.set_defaults(func=_cmd_download)
+
+    p = sub.add_parser('explore', help='print dataset counts and show sample pictures')
+    p.set_defaults(func=_cmd_explore)
+
+    p = sub.add_parser('train', help='train the members and the ensemble')
+    _add_training_args(p)
+    p.add_argument('--zip', default=None,
+                   help='read images straight from this cats_and_dogs_filtered.zip')
+    p.add_argument('--shards', default=None,
+                   help='stream images from this sharded store (see ingest) instead')
+    p.set_defaults(func=_cmd_train)
+
+    p = sub.add_parser('ingest', help='convert a labelled image folder of any size (e.g. the '
+                                      'full Kaggle train/) into sharded TFRecords')
+    p.add_argument('source', help='folder with one subfolder per class, or cat.N.jpg / '
+                                  'dog.N.jpg files')
+    p.add_argument('--shards-dir', default='shards')
+    p.add_argument('--validation-split', type=float, default=0.2)
+    p.add_argument('--shard-size', type=int, default=1000, help='images per shard')
+    p.add_argument('--encoding', default='jpeg', choices=('jpeg', 'original'),
+                   help="'jpeg': resized to 150x150 and re-encoded (default); "
+                        "'original': source bytes as-is")
+    p.add_argument('--compression', default='', choices=('', 'GZIP', 'ZLIB'))
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--workers', type=int, default=None)
+    p.set_defaults(func=_cmd_ingest)
+
+    p = sub.add_parser('visualize', help='show intermediate representations of a member')
+    p.add_argument('--member', default='jordan')
+    p.add_argument('--image', default=None, help='image to visualize (default: random training image)')
+    p.set_defaults(func=_cmd_visualize)
+
+    p = sub.add_parser('plot', help='plot training curves saved by train')
+    p.set_defaults(func=_cmd_plot)
+
+    p = sub.add_parser('report', help='render every chart and diagram into an HTML bundle, headless')
+    p.add_argument('--run-dir', default=None,
+                   help='read curves from a train --run-dir instead of --histories')
+    p.add_argument('--no-diagrams', action='store_true',
+                   help="skip the architecture diagrams (they need --model, pydot and graphviz)")
+    p.set_defaults(func=_cmd_report)
+
+    p = sub.add_parser('export', help='write architecture diagrams of the saved ensemble')
+    p.set_defaults(func=_cmd_export)
+
+    p = sub.add_parser('quantize', help='export quantized TFLite models and compare them to float')
+    p.add_argument('--quant-dir', default='quantized',
+                   help='where the SavedModel and .tflite files go (default: %(default)s)')
+    p.add_argument('--quantizations', nargs='+', default=['float', 'dynamic', 'int8'],
+                   choices=('float', 'dynamic', 'int8'))
+    p.add_argument('--num-samples', type=int, default=100,
+                   help='validation images used to calibrate int8 (default: %(default)s)')
+    p.add_argument('--no-members', action='store_true', help='only export the ensemble')
+    p.add_argument('--no-validate', action='store_true',
+                   help='skip the accuracy/latency comparison')
+    p.add_argument('--threads', type=int, default=None, help='TFLite interpreter threads')
+    p.set_defaults(func=_cmd_quantize)
+
+    p = sub.add_parser('distill', help='distil the saved ensemble into one small student convnet')
+    p.add_argument('--student', default='small', choices=('small', 'tiny'))
+    p.add_argument('--temperature', type=float, default=4.0)
+    p.add_argument('--alpha', type=float, default=0.1,
+                   help='weight of the true labels vs. the teacher (default: %(default)s)')
+    p.add_argument('--epochs', type=int, default=15)
+    p.add_argument('--student-model', default='student_model.h5',
+                   help='where the student is saved (default: %(default)s)')
+    p.set_defaults(func=_cmd_distill)
+
+    p = sub.add_parser('prune', help='remove low-importance filters and dense units from the '
+                                     'members while validation accuracy holds')
+    p.add_argument('--members', nargs='+', default=None, help='members to prune (default: all)')
+    p.add_argument('--tolerance', type=float, default=0.01,
+                   help='largest accepted drop in validation accuracy (default: %(default)s)')
+    p.add_argument('--fraction', type=float, default=0.25,
+                   help='share of each layer removed per round (default: %(default)s)')
+    p.add_argument('--fine-tune-steps', type=int, default=100)
+    p.add_argument('--max-rounds', type=int, default=8)
+    p.add_argument('--pruned-model', default='pruned_ensemble_model.h5')
+    p.set_defaults(func=_cmd_prune)
+
+    p = sub.add_parser('search', help='successive-halving search over member architectures')
+    p.add_argument('--study', default='members', help='rerun a study by name to resume it')
+    p.add_argument('--trials', type=int, default=27)
+    p.add_argument('--min-epochs', type=int, default=1)
+    p.add_argument('--max-epochs', type=int, default=9)
+    p.add_argument('--eta', type=int, default=3,
+                   help='keep the best 1/eta trials per rung (default: %(default)s)')
+    p.add_argument('--steps', type=int, default=100, help='steps per epoch')
+    p.add_argument('--workers', type=int, default=None)
+    p.add_argument('--db', default='search.db', help='SQLite results store')
+    p.add_argument('--include-members', action='store_true',
+                   help='also enter the eight hand-picked members as trials')
+    p.set_defaults(func=_cmd_search)
+
+    p = sub.add_parser('crossval', help='k-fold x multi-seed accuracy and loss of the members')
+    p.add_argument('--members', nargs='+', default=None, help='default: all eight')
+    p.add_argument('--folds', type=int, default=5)
+    p.add_argument('--seeds', type=int, nargs='+', default=[0])
+    p.add_argument('--epochs', type=int, default=15)
+    p.add_argument('--workers', type=int, default=None)
+    p.add_argument('--results', default='crossval.jsonl',
+                   help='per-job results; rerun with the same file to resume')
+    p.set_defaults(func=_cmd_crossval)
+
+    p = sub.add_parser('predict', help='classify images with the saved model')
+    p.add_argument('images', nargs='+')
+    p.set_defaults(func=_cmd_predict)
+
+    p = sub.add_parser('score', help='score every image under a directory tree into CSV / '
+                                     'Parquet, resumable')
+    p.add_argument('root')
+    p.add_argument('--output', default=None,
+                   help='scores.csv, or the directory scores/ for parquet (default)')
+    p.add_argument('--format', default='csv', choices=('csv', 'parquet'))
+    p.add_argument('--member', default=None, help='score with one member instead of the ensemble')
+    p.add_argument('--batch-size', type=int, default=256)
+    p.add_argument('--readers', type=int, default=None,
+                   help='parallel image decodes (default: autotuned)')
+    p.add_argument('--checkpoint-every', type=int, default=5000, metavar='N',
+                   help='flush the output and checkpoint every N images')
+    p.add_argument('--max-images', type=int, default=None,
+                   help='stop after N more images; rerun to continue')
+    p.set_defaults(func=_cmd_score)
+
+    p = sub.add_parser('view', help='open the saved model in netron')
+    p.set_defaults(func=_cmd_view)
+
+    p = sub.add_parser('all', help='run every step, like the original notebook')
+    _add_download_args(p)
+    _add_training_args(p)
+    p.set_defaults(func=_cmd_all)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Structured pruning of the member convnets: whole filters and dense units, not sparse weights.
+
+`prune_step` ranks the filters of every hidden conv layer and the units of
+every hidden dense layer, then drops the weakest `fraction` of each. It
+returns a narrower model built from a spec with fewer `filters` / `units`,
+with the surviving weights copied over, including the batchnorm statistics
+and the matching rows of the Flatten->Dense kernel. The result is smaller
+and faster, not merely sparse. Filters are ranked by the L1 norm of their
+kernel, times |gamma| / sqrt(var) when a batchnorm follows. Dense units are
+ranked by the L1 norm of their incoming weights times that of their
+outgoing weights.
+
+`prune_member` repeats prune -> fine-tune -> validate. It stops as soon as
+validation accuracy falls more than `tolerance` below the unpruned member's
+and keeps the last model that stayed within it.
+
+    pruned, spec, rounds = prune_member(member, MEMBER_SPECS['evan'], train_cache,
+                                        validation_cache, tolerance=0.01)
+    print(format_report(compare({'evan': member, 'evan pruned': pruned}, validation_cache)))
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from members import INPUT_SHAPE, build_from_spec, compile_from_spec
+
+# Keras' BatchNormalization default
+_BN_EPSILON = 1e-3
+
+
+def _keep(scores, fraction, min_units):
+    """Sorted indices of the units to keep: all but the lowest-scoring `fraction`."""
+    n = len(scores)
+    n_keep = max(min(n, min_units), n - int(round(fraction * n)))
+    return np.sort(np.argsort(-scores, kind='stable')[:n_keep])
+
+
+def prune_step(model, spec, fraction=0.25, min_units=4):
+    """`(narrower compiled model, its spec)` with `fraction` of every hidden layer removed.
+
+    `model` is a member built from `spec` (or loaded from the ensemble);
+    layers never shrink below `min_units`.
+    """
+    entries = list(spec['layers']) + [('output', {})]
+    weights = [layer.get_weights() for layer in model.layers]
+    # Surviving channels (or flattened features) entering each layer
+    keep = np.arange(INPUT_SHAPE[-1])
+    new_layers, new_weights = [], []
+    for i, (kind, kwargs) in enumerate(entries):
+        kwargs, w = dict(kwargs), weights[i]
+        if kind == 'conv':
+            kernel, bias = w[0][:, :, keep, :], w[1]
+            scores = np.abs(kernel).sum(axis=(0, 1, 2))
+            if i + 1 < len(entries) and entries[i + 1][0] == 'batchnorm':
+                gamma, _, _, variance = weights[i + 1]
+                scores = scores * np.abs(gamma) / np.sqrt(variance + _BN_EPSILON)
+            keep = _keep(scores, fraction, min_units)
+            w = [kernel[..., keep], bias[keep]]
+            kwargs['filters'] = len(keep)
+        elif kind == 'batchnorm':
+            w = [v[keep] for v in w]
+        elif kind == 'flatten':
+            # Flatten is row-major over (height, width, channels)
+            height, width, channels = model.layers[i].input.shape[1:]
+            keep = (np.arange(height * width)[:, None] * channels + keep).reshape(-1)
+        elif kind == 'dense':
+            kernel, bias = w[0][keep], w[1]
+            following = next(weights[j][0] for j in range(i + 1, len(entries))
+                             if entries[j][0] in ('dense', 'output'))
+            scores = np.abs(kernel).sum(axis=0) * np.abs(following).sum(axis=1)
+            keep = _keep(scores, fraction, min_units)
+            w = [kernel[:, keep], bias[keep]]
+            kwargs['units'] = len(keep)
+        elif kind == 'output':
+            w = [w[0][keep], w[1]]
+        if kind != 'output':
+            new_layers.append((kind, kwargs))
+        new_weights.append(w)
+
+    new_spec = dict(spec, layers=new_layers)
+    pruned = build_from_spec(new_spec, name=model.name)
+    for layer, w in zip(pruned.layers, new_weights):
+        layer.set_weights(w)
+    return compile_from_spec(pruned, new_spec), new_spec
+
+
+def prune_member(model, spec, train_cache, validation_cache, tolerance=0.01, fraction=0.25,
+                 fine_tune_steps=100, max_rounds=8, min_units=4, batch_size=20, verbose=1):
+    """Prune `model` round by round until validation accuracy drops past `tolerance`.
+
+    Every round removes `fraction` of each hidden layer and fine-tunes for
+    `fine_tune_steps` batches with the member's own optimizer. Returns
+    `(model, spec, rounds)`, the last model within tolerance (possibly
+    `model` itself), and one `{round, params, accuracy, accepted}` row per
+    round tried.
+    """
+    from evaluation import evaluate, keras_predictor
+
+    baseline, _ = evaluate(keras_predictor(model), validation_cache, latency_runs=0)
+    rounds = [{'round': 0, 'params': model.count_params(), 'accuracy': baseline,
+               'accepted': 'yes'}]
+    train = train_cache.dataset(batch_size)
+    best, best_spec = model, spec
+    for round_ in range(1, max_rounds + 1):
+        candidate, candidate_spec = prune_step(best, best_spec, fraction, min_units)
+        if candidate.count_params() == best.count_params():
+            break
+        candidate.fit(train, steps_per_epoch=fine_tune_steps, epochs=1, verbose=0)
+        accuracy, _ = evaluate(keras_predictor(candidate), validation_cache, latency_runs=0)
+        accepted = accuracy >= baseline - tolerance
+        rounds.append({'round': round_, 'params': candidate.count_params(),
+                       'accuracy': accuracy, 'accepted': 'yes' if accepted else 'no'})
+        if verbose:
+            print('%s round %d: %d params, val acc %.4f (baseline %.4f)%s' % (
+                model.name, round_, candidate.count_params(), accuracy, baseline,
+                '' if accepted else ', over tolerance, stopping'))
+        if not accepted:
+            break
+        best, best_spec = candidate, candidate_spec
+    return best, best_spec, rounds
+
+
+def file_size_mb(model):
+    """Size of `model` saved as `.h5` without optimizer state, in MB."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.h5')
+        model.save(path, include_optimizer=False)
+        return os.path.getsize(path) / 2 ** 20
+
+
+def compare(models, validation_cache, latency_runs=50):
+    """Params, file size, single-image CPU latency and validation accuracy of `{name: model}`."""
+    from evaluation import evaluate, keras_predictor
+
+    rows = []
+    for name, model in models.items():
+        accuracy, latency = evaluate(keras_predictor(model), validation_cache,
+                                     latency_runs=latency_runs)
+        rows.append({'model': name, 'params': model.count_params(),
+                     'size MB': file_size_mb(model), 'latency ms': 1000 * latency,
+                     'accuracy': accuracy})
+    return rows
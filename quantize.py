@@ -0,0 +1,180 @@
+"""Quantized TFLite export of the ensemble and its members, plus a validator.
+
+    ensemble_model = tf.keras.models.load_model('ensemble_model.h5')
+    artifacts = export_models(ensemble_model, 'quantized', validation_dir)
+    print(evaluation.format_report(validate(ensemble_model, artifacts, validation_dir)))
+
+Every model (the ensemble and each `model_*` member inside it) is written as a
+float32 SavedModel and converted from that to TFLite three ways:
+
+* `float`: no quantization, the TFLite baseline.
+* `dynamic`: dynamic-range quantization. Weights are stored as int8, while
+  activations stay float and are quantized on the fly.
+* `int8`: full integer quantization. Activation ranges are calibrated on
+  images drawn from the validation split, and the model takes uint8 pixels
+  and returns a uint8 probability.
+
+`validate` runs every artifact over the validation split and reports its
+size, accuracy, accuracy delta and median single-image latency against the
+float Keras model.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from evaluation import evaluate, keras_predictor, member_models
+
+QUANTIZATIONS = ('float', 'dynamic', 'int8')
+
+
+def representative_dataset(cache, num_samples=100, seed=0):
+    """Calibration generator over `num_samples` random images of an `ImageCache`."""
+    indices = np.random.default_rng(seed).permutation(len(cache))[:num_samples]
+
+    def generate():
+        for i in np.sort(indices):
+            yield [cache.images[i:i + 1].astype(np.float32) / 255.]
+    return generate
+
+
+def convert(saved_model_dir, quantization='dynamic', representative_data=None):
+    """Convert a SavedModel to a TFLite flatbuffer, returned as bytes."""
+    import tensorflow as tf
+
+    if quantization not in QUANTIZATIONS:
+        raise ValueError('quantization must be one of %s, got %r' % (QUANTIZATIONS, quantization))
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    if quantization != 'float':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'int8':
+        if representative_data is None:
+            raise ValueError('int8 quantization needs representative_data')
+        converter.representative_dataset = representative_data
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+    return converter.convert()
+
+
+def _size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(dirpath, f))
+               for dirpath, _, files in os.walk(path) for f in files)
+
+
+def export_models(ensemble_model, out_dir, validation_dir, quantizations=QUANTIZATIONS,
+                  include_members=True, num_samples=100, verbose=True):
+    """Write SavedModel and TFLite artifacts for the ensemble (and its members).
+
+    Files go to `out_dir/<name>/saved_model` and `out_dir/<name>/<name>_<q>.tflite`,
+    and are listed in `out_dir/artifacts.json`. Returns that list, one dict
+    per artifact with `model`, `format`, `path` and `bytes`.
+    """
+    from image_cache import load_or_build
+
+    models = {'ensemble': ensemble_model}
+    if include_members:
+        models.update(member_models(ensemble_model))
+    representative = representative_dataset(load_or_build(validation_dir), num_samples)
+
+    artifacts = []
+    for name, model in models.items():
+        model_dir = os.path.join(out_dir, name)
+        saved_model = os.path.join(model_dir, 'saved_model')
+        os.makedirs(model_dir, exist_ok=True)
+        model.export(saved_model, verbose=False)
+        artifacts.append({'model': name, 'format': 'saved_model', 'path': saved_model,
+                          'bytes': _size(saved_model)})
+        for quantization in quantizations:
+            path = os.path.join(model_dir, '%s_%s.tflite' % (name, quantization))
+            with open(path, 'wb') as f:
+                f.write(convert(saved_model, quantization, representative))
+            artifacts.append({'model': name, 'format': quantization, 'path': path,
+                              'bytes': _size(path)})
+            if verbose:
+                print('wrote %s (%.2f MB)' % (path, artifacts[-1]['bytes'] / 2**20))
+
+    with open(os.path.join(out_dir, 'artifacts.json'), 'w') as f:
+        json.dump(artifacts, f, indent=1)
+    return artifacts
+
+
+class TFLiteModel:
+    """Run a `.tflite` model with the same contract as `InferenceEngine.predict`.
+
+    Takes float32 images in `[0, 1]` or uint8 images and returns a 1-D array
+    of dog probabilities; quantized inputs and outputs are converted with the
+    model's own scale and zero point.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        import tensorflow as tf
+
+        self.model_path = model_path
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+
+    def _quantize(self, images):
+        dtype = self._input['dtype']
+        scale, zero_point = self._input['quantization']
+        if dtype == np.float32:
+            if images.dtype == np.uint8:
+                return images.astype(np.float32) / 255.
+            return images.astype(np.float32, copy=False)
+        if images.dtype == np.uint8 and dtype == np.uint8 and zero_point == 0 \
+                and np.isclose(scale, 1 / 255.):
+            # The calibrated input range is exactly the pixel range
+            return images
+        if images.dtype == np.uint8:
+            images = images.astype(np.float32) / 255.
+        info = np.iinfo(dtype)
+        return np.clip(np.round(images / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def predict(self, images):
+        images = np.asarray(images).reshape((-1,) + INPUT_SHAPE)
+        if len(images) != self._batch_size:
+            self.interpreter.resize_tensor_input(self._input['index'], images.shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = len(images)
+        self.interpreter.set_tensor(self._input['index'], self._quantize(images))
+        self.interpreter.invoke()
+        outputs = self.interpreter.get_tensor(self._output['index']).reshape(-1)
+        scale, zero_point = self._output['quantization']
+        if self._output['dtype'] != np.float32:
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+        return outputs
+
+
+def validate(ensemble_model, artifacts, validation_dir, batch_size=32, latency_runs=50,
+             num_threads=None):
+    """Compare every artifact against its float Keras model on the validation split.
+
+    The SavedModel row is the float reference: its accuracy and latency come
+    from the Keras model itself. Returns one row per artifact with `model`,
+    `format`, `size MB`, `accuracy`, `accuracy delta` and `latency ms`.
+    """
+    from image_cache import load_or_build
+
+    cache = load_or_build(validation_dir)
+    models = {'ensemble': ensemble_model}
+    models.update(member_models(ensemble_model))
+
+    rows, reference = [], {}
+    for artifact in artifacts:
+        name = artifact['model']
+        if artifact['format'] == 'saved_model':
+            predict = keras_predictor(models[name])
+        else:
+            predict = TFLiteModel(artifact['path'], num_threads).predict
+        accuracy, latency = evaluate(predict, cache, batch_size, latency_runs)
+        reference.setdefault(name, accuracy)
+        rows.append({'model': name, 'format': artifact['format'],
+                     'size MB': artifact['bytes'] / 2**20, 'accuracy': accuracy,
+                     'accuracy delta': accuracy - reference[name],
+                     'latency ms': 1000 * latency})
+    return rows
@@ -0,0 +1,237 @@
+"""Headless HTML/PNG report of training curves and architecture diagrams.
+
+    build_report(histories, 'report', model_path='ensemble_model.h5', styles=PLOT_STYLE)
+
+`histories` maps a model name to a Keras `History`, a plain `{metric: [...]}`
+dict, or whatever `load_histories` read from disk (`histories.json` or a
+harness run directory). Metric names are normalised first, so members
+compiled with `metrics=['acc']` and ones compiled with `['accuracy']` land on
+the same `accuracy` / `val_accuracy` keys.
+
+Every chart is described by a small picklable dict (`chart_specs`) and
+rendered with the Agg backend in a pool of worker processes. The diagrams
+load the saved model in their own worker, so the whole bundle is one
+parallel, display-free pass:
+
+    report/index.html      summary table plus every image
+    report/metrics.json    the normalised histories
+    report/*.png
+"""
+
+import html
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Old or alternative Keras metric names -> the name the report uses
+METRIC_ALIASES = {'acc': 'accuracy', 'label_accuracy': 'accuracy', 'lr': 'learning_rate'}
+
+
+def normalize_metrics(history):
+    """`{metric: [float, ...]}` with aliases like `acc` / `val_acc` renamed."""
+    history = getattr(history, 'history', history)
+    normalized = {}
+    for key, values in history.items():
+        prefix = 'val_' if key.startswith('val_') else ''
+        base = key[len(prefix):]
+        normalized[prefix + METRIC_ALIASES.get(base, base)] = [float(v) for v in values]
+    return normalized
+
+
+def load_histories(path):
+    """Histories from a `histories.json` file or a harness run directory."""
+    if os.path.isdir(path):
+        histories = {}
+        for name in sorted(os.listdir(path)):
+            try:
+                with open(os.path.join(path, name, 'state.json')) as f:
+                    histories[name] = json.load(f)['history']
+            except (OSError, ValueError, KeyError):
+                continue
+        return histories
+    with open(path) as f:
+        return json.load(f)
+
+
+def summarize(histories):
+    """One row per model: epochs, final and best validation accuracy, final val loss."""
+    rows = []
+    for name, history in histories.items():
+        val_accuracy = history.get('val_accuracy') or [float('nan')]
+        rows.append({'model': name, 'epochs': len(history.get('loss', [])),
+                     'final val acc': val_accuracy[-1], 'best val acc': max(val_accuracy),
+                     'final val loss': (history.get('val_loss') or [float('nan')])[-1]})
+    return rows
+
+
+def chart_specs(histories, styles=None, ensemble_color='black'):
+    """The report's charts as picklable dicts, from normalised `histories`.
+
+    Members (every name but `ensemble`) share one accuracy and one loss chart,
+    dashed for training and solid for validation. The member with the best
+    final validation accuracy and the ensemble get charts of their own.
+    """
+    styles = styles or {}
+    members = [name for name in histories if name != 'ensemble']
+    specs = []
+    for metric, word, plural in (('accuracy', 'Acc', 'accuracies'), ('loss', 'Loss', 'losses')):
+        series = []
+        for i, name in enumerate(members):
+            label, color = styles.get(name, (name, 'C%d' % i))
+            series += [('%s Training %s' % (label, word), histories[name].get(metric, []),
+                        '--', color),
+                       ('%s Validation %s' % (label, word),
+                        histories[name].get('val_' + metric, []), '-', color)]
+        specs.append({
+            'filename': 'members_%s.png' % metric,
+            'title': 'Training and Validation %s for Individual Models' % (
+                'Accuracy' if metric == 'accuracy' else 'Losses'),
+            'ylabel': 'Accuracy' if metric == 'accuracy' else 'Loss',
+            'note': 'Dashed lines: training %s \n Solid lines: validation %s' % (plural, plural),
+            'series': series, 'figsize': (14, 8)})
+
+    scored = [name for name in members if histories[name].get('val_accuracy')]
+    if scored:
+        best = max(scored, key=lambda name: histories[name]['val_accuracy'][-1])
+        label, color = styles.get(best, (best, 'C0'))
+        specs.append({
+            'filename': 'best_model_accuracy.png',
+            'title': "Best Performing Model's accuracy (%s)" % best,
+            'series': [('%s Training Acc' % label, histories[best].get('accuracy', []), '--',
+                        color),
+                       ('%s Validation Acc' % label, histories[best]['val_accuracy'], '-',
+                        color)]})
+
+    if 'ensemble' in histories:
+        history = histories['ensemble']
+        for metric, word, title in (('accuracy', 'Acc', 'Accuracy'), ('loss', 'Loss', 'Loss')):
+            specs.append({
+                'filename': 'ensemble_%s.png' % metric,
+                'title': 'Training and Validation %s' % title,
+                'series': [('Ensemble Training %s' % word, history.get(metric, []), '--',
+                            ensemble_color),
+                           ('Ensemble Validation %s' % word, history.get('val_' + metric, []),
+                            '-', ensemble_color)]})
+    return specs
+
+
+def render_chart(spec, out_dir=None):
+    """Draw one chart spec with Agg and save it under `out_dir`; returns the path.
+
+    Without `out_dir` the chart is shown instead, on whatever backend is active.
+    """
+    import matplotlib
+    if out_dir:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=spec.get('figsize'))
+    for label, values, style, color in spec['series']:
+        plt.plot(values, style, label=label, color=color)
+    plt.xlabel('Epochs')
+    plt.ylabel(spec.get('ylabel', ''))
+    plt.title(spec['title'])
+    plt.legend(fontsize='small')
+    if spec.get('note'):
+        plt.annotate(spec['note'], (0.5, 0.01), xycoords='figure fraction', ha='center')
+    if not out_dir:
+        plt.show()
+        return None
+    path = os.path.join(out_dir, spec['filename'])
+    fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def write_diagrams(ensemble_model, out_dir='.'):
+    """Write model.png, model_partial.png and model_with_title.png (needs pydot and graphviz)."""
+    from tensorflow.keras import Model
+    from tensorflow.keras.utils import plot_model
+    from PIL import Image, ImageDraw, ImageFont
+
+    model_png = os.path.join(out_dir, 'model.png')
+    plot_model(ensemble_model, to_file=model_png, show_shapes=True, show_layer_names=True)
+    if not os.path.exists(model_png):
+        # Keras 3 only prints a message when pydot / graphviz are missing
+        raise ImportError('plot_model needs pydot and graphviz')
+
+    # The layers up to the averaging layer of the ensemble
+    model_partial = Model(inputs=ensemble_model.inputs, outputs=ensemble_model.layers[9].output)
+    plot_model(model_partial, to_file=os.path.join(out_dir, 'model_partial.png'),
+               show_shapes=True, show_layer_names=True)
+
+    img = Image.open(model_png)
+    draw = ImageDraw.Draw(img)
+    draw.text((0, 0), "Model Visualization", (0, 0, 0), font=ImageFont.load_default())
+    img.save(os.path.join(out_dir, 'model_with_title.png'))
+    return [model_png, os.path.join(out_dir, 'model_partial.png'),
+            os.path.join(out_dir, 'model_with_title.png')]
+
+
+def _render_diagrams(model_path, out_dir):
+    import tensorflow as tf
+
+    try:
+        return write_diagrams(tf.keras.models.load_model(model_path, compile=False), out_dir)
+    except ImportError as e:
+        return 'architecture diagrams skipped: %s' % e
+
+
+def _cell(value):
+    if isinstance(value, str):
+        return html.escape(value)
+    return '%d' % value if isinstance(value, int) else '%.4f' % value
+
+
+def _html(title, rows, images, notes):
+    columns = list(rows[0]) if rows else []
+    table = ''.join('<tr>%s</tr>' % ''.join('<td>%s</td>' % _cell(row[c]) for c in columns)
+                    for row in rows)
+    return '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>body {{ font-family: sans-serif; margin: 2em; }}
+td, th {{ padding: 0 1em; text-align: right; }}
+img {{ max-width: 100%; display: block; margin: 1em 0; }}</style></head>
+<body><h1>{title}</h1>
+<table><tr>{head}</tr>{table}</table>
+{notes}
+{images}
+</body></html>
+'''.format(title=html.escape(title),
+           head=''.join('<th>%s</th>' % html.escape(c) for c in columns), table=table,
+           notes=''.join('<p>%s</p>' % html.escape(n) for n in notes),
+           images=''.join('<h2>%s</h2><img src="%s">' % (html.escape(os.path.splitext(i)[0]),
+                                                        html.escape(i)) for i in images))
+
+
+def build_report(histories, out_dir='report', model_path=None, styles=None,
+                 ensemble_color='black', workers=None, title='Training report'):
+    """Render every chart (and, with `model_path`, the diagrams) in parallel into `out_dir`.
+
+    Returns the path of `index.html`.
+    """
+    histories = {name: normalize_metrics(h) for name, h in histories.items()}
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'metrics.json'), 'w') as f:
+        json.dump(histories, f)
+
+    specs = chart_specs(histories, styles, ensemble_color)
+    jobs = len(specs) + (model_path is not None)
+    images, notes = [], []
+    with ProcessPoolExecutor(max_workers=workers or min(jobs, os.cpu_count() or 1),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        diagrams = pool.submit(_render_diagrams, model_path, out_dir) if model_path else None
+        for path in pool.map(render_chart, specs, [out_dir] * len(specs)):
+            images.append(os.path.basename(path))
+        if diagrams is not None:
+            result = diagrams.result()
+            if isinstance(result, str):
+                notes.append(result)
+            else:
+                images += [os.path.basename(path) for path in result]
+
+    index = os.path.join(out_dir, 'index.html')
+    with open(index, 'w') as f:
+        f.write(_html(title, summarize(histories), images, notes))
+    return index
@@ -0,0 +1,261 @@
+"""Bulk offline scoring of image directory trees of any size, streamed to CSV or Parquet.
+
+    summary = score_directory('/data/new_images', 'scores.csv')
+    summary = score_directory('/data/new_images', 'scores', output_format='parquet',
+                              member='evan')
+
+The tree is walked lazily in sorted order, so a million-file tree is never
+listed in memory. Files are read and decoded by tf.data's parallel map (the
+reader pool) and batched. The model runs through `inference.InferenceEngine`
+in large batches. Each batch's `(path, probability, label)` rows go straight
+to the output, and the paths are relative to the root. Files that fail to
+read or decode get a row with an empty probability and the label `error`.
+They never stop the job.
+
+Every `checkpoint_every` images the output is flushed to disk and a
+checkpoint is written atomically next to it. It records how many files of
+the walk are done and where the output ends. An interrupted job started
+again with the same arguments truncates the output to that point and skips
+that many files. It then carries on, with no duplicate or missing rows. A
+CSV is one file, appended to. Parquet output is a directory of
+`part-NNNNN.parquet` files, one per checkpoint, which needs pyarrow.
+Memory stays bounded either way: a few batches in flight plus at most one
+checkpoint interval of Parquet rows.
+"""
+
+import csv
+import json
+import os
+import time
+
+from data_pipeline import IMAGE_EXTENSIONS, IMAGE_SIZE
+
+FORMATS = ('csv', 'parquet')
+COLUMNS = ('path', 'probability', 'label')
+
+
+def walk_images(root, start=0):
+    """Yield `(index, path)` of every image under `root` in a stable sorted order, from `start`."""
+    index = 0
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if index >= start:
+                yield index, os.path.join(directory, name)
+            index += 1
+
+
+class _CsvWriter:
+    def __init__(self, path, position):
+        fresh = position is None
+        self.file = open(path, 'w' if fresh else 'r+', newline='')
+        if not fresh:
+            # Rows written after the last checkpoint are scored again
+            self.file.seek(position)
+            self.file.truncate()
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        if fresh:
+            self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows((path, '' if p is None else '%.6f' % p, label)
+                              for path, p, label in rows)
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, directory, position):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError('Parquet output needs pyarrow (pip install pyarrow); '
+                              'or write CSV') from None
+
+        self.directory = directory
+        self.part = position or 0
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            # Parts beyond the checkpoint are from the interrupted run
+            if name.startswith('part-') and int(name[5:10]) >= self.part:
+                os.remove(os.path.join(directory, name))
+        self.rows = []
+
+    def write(self, rows):
+        self.rows.extend(rows)
+
+    def commit(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.rows:
+            paths, probabilities, labels = zip(*self.rows)
+            table = pa.table({'path': pa.array(paths, pa.string()),
+                              'probability': pa.array(probabilities, pa.float32()),
+                              'label': pa.array(labels, pa.string())})
+            path = os.path.join(self.directory, 'part-%05d.parquet' % self.part)
+            pq.write_table(table, path + '.tmp')
+            os.replace(path + '.tmp', path)
+            self.part, self.rows = self.part + 1, []
+        return self.part
+
+    def close(self):
+        pass
+
+
+def _model_fingerprint(model_path, member):
+    st = os.stat(model_path)
+    return {'model': os.path.abspath(model_path), 'member': member, 'model_size': st.st_size,
+            'model_mtime_ns': st.st_mtime_ns}
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checkpoint(path, checkpoint):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def score_directory(root, output, model_path='ensemble_model.h5', member=None,
+                    output_format='csv', batch_size=256, readers=None, checkpoint_every=5000,
+                    max_images=None, target_size=IMAGE_SIZE, verbose=1):
+    """Score every image under `root` into `output`, resuming from `output`'s checkpoint.
+
+    `readers` is the number of parallel decodes (default: autotuned).
+    `max_images` stops after that many more files, leaving a checkpoint to
+    resume from. Returns a summary dict with `images/s` end to end.
+    """
+    import tensorflow as tf
+
+    from data_pipeline import AUTOTUNE, decode_and_resize
+    from inference import InferenceEngine
+
+    if output_format not in FORMATS:
+        raise ValueError('output_format must be one of %r, got %r' % (FORMATS, output_format))
+    checkpoint_path = output.rstrip('/') + '.checkpoint.json'
+    fingerprint = dict(_model_fingerprint(model_path, member), root=os.path.abspath(root),
+                       format=output_format)
+    checkpoint = _read_checkpoint(checkpoint_path)
+    if checkpoint is not None and {k: checkpoint[k] for k in fingerprint} != fingerprint:
+        raise ValueError('%s belongs to a job with other arguments or another model; '
+                         'remove it (and %s) to start over' % (checkpoint_path, output))
+    if checkpoint is not None and checkpoint['done']:
+        if verbose:
+            print('%s is complete (%d images)' % (output, checkpoint['next_index']))
+        return dict(checkpoint, images=0, seconds=0., **{'images/s': 0.})
+    if checkpoint is None:
+        checkpoint = dict(fingerprint, next_index=0, last_path=None, position=None, errors=0,
+                          done=False)
+    start_index = checkpoint['next_index']
+
+    # Paths handed to the pipeline but not yet seen in a batch; a gap in the
+    # indices of a batch is a file that failed and was dropped
+    in_flight = {}
+    exhausted = False
+
+    def paths():
+        nonlocal exhausted
+        for index, path in walk_images(root, start_index):
+            if max_images is not None and index >= start_index + max_images:
+                return
+            in_flight[index] = path
+            yield index, path
+        exhausted = True
+
+    if start_index and checkpoint['last_path'] is not None:
+        previous = next(walk_images(root, start_index - 1), (None, None))[1]
+        if previous != checkpoint['last_path']:
+            raise ValueError('%s changed since the checkpoint (file %d is now %r, was %r); '
+                             'remove %s to start over' % (root, start_index - 1, previous,
+                                                          checkpoint['last_path'],
+                                                          checkpoint_path))
+
+    ds = tf.data.Dataset.from_generator(paths, output_signature=(
+        tf.TensorSpec((), tf.int64), tf.TensorSpec((), tf.string)))
+    ds = ds.map(lambda index, path: (index, decode_and_resize(path, target_size)),
+                num_parallel_calls=readers or AUTOTUNE, deterministic=True)
+    ds = ds.ignore_errors().batch(batch_size).prefetch(2)
+
+    writer = (_CsvWriter if output_format == 'csv' else _ParquetWriter)(
+        output, checkpoint['position'])
+    engine = None
+    next_index, since_checkpoint, scored, errors = start_index, 0, 0, 0
+    previous_errors = checkpoint['errors']
+    last_path = checkpoint['last_path']
+
+    def failed_until(index):
+        """Error rows for files `next_index .. index - 1`, which never reached a batch."""
+        nonlocal next_index, errors, last_path
+        rows = []
+        while next_index < index:
+            last_path = in_flight.pop(next_index)
+            rows.append((os.path.relpath(last_path, root), None, 'error'))
+            next_index += 1
+            errors += 1
+        return rows
+
+    def commit():
+        nonlocal since_checkpoint
+        checkpoint.update(next_index=next_index, position=writer.commit(),
+                          errors=previous_errors + errors, last_path=last_path)
+        _write_checkpoint(checkpoint_path, checkpoint)
+        since_checkpoint = 0
+
+    try:
+        engine = InferenceEngine(model_path, max_batch_size=batch_size, member=member)
+        start = last_report = time.perf_counter()
+        for indices, images in ds:
+            indices = indices.numpy()
+            probabilities = engine.predict(images.numpy())
+            rows = []
+            for index, p in zip(indices, probabilities):
+                rows += failed_until(index)
+                last_path = in_flight.pop(index)
+                rows.append((os.path.relpath(last_path, root), float(p),
+                             'dog' if p >= 0.5 else 'cat'))
+                next_index += 1
+            writer.write(rows)
+            scored += len(rows)
+            since_checkpoint += len(rows)
+            if since_checkpoint >= checkpoint_every:
+                commit()
+            if verbose and time.perf_counter() - last_report > 10:
+                last_report = time.perf_counter()
+                print('%d images, %.1f images/s' % (next_index, (next_index - start_index) /
+                                                    (last_report - start)), flush=True)
+        # Whatever is still in flight failed after the last good file
+        if in_flight:
+            rows = failed_until(max(in_flight) + 1)
+            writer.write(rows)
+            scored += len(rows)
+        checkpoint['done'] = exhausted
+        commit()
+    finally:
+        if engine is not None:
+            engine.close()
+        writer.close()
+
+    seconds = time.perf_counter() - start
+    summary = {'images': scored, 'errors': errors, 'seconds': seconds,
+               'images/s': scored / seconds if seconds else 0., 'resumed_from': start_index,
+               'next_index': next_index, 'done': checkpoint['done']}
+    if verbose:
+        print('%d images (%d unreadable) in %.1fs: %.1f images/s end to end%s' % (
+            scored, errors, seconds, summary['images/s'],
+            '' if checkpoint['done'] else '; rerun to continue from file %d' % next_index))
+    return summary
@@ -0,0 +1,231 @@
+"""Parallel successive-halving search over member architectures and optimizers.
+
+The eight members are points in one space: a stack of conv/pool blocks
+(filters, kernel size, initializer, pooling, batchnorm, dropout), a dense
+layer and an optimizer with a learning rate. `SEARCH_SPACE` spans the choices
+the hand-written members made. `sample_params` draws a point from it, and
+`params_to_spec` turns it into a member spec that `members.build_from_spec`
+can build.
+
+`successive_halving` starts `n_trials` configurations (optionally plus the
+eight hand-picked members) on a `min_epochs` budget. After each rung only the
+best `1/eta` by validation loss go on, and their budget grows by a factor of
+`eta`, up to `max_epochs`. Trials are trained in a pool of spawned worker
+processes, like `parallel_training`. Each survivor continues from its
+`harness.TrainingHarness` checkpoint rather than starting over, so a trial
+that reaches the last rung has cost exactly `max_epochs` epochs.
+
+Every trial and every rung result goes into a SQLite `ResultsStore`. Rerunning
+a study with the same name picks up where it stopped.
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+SEARCH_SPACE = {
+    'conv_blocks': [2, 3, 4, 5],
+    'filters': [4, 8, 16, 20, 32, 40, 64],
+    'filter_growth': [1., 1.5, 2., 3.],
+    'kernel_size': [2, 3, 4],
+    'initializer': ['glorot_uniform', 'glorot_normal', 'he_normal', 'lecun_uniform',
+                    'random_normal'],
+    'pooling': ['max', 'avg'],
+    'batchnorm': [False, True],
+    'dropout': [0., 0.2, 0.3],
+    'dense_units': [64, 128, 512, 616, 700],
+    'optimizer': ['Adadelta', 'Adam', 'Adamax', 'RMSprop', 'SGD'],
+}
+
+# Log-uniform learning rate range per optimizer
+LEARNING_RATES = {
+    'Adadelta': (0.1, 1.0),
+    'Adam': (1e-4, 3e-3),
+    'Adamax': (3e-4, 1e-2),
+    'RMSprop': (1e-4, 3e-3),
+    'SGD': (1e-3, 1e-1),
+}
+
+
+def sample_params(rng, space=SEARCH_SPACE):
+    """Draw one point of `space` (plus a learning rate) with a `np.random.Generator`."""
+    params = {key: choices[rng.integers(len(choices))] for key, choices in space.items()}
+    params = {k: v.item() if hasattr(v, 'item') else v for k, v in params.items()}
+    low, high = LEARNING_RATES[params['optimizer']]
+    params['learning_rate'] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+    return params
+
+
+def params_to_spec(params, input_size=150):
+    """Member spec for a point of the search space.
+
+    Blocks that would shrink the feature map below the kernel size are
+    dropped, so every sampled point builds.
+    """
+    layers, size, filters = [], input_size, float(params['filters'])
+    kernel = params['kernel_size']
+    for _ in range(params['conv_blocks']):
+        if (size - kernel + 1) // 2 < 1:
+            break
+        layers.append(('conv', {'filters': int(round(filters)), 'kernel_size': kernel,
+                                'kernel_initializer': params['initializer']}))
+        if params['batchnorm']:
+            layers.append(('batchnorm', {}))
+        layers.append(('%spool' % params['pooling'], {'pool_size': 2}))
+        if params['dropout']:
+            layers.append(('dropout', {'rate': params['dropout']}))
+        size = (size - kernel + 1) // 2
+        filters *= params['filter_growth']
+    layers += [('flatten', {}), ('dense', {'units': params['dense_units']})]
+    return {'layers': layers,
+            'optimizer': (params['optimizer'], {'learning_rate': params['learning_rate']}),
+            'metrics': ['accuracy']}
+
+
+class ResultsStore:
+    """SQLite record of every trial (its spec) and every rung it was trained to."""
+
+    def __init__(self, path='search.db'):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS trials (
+                id INTEGER PRIMARY KEY, study TEXT, name TEXT, spec TEXT, params TEXT,
+                created REAL);
+            CREATE TABLE IF NOT EXISTS results (
+                trial_id INTEGER, rung INTEGER, epochs INTEGER, val_loss REAL,
+                val_accuracy REAL, wall_time REAL, PRIMARY KEY (trial_id, rung));
+        ''')
+
+    def close(self):
+        self.db.close()
+
+    def add_trial(self, study, name, spec, params=None):
+        with self.db:
+            cursor = self.db.execute(
+                'INSERT INTO trials (study, name, spec, params, created) VALUES (?, ?, ?, ?, ?)',
+                (study, name, json.dumps(spec), json.dumps(params), time.time()))
+        return cursor.lastrowid
+
+    def trials(self, study):
+        """`[(id, name, spec)]` of `study`, in creation order."""
+        rows = self.db.execute('SELECT id, name, spec FROM trials WHERE study = ? ORDER BY id',
+                               (study,))
+        return [(trial_id, name, json.loads(spec)) for trial_id, name, spec in rows]
+
+    def record(self, trial_id, rung, epochs, val_loss, val_accuracy, wall_time):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                            (trial_id, rung, epochs, val_loss, val_accuracy, wall_time))
+
+    def result(self, trial_id, rung):
+        row = self.db.execute('SELECT epochs, val_loss, val_accuracy, wall_time FROM results '
+                              'WHERE trial_id = ? AND rung = ?', (trial_id, rung)).fetchone()
+        return None if row is None else dict(zip(('epochs', 'val_loss', 'val_accuracy',
+                                                  'wall_time'), row))
+
+    def leaderboard(self, study, limit=10):
+        """Best trials of `study` by their furthest rung, then by val loss."""
+        rows = self.db.execute('''
+            SELECT t.id, t.name, r.rung, r.epochs, r.val_loss, r.val_accuracy, r.wall_time
+            FROM trials t JOIN results r ON r.trial_id = t.id
+            WHERE t.study = ? AND r.rung = (SELECT MAX(rung) FROM results WHERE trial_id = t.id)
+            ORDER BY r.rung DESC, r.val_loss ASC LIMIT ?''', (study, limit))
+        keys = ('trial', 'name', 'rung', 'epochs', 'val loss', 'val acc', 'wall s')
+        return [dict(zip(keys, row)) for row in rows]
+
+
+def _run_trial(trial_id, spec, trial_dir, train_dir, validation_dir, epochs, fit_kwargs):
+    from harness import TrainingHarness, resumable_fit
+    from members import build_from_spec, compile_from_spec
+    from parallel_training import member_datasets
+
+    model = compile_from_spec(build_from_spec(spec, name='trial_%d' % trial_id), spec)
+    train, validation = member_datasets(train_dir, validation_dir)
+    # Survivors carry on from the end of their last rung, not from their best epoch
+    harness = TrainingHarness(trial_dir, patience=None, restore_best_weights=False)
+    start = time.perf_counter()
+    history = resumable_fit(model, train, harness, epochs=epochs, validation_data=validation,
+                            verbose=0, **fit_kwargs).history
+    val_accuracy = history.get('val_accuracy', history.get('val_acc'))
+    return trial_id, {'epochs': epochs, 'val_loss': history['val_loss'][-1],
+                      'val_accuracy': val_accuracy[-1],
+                      'wall_time': time.perf_counter() - start}
+
+
+def successive_halving(study, train_dir, validation_dir, n_trials=27, min_epochs=1,
+                       max_epochs=9, eta=3, steps_per_epoch=100, validation_steps=50,
+                       workers=None, intra_op_threads=None, store_path='search.db',
+                       work_dir='search', seed=0, include_members=False, verbose=1):
+    """Run (or resume) the study `study` and return its leaderboard.
+
+    Trial checkpoints live under `work_dir/<study>/<trial id>` and are deleted
+    as soon as a trial is eliminated.
+    """
+    from image_cache import load_or_build
+    from members import MEMBER_SPECS
+    from parallel_training import configure_threads, default_thread_budget
+
+    store = ResultsStore(store_path)
+    trials = store.trials(study)
+    if not trials:
+        rng = np.random.default_rng(seed)
+        if include_members:
+            for name, spec in MEMBER_SPECS.items():
+                store.add_trial(study, name, spec)
+        for i in range(n_trials):
+            params = sample_params(rng)
+            store.add_trial(study, 'sample_%d' % i, params_to_spec(params), params)
+        trials = store.trials(study)
+
+    load_or_build(train_dir)
+    load_or_build(validation_dir)
+    workers = workers or min(len(trials), os.cpu_count() or 1)
+    intra_op_threads = intra_op_threads or default_thread_budget(workers)
+    fit_kwargs = dict(steps_per_epoch=steps_per_epoch, validation_steps=validation_steps)
+    study_dir = os.path.join(work_dir, study)
+
+    alive = trials
+    rung, epochs = 0, min_epochs
+    reached = {}
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=configure_threads,
+                             initargs=(intra_op_threads, 1)) as pool:
+        while True:
+            start = time.perf_counter()
+            pending = [t for t in alive if store.result(t[0], rung) is None]
+            futures = [pool.submit(_run_trial, trial_id, spec,
+                                   os.path.join(study_dir, str(trial_id)),
+                                   train_dir, validation_dir, epochs, fit_kwargs)
+                       for trial_id, _, spec in pending]
+            for future in as_completed(futures):
+                trial_id, result = future.result()
+                store.record(trial_id, rung, **result)
+            reached.update((trial_id, epochs) for trial_id, _, _ in alive)
+            scores = sorted(alive, key=lambda t: store.result(t[0], rung)['val_loss'])
+            if verbose:
+                best = store.result(scores[0][0], rung)
+                print('rung %d: %d trials x %d epochs in %.0fs, best %s val_loss %.4f '
+                      'val_acc %.4f' % (rung, len(alive), epochs, time.perf_counter() - start,
+                                        scores[0][1], best['val_loss'], best['val_accuracy']))
+            if epochs >= max_epochs or len(alive) <= 1:
+                break
+            alive = scores[:max(1, len(alive) // eta)]
+            for trial_id, _, _ in scores[len(alive):]:
+                shutil.rmtree(os.path.join(study_dir, str(trial_id)), ignore_errors=True)
+            rung, epochs = rung + 1, min(epochs * eta, max_epochs)
+
+    if verbose:
+        print('%d trial epochs in total vs. %d for training every trial to %d epochs' % (
+            sum(reached.values()), len(trials) * max_epochs, max_epochs))
+    leaderboard = store.leaderboard(study)
+    store.close()
+    return leaderboard
@@ -0,0 +1,358 @@
+"""Local HTTP prediction service.
+
+    python serve.py --model ensemble_model.h5 --port 8000
+    curl --data-binary @cat.jpg http://127.0.0.1:8000/predict
+
+The model is loaded (and its graph traced) once at startup, optionally as
+several warm replicas. Uploaded images are decoded off the event loop and put
+on an asyncio queue; one batching task per replica drains the queue into
+batches of up to `--max-batch-size` images, waiting at most `--max-wait-ms`
+for a batch to fill, and runs them in a worker thread.
+
+Before decoding, each upload is looked up in a `prediction_cache.PredictionCache`
+by its content hash and the model's fingerprint, so repeated images are answered
+without touching the model (`--cache-size 0` turns this off, `--cache-db`
+adds a disk tier). Duplicates arriving while the first copy is still being
+computed wait for its result. The model file is polled. When it is replaced, the
+replicas are reloaded in the background and the cache entries of the old
+model are dropped.
+
+Endpoints:
+    POST /predict   raw image bytes -> {"cat": p, "dog": p, "label": "cat"|"dog"}
+                    (400 if the bytes are not a decodable image, 500 on a server fault)
+    GET  /metrics   request count, p50/p95/p99 latency, queue depth, batch sizes, cache stats
+    GET  /healthz   "ok"
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class InvalidImage(ValueError):
+    """The uploaded bytes are not an image we can decode; the client's fault (400)."""
+
+
+def _percentile(samples, q):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class Metrics:
+    """Rolling request latencies and batch sizes."""
+
+    def __init__(self, window=10000):
+        self.requests = 0
+        self.errors = 0
+        self.latencies = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.reloads = 0
+        self.reload_errors = 0
+        self.coalesced = 0
+
+    def snapshot(self, queue_depth):
+        latencies = list(self.latencies)
+        batch_sizes = list(self.batch_sizes)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'queue_depth': queue_depth,
+            'latency_ms': {q: (None if v is None else v * 1e3) for q, v in (
+                ('p50', _percentile(latencies, 0.50)),
+                ('p95', _percentile(latencies, 0.95)),
+                ('p99', _percentile(latencies, 0.99)))},
+            'batches': len(batch_sizes),
+            'mean_batch_size': (sum(batch_sizes) / len(batch_sizes)) if batch_sizes else None,
+            'model_reloads': self.reloads,
+            'model_reload_errors': self.reload_errors,
+            'coalesced_requests': self.coalesced,
+        }
+
+
+class PredictionServer:
+    """Owns the warm engines, the request queue and the batching tasks."""
+
+    def __init__(self, engines, max_batch_size=32, max_wait_ms=5.0, decode_threads=4,
+                 max_body_bytes=20 * 1024 * 1024, cache=None, engine_factory=None,
+                 watch_interval=1.0):
+        self.engines = list(engines)
+        self.cache = cache
+        # Called with no arguments to load a fresh replica when the model file changes
+        self.engine_factory = engine_factory
+        self.watch_interval = watch_interval
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.
+        self.max_body_bytes = max_body_bytes
+        self.metrics = Metrics()
+        self.queue = None
+        self._decode_pool = ThreadPoolExecutor(decode_threads, thread_name_prefix='decode')
+        # One thread per replica so replicas really run side by side
+        self._model_pool = ThreadPoolExecutor(len(self.engines), thread_name_prefix='model')
+        self._tasks = []
+        # (model fingerprint, content key) -> future of a cache miss being computed, so
+        # duplicates arriving together (retries, double submits) share one forward pass
+        self._pending = {}
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._batch_loop(i)) for i in range(len(self.engines))]
+        if self.engine_factory is not None:
+            from prediction_cache import ModelWatcher
+
+            # Built now, from what the engine really loaded, so a replacement landing
+            # before the task first runs is still seen
+            engine = self.engines[0]
+            watcher = ModelWatcher(engine.model_path, engine.fingerprint, self.watch_interval,
+                                   engine.signature)
+            self._tasks.append(asyncio.create_task(self._watch_loop(watcher)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._decode_pool.shutdown()
+        self._model_pool.shutdown()
+
+    async def predict(self, data):
+        if self.cache is None:
+            return (await self._compute(data))[0]
+        loop = asyncio.get_running_loop()
+        # Hashing a large upload and reading SQLite would stall every other connection
+        key, dog = await loop.run_in_executor(self._decode_pool, self._lookup, data,
+                                              self.engines[0].fingerprint)
+        if dog is not None:
+            return dog
+        pending = (self.engines[0].fingerprint, key)
+        if pending in self._pending:
+            self.metrics.coalesced += 1
+            return (await asyncio.shield(self._pending[pending]))[0]
+        start = time.perf_counter()
+        task = self._pending[pending] = asyncio.ensure_future(self._compute(data))
+        try:
+            dog, fingerprint = await asyncio.shield(task)
+        finally:
+            del self._pending[pending]
+        # Keyed by the model that really ran, even if a reload happened meanwhile
+        await loop.run_in_executor(self._decode_pool, self.cache.put, fingerprint, key, dog,
+                                   time.perf_counter() - start)
+        return dog
+
+    def _lookup(self, data, fingerprint):
+        key = self.cache.key(data)
+        return key, self.cache.get(fingerprint, key)
+
+    async def _compute(self, data):
+        import tensorflow as tf
+
+        from inference import decode_images
+
+        loop = asyncio.get_running_loop()
+        try:
+            image = await loop.run_in_executor(self._decode_pool, decode_images, [data])
+        except (tf.errors.InvalidArgumentError, ValueError) as e:
+            message = e.message if isinstance(e, tf.errors.OpError) else str(e)
+            # Drop TensorFlow's '{{function_node ...}}' prefix and ' [Op:...]' suffix
+            message = message.split('}} ')[-1].split(' [Op:')[0].strip()
+            raise InvalidImage('could not decode the image: %s' % (
+                message.splitlines() or ['unknown format'])[0]) from e
+        future = loop.create_future()
+        await self.queue.put((image, future))
+        return await future
+
+    async def _watch_loop(self, watcher):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            if await loop.run_in_executor(None, watcher.poll) is None:
+                continue
+            print('%s changed, reloading %d replica(s)' % (watcher.path, len(self.engines)))
+            try:
+                engines = await loop.run_in_executor(None, self._load_engines, len(self.engines))
+            except Exception as e:
+                # E.g. a copy still being written; the watcher offers it again next poll
+                self.metrics.reload_errors += 1
+                print('could not load %s, keeping the current model: %s' % (
+                    watcher.path, str(e).splitlines()[0] if str(e) else type(e).__name__))
+                continue
+            old, self.engines = self.engines, engines
+            for engine in old:
+                engine.close()
+            watcher.accept(self.engines[0].fingerprint)
+            self.metrics.reloads += 1
+            if self.cache is not None:
+                dropped = self.cache.invalidate(self.engines[0].fingerprint)
+                print('dropped %d cached predictions of the old model' % dropped)
+
+    def _load_engines(self, count):
+        engines = []
+        try:
+            for _ in range(count):
+                engines.append(self.engine_factory())
+        except BaseException:
+            for engine in engines:
+                engine.close()
+            raise
+        return engines
+
+    async def _batch_loop(self, replica):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            images = np.concatenate([image for image, _ in batch])
+            self.metrics.batch_sizes.append(len(batch))
+            engine = self.engines[replica]
+            try:
+                probabilities = await loop.run_in_executor(self._model_pool, engine.predict, images)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), p in zip(batch, probabilities):
+                if not future.done():
+                    future.set_result((float(p), engine.fingerprint))
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > self.max_body_bytes:
+                    await self._respond(writer, 413, {'error': 'image too large'}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self._route(method, path.split('?')[0], body)
+                close = headers.get('connection', '').lower() == 'close'
+                await self._respond(writer, status, payload, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        if path == '/healthz':
+            return 200, 'ok'
+        if path == '/metrics':
+            metrics = self.metrics.snapshot(self.queue.qsize())
+            metrics['model'] = self.engines[0].fingerprint[:12]
+            if self.cache is not None:
+                metrics['cache'] = self.cache.stats()
+            return 200, metrics
+        if path != '/predict':
+            return 404, {'error': 'not found'}
+        if method != 'POST':
+            return 405, {'error': 'POST an image to /predict'}
+        if not body:
+            return 400, {'error': 'empty body'}
+
+        start = time.perf_counter()
+        self.metrics.requests += 1
+        try:
+            dog = await self.predict(body)
+        except InvalidImage as e:
+            self.metrics.errors += 1
+            return 400, {'error': str(e)}
+        except Exception as e:
+            # Anything else is a fault on our side (model, threads, disk), not bad input
+            self.metrics.errors += 1
+            return 500, {'error': str(e).splitlines()[0] if str(e) else type(e).__name__}
+        self.metrics.latencies.append(time.perf_counter() - start)
+        return 200, {'cat': 1. - dog, 'dog': dog, 'label': 'dog' if dog >= 0.5 else 'cat'}
+
+    async def _respond(self, writer, status, payload, close=False):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain'
+        else:
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+        writer.write(('HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n%s\r\n' % (
+            status, _REASONS[status], content_type, len(body),
+            'Connection: close\r\n' if close else '')).encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(server, host='127.0.0.1', port=8000):
+    await server.start()
+    listener = await asyncio.start_server(server.handle, host, port)
+    print('Serving on http://%s:%d (%d replica(s))' % (host, port, len(server.engines)))
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve cat/dog predictions over local HTTP.')
+    parser.add_argument('--model', default='ensemble_model.h5',
+                        help='saved ensemble_model.h5 or any saved model_*')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--replicas', type=int, default=1,
+                        help='number of warm model copies serving batches in parallel')
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--decode-threads', type=int, default=4)
+    parser.add_argument('--cache-size', type=int, default=10000,
+                        help='predictions kept in memory, by image content hash; 0 disables')
+    parser.add_argument('--cache-db', default=None,
+                        help='also keep predictions in this SQLite file, across restarts')
+    parser.add_argument('--watch-interval', type=float, default=1.0,
+                        help='seconds between checks for a replaced model file')
+    args = parser.parse_args(argv)
+
+    from inference import InferenceEngine
+    from prediction_cache import PredictionCache
+
+    def load_engine():
+        return InferenceEngine(args.model, max_batch_size=args.max_batch_size)
+
+    cache = None
+    if args.cache_size > 0:
+        cache = PredictionCache(args.cache_size, args.cache_db)
+    server = PredictionServer([load_engine() for _ in range(args.replicas)], args.max_batch_size,
+                              args.max_wait_ms, args.decode_threads, cache=cache,
+                              engine_factory=load_engine, watch_interval=args.watch_interval)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for engine in server.engines:
+            engine.close()
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Sharded TFRecord storage for labelled image sets of any size (e.g. all 25,000 Kaggle images).
+
+    write_shards('/data/dogs-vs-cats/train', '/data/shards', validation_split=0.2)
+    train, validation = load_shards('/data/shards')
+    model.fit(train.dataset(20), steps_per_epoch=len(train) // 20, ...)
+
+The source is either a directory with one subdirectory per class (like
+cats_and_dogs_filtered/train) or the flat Kaggle layout, where the class is the
+file name up to the first dot (`cat.123.jpg`). The split is drawn per class
+with a fixed seed, so both sides keep the class balance. Each split is then
+shuffled across its shards, so every shard holds both classes.
+
+Each record is a `tf.train.Example` holding the encoded image and its
+integer label. With `encoding='jpeg'` (the default) every image is decoded,
+resized to 150x150 exactly as the input pipeline does, and stored again as a
+JPEG. The records are then a fraction of the size of the originals and cheap
+to decode. `encoding='original'` keeps the source bytes untouched. Shards
+are written in parallel worker processes, each to a temporary name that is
+renamed when complete. `manifest.json` is written last.
+
+`ShardedSplit.dataset` reads `num_readers` shards at once with `interleave`
+and shuffles through a bounded buffer of still-encoded records, so memory
+stays flat however large the set is. Its batches have the same contract as
+`image_cache.ImageCache` and `zip_reader.ZipSplit`, so the training code
+takes any of them.
+"""
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_pipeline import IMAGE_EXTENSIONS, IMAGE_SIZE
+
+MANIFEST = 'manifest.json'
+ENCODINGS = ('jpeg', 'original')
+
+
+def list_labelled_images(source):
+    """`(paths, labels, class_names)` of `source`, in class-folder or flat Kaggle layout."""
+    from data_pipeline import list_image_files
+
+    if all(os.path.isdir(os.path.join(source, d)) for d in ('train', 'validation')):
+        raise ValueError('%r holds splits, not classes; point at one split (e.g. %s) '
+                         'or at a folder of all images' % (source, os.path.join(source, 'train')))
+    if any(os.path.isdir(os.path.join(source, d)) for d in os.listdir(source)):
+        return list_image_files(source)
+    names = sorted(f for f in os.listdir(source) if f.lower().endswith(IMAGE_EXTENSIONS))
+    class_names = sorted({name.split('.', 1)[0] for name in names})
+    if len(class_names) != 2:
+        raise ValueError('expected file names of two classes (e.g. cat.1.jpg, dog.1.jpg) in '
+                         '%r, found %r' % (source, class_names))
+    labels = [class_names.index(name.split('.', 1)[0]) for name in names]
+    return [os.path.join(source, name) for name in names], labels, class_names
+
+
+def split_indices(labels, validation_split=0.2, seed=0):
+    """Per-class random `(train, validation)` index arrays, each shuffled."""
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    train, validation = [], []
+    for label in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == label))
+        n_validation = int(round(validation_split * len(indices)))
+        validation.append(indices[:n_validation])
+        train.append(indices[n_validation:])
+    return rng.permutation(np.concatenate(train)), rng.permutation(np.concatenate(validation))
+
+
+def _write_shard(path, files, labels, encoding, target_size, quality, compression):
+    import tensorflow as tf
+
+    from data_pipeline import decode_image_bytes
+
+    tmp = path + '.tmp'
+    with tf.io.TFRecordWriter(tmp, tf.io.TFRecordOptions(compression_type=compression)) as w:
+        for file, label in zip(files, labels):
+            with open(file, 'rb') as f:
+                data = f.read()
+            if encoding == 'jpeg':
+                data = tf.io.encode_jpeg(decode_image_bytes(data, target_size),
+                                         quality=quality).numpy()
+            example = tf.train.Example(features=tf.train.Features(feature={
+                'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[data])),
+                'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[int(label)])),
+            }))
+            w.write(example.SerializeToString())
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def write_shards(source, out_dir, validation_split=0.2, images_per_shard=1000,
+                 encoding='jpeg', compression='', quality=95, target_size=IMAGE_SIZE, seed=0,
+                 workers=None, verbose=1):
+    """Convert the labelled images under `source` into `out_dir/<split>-NNNNN-of-NNNNN.tfrecord`.
+
+    `compression` is '' , 'GZIP' or 'ZLIB'. JPEG records barely shrink
+    further, so it mainly pays off with `encoding='original'` on PNG/BMP
+    sources. Returns the manifest.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError('encoding must be one of %r, got %r' % (ENCODINGS, encoding))
+    paths, labels, class_names = list_labelled_images(source)
+    train, validation = split_indices(labels, validation_split, seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    jobs, splits = [], {}
+    for split, indices in (('train', train), ('validation', validation)):
+        num_shards = max(1, -(-len(indices) // images_per_shard))
+        names = ['%s-%05d-of-%05d.tfrecord' % (split, i, num_shards) for i in range(num_shards)]
+        for name, chunk in zip(names, np.array_split(indices, num_shards)):
+            jobs.append((os.path.join(out_dir, name), [paths[i] for i in chunk],
+                         [labels[i] for i in chunk]))
+        splits[split] = {'shards': names, 'count': len(indices),
+                         'class_counts': np.bincount(np.asarray(labels, int)[indices],
+                                                     minlength=len(class_names)).tolist()}
+
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(_write_shard, path, files, shard_labels, encoding,
+                               tuple(target_size), quality, compression)
+                   for path, files, shard_labels in jobs]
+        total_bytes = 0
+        for i, future in enumerate(futures):
+            total_bytes += future.result()
+            if verbose:
+                print('\rwrote %d/%d shards' % (i + 1, len(jobs)), end='', flush=True)
+    if verbose:
+        print(' (%d images, %.1f MB)' % (len(paths), total_bytes / 2 ** 20))
+
+    manifest = {'source': os.path.abspath(source), 'class_names': class_names,
+                'encoding': encoding, 'compression': compression, 'quality': quality,
+                'target_size': list(target_size), 'validation_split': validation_split,
+                'seed': seed, 'splits': splits}
+    with open(os.path.join(out_dir, MANIFEST + '.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(out_dir, MANIFEST + '.tmp'), os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+class ShardedSplit:
+    """One split of a sharded store, streamed with bounded memory."""
+
+    def __init__(self, directory, name, manifest):
+        self.directory = directory
+        self.name = name
+        self.shards = [os.path.join(directory, s) for s in manifest['splits'][name]['shards']]
+        self.count = manifest['splits'][name]['count']
+        self.class_names = manifest['class_names']
+        self.compression = manifest['compression']
+
+    def __len__(self):
+        return self.count
+
+    def dataset(self, batch_size=20, shuffle=True, seed=None, repeat=True,
+                num_readers=4, shuffle_buffer=2048, target_size=IMAGE_SIZE,
+                deterministic=False):
+        """Batched float32 `[0, 1]` dataset with the flow_from_directory contract.
+
+        `num_readers` shards are read concurrently. With `shuffle` the shard
+        order is reshuffled every epoch and records are mixed through a
+        `shuffle_buffer`-record buffer (encoded, a few KB each).
+        """
+        import tensorflow as tf
+
+        from data_pipeline import AUTOTUNE, decode_image_bytes, rescale
+
+        features = {'image': tf.io.FixedLenFeature([], tf.string),
+                    'label': tf.io.FixedLenFeature([], tf.int64)}
+
+        def parse(record):
+            example = tf.io.parse_single_example(record, features)
+            return (decode_image_bytes(example['image'], target_size),
+                    tf.cast(example['label'], tf.float32))
+
+        files = tf.data.Dataset.from_tensor_slices(self.shards)
+        if shuffle:
+            files = files.shuffle(len(self.shards), seed=seed, reshuffle_each_iteration=True)
+        ds = files.interleave(
+            lambda path: tf.data.TFRecordDataset(path, compression_type=self.compression,
+                                                 buffer_size=1 << 20),
+            cycle_length=min(num_readers, len(self.shards)), num_parallel_calls=AUTOTUNE,
+            deterministic=deterministic)
+        if shuffle:
+            ds = ds.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+        ds = ds.map(parse, num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+        ds = ds.batch(batch_size)
+        ds = ds.map(rescale, num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+        if repeat:
+            ds = ds.repeat()
+        return ds.prefetch(AUTOTUNE)
+
+
+def load_shards(directory):
+    """`(train, validation)` `ShardedSplit`s of a store written by `write_shards`."""
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    return ShardedSplit(directory, 'train', manifest), ShardedSplit(directory, 'validation',
+                                                                    manifest)
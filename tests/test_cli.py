@@ -0,0 +1,30 @@
+"""Command line parsing and dispatch, with every heavy step stubbed out."""
+
+import project_for_nsdcwinter2024 as cli
+
+
+def test_all_parses_download_args():
+    args = cli.build_parser().parse_args(['all'])
+    assert args.func is cli._cmd_all
+    assert args.no_extract is False
+    assert cli.build_parser().parse_args(['all', '--no-extract']).no_extract is True
+
+
+def test_all_dispatches_every_step(monkeypatch):
+    calls = []
+
+    def record(name, result=None):
+        def step(*args, **kwargs):
+            calls.append(name)
+            return result
+        return step
+
+    monkeypatch.setattr(cli, 'download_dataset', record('download'))
+    monkeypatch.setattr(cli, 'explore_dataset', record('explore'))
+    monkeypatch.setattr(cli, '_cmd_train', record('train', ({'jordan': None}, None, {})))
+    monkeypatch.setattr(cli, 'visualize_intermediate', record('visualize'))
+    monkeypatch.setattr(cli, 'plot_histories', record('plot'))
+    monkeypatch.setattr(cli, 'export_diagrams', record('diagrams'))
+
+    cli.main(['all', '--no-extract'])
+    assert calls == ['download', 'explore', 'train', 'visualize', 'plot', 'diagrams']
@@ -0,0 +1,33 @@
+"""Checkpoint resume of TrainingHarness on a tiny model."""
+
+import numpy as np
+from tensorflow import keras
+
+from harness import TrainingHarness, resumable_fit
+
+
+def _model():
+    model = keras.Sequential([keras.Input((1,)), keras.layers.Dense(1, activation='sigmoid')])
+    model.compile(loss='binary_crossentropy', optimizer='rmsprop')
+    return model
+
+
+def _fit(directory, epochs, key):
+    x = np.linspace(0, 1, 32, dtype=np.float32)[:, None]
+    harness = TrainingHarness(str(directory), monitor='loss', patience=None, key=key)
+    resumable_fit(_model(), x, harness, y=(x > 0.5).astype(np.float32), epochs=epochs,
+                  verbose=0)
+    return harness
+
+
+def test_resumes_under_the_same_key(tmp_path):
+    _fit(tmp_path, 2, {'evan': [2, 1]})
+    harness = _fit(tmp_path, 3, {'evan': [2, 1]})
+    assert harness.resumed_from == 2 and harness.completed == 3
+
+
+def test_starts_over_when_the_key_changes(tmp_path):
+    _fit(tmp_path, 2, {'evan': [2, 1]})
+    harness = _fit(tmp_path, 3, {'evan': [4, 3]})
+    assert harness.resumed_from == 0 and harness.completed == 3
+    assert len(harness.history['loss']) == 3
@@ -0,0 +1,62 @@
+"""Hot reload and cache invalidation of the prediction server, with stub engines."""
+
+import asyncio
+import os
+
+from prediction_cache import PredictionCache, file_fingerprint, file_signature
+from serve import PredictionServer
+
+
+class _Engine:
+    """Stands in for InferenceEngine; refuses files that are not a finished 'model'."""
+
+    def __init__(self, path):
+        self.signature = file_signature(path)
+        with open(path, 'rb') as f:
+            if not f.read().endswith(b'END'):
+                raise OSError('truncated model file')
+        self.model_path = path
+        self.fingerprint = file_fingerprint(path)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _replace(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+async def _until(condition):
+    while not condition():
+        await asyncio.sleep(0.01)
+
+
+def test_reload_survives_a_half_written_model(tmp_path):
+    path = str(tmp_path / 'ensemble_model.h5')
+    _replace(path, b'old END')
+    old = _Engine(path)
+    cache = PredictionCache(10)
+    cache.put(old.fingerprint, 'image', 0.25)
+
+    async def run():
+        server = PredictionServer([old], cache=cache, engine_factory=lambda: _Engine(path),
+                                  watch_interval=0.01)
+        await server.start()
+        try:
+            _replace(path, b'new, half writ')
+            await asyncio.wait_for(_until(lambda: server.metrics.reload_errors), 10)
+            assert server.engines == [old] and cache.stats()['entries'] == 1
+            _replace(path, b'new, complete END')
+            await asyncio.wait_for(_until(lambda: server.metrics.reloads), 10)
+            return server
+        finally:
+            await server.stop()
+
+    server = asyncio.run(run())
+    assert old.closed
+    assert server.engines[0].fingerprint == file_fingerprint(path)
+    assert cache.stats()['entries'] == 0
+    assert cache.get(old.fingerprint, 'image') is None
@@ -0,0 +1,50 @@
+"""HTTP status codes of the prediction server, with stub engines."""
+
+import asyncio
+
+import numpy as np
+
+from serve import PredictionServer
+
+
+class _Engine:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.fingerprint = 'stub'
+
+    def predict(self, images):
+        if self.fail:
+            raise RuntimeError('model exploded')
+        return np.full(len(images), 0.75, np.float32)
+
+
+def _post(engine, body):
+    async def run():
+        server = PredictionServer([engine])
+        await server.start()
+        try:
+            return await server._route('POST', '/predict', body)
+        finally:
+            await server.stop()
+    return asyncio.run(run())
+
+
+def _jpeg():
+    import tensorflow as tf
+
+    return tf.io.encode_jpeg(np.zeros((20, 20, 3), np.uint8)).numpy()
+
+
+def test_prediction():
+    status, payload = _post(_Engine(), _jpeg())
+    assert status == 200 and payload['label'] == 'dog'
+
+
+def test_undecodable_upload_is_a_client_error():
+    status, payload = _post(_Engine(), b'not an image')
+    assert status == 400 and payload['error'].startswith('could not decode the image')
+
+
+def test_model_failure_is_a_server_error():
+    status, payload = _post(_Engine(fail=True), _jpeg())
+    assert status == 500 and payload['error'] == 'model exploded'
@@ -0,0 +1,121 @@
+"""Stream images straight out of cats_and_dogs_filtered.zip, no extraction.
+
+`ZipImageArchive` reads the archive's central directory once and records, for
+every image, where its bytes start, how big they are, whether they are stored
+or deflated, and its split and class label (from the
+`<root>/<split>/<class>/<file>` path). Reads are a single positional
+`os.pread` of the member's bytes plus, for deflated members, one `zlib`
+call; both release the GIL, so the tf.data readers running `num_readers`
+at a time really do work in parallel on one shared file descriptor.
+
+`archive.split('train')` has the same `dataset(...)` method as an
+`image_cache.ImageCache`, so training code can take either.
+"""
+
+import os
+import struct
+import zipfile
+import zlib
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import AUTOTUNE, IMAGE_EXTENSIONS, IMAGE_SIZE, decode_image_bytes, rescale
+
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_LOCAL_HEADER_MAGIC = b'PK\x03\x04'
+
+
+class ZipSplit:
+    """The images of one split (`train`, `validation`) inside a `ZipImageArchive`."""
+
+    def __init__(self, archive, name, indices, labels, class_names):
+        self.archive = archive
+        self.name = name
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.labels = np.asarray(labels, dtype=np.float32)
+        self.class_names = class_names
+
+    def __len__(self):
+        return len(self.indices)
+
+    def dataset(self, batch_size=20, shuffle=True, seed=None, repeat=True,
+                num_readers=AUTOTUNE, target_size=IMAGE_SIZE, deterministic=False):
+        """Batched float32 `[0, 1]` dataset with the flow_from_directory contract."""
+        read = self.archive.read
+
+        def load(index, label):
+            data = tf.numpy_function(lambda i: read(int(i)), [index], tf.string, stateful=False)
+            return decode_image_bytes(data, target_size), label
+
+        ds = tf.data.Dataset.from_tensor_slices((self.indices, self.labels))
+        if shuffle:
+            ds = ds.shuffle(len(self), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.map(load, num_parallel_calls=num_readers, deterministic=deterministic)
+        ds = ds.batch(batch_size)
+        ds = ds.map(rescale, num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+        if repeat:
+            ds = ds.repeat()
+        return ds.prefetch(AUTOTUNE)
+
+
+class ZipImageArchive:
+    """Index of the images in a zip archive, read in place."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY)
+        self.names, self._offsets, self._sizes, self._deflated = [], [], [], []
+        by_split = {}
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                parts = info.filename.split('/')
+                if info.is_dir() or len(parts) < 3 or not parts[-1].lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                    raise ValueError('%s: unsupported compression %d' % (info.filename, info.compress_type))
+                split, class_name = parts[-3], parts[-2]
+                by_split.setdefault(split, []).append((info.filename, class_name, len(self.names)))
+                self.names.append(info.filename)
+                self._offsets.append(self._data_offset(info))
+                self._sizes.append((info.compress_size, info.file_size))
+                self._deflated.append(info.compress_type == zipfile.ZIP_DEFLATED)
+
+        self.splits = {}
+        for split, entries in by_split.items():
+            class_names = sorted({class_name for _, class_name, _ in entries})
+            entries.sort()
+            self.splits[split] = ZipSplit(
+                self, split, [index for _, _, index in entries],
+                [class_names.index(class_name) for _, class_name, _ in entries], class_names)
+
+    def _data_offset(self, info):
+        # The central directory only knows where the local header starts; the
+        # data follows that header's variable-length name and extra fields.
+        header = os.pread(self._fd, _LOCAL_HEADER.size, info.header_offset)
+        fields = _LOCAL_HEADER.unpack(header)
+        if fields[0] != _LOCAL_HEADER_MAGIC:
+            raise zipfile.BadZipFile('bad local header for %s' % info.filename)
+        return info.header_offset + _LOCAL_HEADER.size + fields[9] + fields[10]
+
+    def split(self, name):
+        return self.splits[name]
+
+    def read(self, index):
+        """Uncompressed bytes of member `index`."""
+        compress_size, file_size = self._sizes[index]
+        data = os.pread(self._fd, compress_size, self._offsets[index])
+        if self._deflated[index]:
+            data = zlib.decompress(data, -zlib.MAX_WBITS, file_size)
+        return data
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()